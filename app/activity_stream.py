@@ -0,0 +1,251 @@
+# ====== activity_stream.py ======
+# جدول activity_event الموحد لصفحة الأحداث ولوحة التحكم
+# كل سجل طلبية أو عامل وكل مصروف أو نقل جديد يُضاف له حدث بنوع (kind) محدد عند الكتابة نفسها
+# (في نفس المعاملة)، فالقراءة استعلام واحد على فهرس (timestamp, id) مع الفلاتر في SQL
+# بدل أربعة استعلامات ودمجها وتصنيف change_type بالنص عند كل عرض
+from sqlalchemy import event, insert, func, case
+from sqlalchemy.orm import Session
+from models import db, ActivityEvent, OrderHistory, WorkerHistory, Expense, Transport, now_utc
+
+KINDS = ('order', 'payment', 'transport', 'expense', 'worker', 'debt')
+
+# دوال تُستدعى بالأحداث الجديدة بعد تثبيتها (مثل لقطة لوحة التحكم)
+_SUBSCRIBERS = []
+
+
+def on_events_committed(func_):
+    """تسجيل دالة تستقبل قائمة الأحداث (قواميس) بعد كل commit يضيف أحداثاً"""
+    _SUBSCRIBERS.append(func_)
+    return func_
+
+
+# ========================
+# تحويل السجلات إلى أحداث
+# ========================
+def classify_order_change(change_type):
+    """نوع الحدث من نص change_type لسجل الطلبية (يُحسب مرة واحدة عند الكتابة)"""
+    change_type = change_type or ''
+    if 'دفع' in change_type:
+        return 'payment'
+    if 'نقل' in change_type:
+        return 'transport'
+    if 'مصروف' in change_type:
+        return 'expense'
+    if 'عامل' in change_type or 'تعيين' in change_type:
+        return 'worker'
+    return 'order'
+
+
+def order_history_event(values, source_id):
+    return {
+        'timestamp': values.get('timestamp') or now_utc(),
+        'kind': classify_order_change(values.get('change_type')),
+        'action': values.get('change_type'),
+        'details': values.get('details'),
+        'amount': 0.0,
+        'user': values.get('user') or 'النظام',
+        'order_id': values.get('order_id'),
+        'entity_type': 'order',
+        'entity_id': values.get('order_id'),
+        'source': 'order_history',
+        'source_id': source_id,
+    }
+
+
+def worker_history_event(values, source_id):
+    return {
+        'timestamp': values.get('timestamp') or now_utc(),
+        'kind': 'worker',
+        'action': values.get('change_type'),
+        'details': values.get('details'),
+        'amount': values.get('amount') or 0.0,
+        'user': values.get('user') or 'النظام',
+        'order_id': None,
+        'entity_type': 'worker',
+        'entity_id': values.get('worker_id'),
+        'source': 'worker_history',
+        'source_id': source_id,
+    }
+
+
+def _expense_event(expense):
+    return {
+        'timestamp': expense.created_at or now_utc(),
+        'kind': 'expense',
+        'action': 'مصروف جديد',
+        'details': f"{expense.description} - {expense.total_amount} دج",
+        'amount': expense.total_amount or 0.0,
+        'user': expense.recorded_by,
+        'order_id': expense.order_id,
+        'entity_type': 'expense',
+        'entity_id': expense.id,
+        'source': 'expense',
+        'source_id': expense.id,
+    }
+
+
+def _transport_event(transport):
+    return {
+        'timestamp': transport.created_at or now_utc(),
+        'kind': 'transport',
+        'action': 'نقل جديد',
+        'details': f"{transport.purpose} - {transport.transport_amount} دج",
+        'amount': transport.transport_amount or 0.0,
+        'user': transport.recorded_by,
+        'order_id': transport.order_id,
+        'entity_type': 'transport',
+        'entity_id': transport.id,
+        'source': 'transport',
+        'source_id': transport.id,
+    }
+
+
+def _columns(obj, *names):
+    return {name: getattr(obj, name) for name in names}
+
+
+def _event_for(obj):
+    if isinstance(obj, OrderHistory):
+        return order_history_event(_columns(obj, 'timestamp', 'change_type', 'details', 'user', 'order_id'), obj.id)
+    if isinstance(obj, WorkerHistory):
+        return worker_history_event(_columns(obj, 'timestamp', 'change_type', 'details', 'user', 'amount', 'worker_id'), obj.id)
+    if isinstance(obj, Expense):
+        return _expense_event(obj)
+    if isinstance(obj, Transport):
+        return _transport_event(obj)
+    return None
+
+
+# ========================
+# الكتابة
+# ========================
+def insert_events(connection, rows):
+    """إدراج أحداث على اتصال في معاملة مفتوحة (INSERT واحد) مع تعبئة id في كل قاموس"""
+    if not rows:
+        return
+    statement = insert(ActivityEvent).returning(ActivityEvent.id, sort_by_parameter_order=True)
+    ids = connection.execute(statement, rows).scalars().all()
+    for row, event_id in zip(rows, ids):
+        row['id'] = event_id
+
+
+def publish_events(events):
+    """تمرير أحداث مثبّتة إلى المشتركين"""
+    if not events:
+        return
+    for subscriber in _SUBSCRIBERS:
+        try:
+            subscriber(events)
+        except Exception as e:
+            print(f"❌ خطأ في نشر الأحداث الجديدة: {e}")
+
+
+def add_events(session, rows):
+    """إدراج أحداث في معاملة الجلسة الحالية، وتُنشر للمشتركين بعد الـ commit"""
+    if not rows:
+        return
+    insert_events(session.connection(), rows)
+    session.info.setdefault('activity_events', []).extend(rows)
+
+
+def _derived_entity(obj):
+    """(النوع، المعرف) للمصروف أو النقل الذي اشتُق منه سجل الطلبية في audit، أو None"""
+    derived = getattr(obj, '_activity_entity', None)
+    if derived is None:
+        return None
+    entity_type, entity = derived
+    return entity_type, getattr(entity, 'id', entity)
+
+
+@event.listens_for(Session, "after_flush")
+def _write_events_after_flush(session, flush_context):
+    """حدث لكل سجل أو مصروف أو نقل أُضيف في هذا الـ flush (المعرفات معروفة الآن)
+
+    سجل الطلبية الذي يكتبه audit عن مصروف أو نقل أُضيف في نفس المعاملة لا يُنتج حدثاً ثانياً:
+    حدث الكيان نفسه يغطي نفس العملية.
+    """
+    emitted = session.info.setdefault('activity_entities', set())
+    rows = []
+    derived = []
+    for obj in session.new:
+        if isinstance(obj, OrderHistory) and _derived_entity(obj) is not None:
+            derived.append(obj)
+            continue
+        row = _event_for(obj)
+        if row is None:
+            continue
+        rows.append(row)
+        if row['source'] in ('expense', 'transport'):
+            emitted.add((row['source'], row['source_id']))
+
+    rows.extend(_event_for(obj) for obj in derived if _derived_entity(obj) not in emitted)
+    add_events(session, rows)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session):
+    session.info.pop('activity_entities', None)
+    publish_events(session.info.pop('activity_events', None))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_events(session):
+    session.info.pop('activity_entities', None)
+    session.info.pop('activity_events', None)
+
+
+# ========================
+# القراءة
+# ========================
+def event_dict(activity):
+    """حدث كقاموس عادي لا يرتبط بجلسة (للقوالب و JSON والذاكرة المؤقتة)"""
+    return {
+        'id': activity.id,
+        'timestamp': activity.timestamp,
+        'kind': activity.kind,
+        'action': activity.action,
+        'details': activity.details,
+        'amount': activity.amount,
+        'user': activity.user,
+        'order_id': activity.order_id,
+        'entity_type': activity.entity_type,
+        'entity_id': activity.entity_id,
+    }
+
+
+def activity_filters(kind=None, user=None, since=None, until=None, order_id=None):
+    """شروط WHERE للفلاتر - كل منها يطابق بداية أحد فهارس activity_event"""
+    filters = []
+    if kind and kind != 'all':
+        filters.append(ActivityEvent.kind == kind)
+    if user and user != 'all':
+        filters.append(ActivityEvent.user == user)
+    if since is not None:
+        filters.append(ActivityEvent.timestamp >= since)
+    if until is not None:
+        filters.append(ActivityEvent.timestamp < until)
+    if order_id:
+        filters.append(ActivityEvent.order_id == order_id)
+    return filters
+
+
+def activity_query(**criteria):
+    return ActivityEvent.query.filter(*activity_filters(**criteria))
+
+
+def recent_events(limit, **criteria):
+    """آخر limit حدث (مسح واحد للفهرس بترتيب عكسي)"""
+    rows = activity_query(**criteria)\
+        .order_by(ActivityEvent.timestamp.desc(), ActivityEvent.id.desc())\
+        .limit(limit).all()
+    return [event_dict(row) for row in rows]
+
+
+def activity_stats(filters, today_start):
+    """العدد الكلي وأحداث اليوم وأحداث الطلبيات للفلاتر الحالية في استعلام واحد"""
+    total, today, orders = db.session.query(
+        func.count(ActivityEvent.id),
+        func.coalesce(func.sum(case((ActivityEvent.timestamp >= today_start, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((ActivityEvent.kind == 'order', 1), else_=0)), 0),
+    ).filter(*filters).one()
+    return {'total_count': total, 'today_count': today, 'orders_count': orders}
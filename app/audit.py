@@ -0,0 +1,269 @@
+# ====== audit.py ======
+# سجل النشاط (order_history و worker_history) ضمن معاملة المستدعي
+# السجل يُضاف إلى الجلسة الحالية ويُثبّت مع commit العملية نفسها (بدون commit إضافي لكل سجل)،
+# ورقم الطلبية يؤخذ من الكائن نفسه أو من خريطة هوية الجلسة بدل استعلام إضافي.
+# الأحداث منخفضة الأولوية (معاينة مرفق، عرض تفاصيل...) لا ترتبط بعملية كتابة، فتُجمع في ذاكرة
+# العملية ويُدرجها خيط خلفي دفعة واحدة كل AUDIT_FLUSH_INTERVAL ثانية أو عند امتلاء المخزن
+import atexit
+import threading
+from flask import current_app, has_app_context
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from models import db, Order, Expense, Transport, Worker, OrderHistory, WorkerHistory, now_utc
+from activity_stream import insert_events, publish_events, order_history_event, worker_history_event
+
+PRIORITY_NORMAL = 'normal'
+PRIORITY_LOW = 'low'
+DEFAULT_FLUSH_INTERVAL = 5
+DEFAULT_BUFFER_SIZE = 200
+MAX_BUFFER_SIZE = 10000   # حد أعلى عند تعذر الإدراج حتى لا تنمو الذاكرة بلا حد
+
+# الأحداث المرتبطة بطلبية لنوع كيان غير الطلبية نفسها: النوع -> (النموذج، نوع التغيير في السجل)
+ORDER_LINKED = {
+    'expense': (Expense, "مصروف"),
+    'transport': (Transport, "نقل"),
+}
+
+_BUFFER = []
+_BUFFER_LOCK = threading.Lock()
+_FLUSHER = {}
+
+
+# ========================
+# بناء السجلات
+# ========================
+def _related_order_id(model, entity_id):
+    """رقم الطلبية المرتبطة من الكائن المحمّل في الجلسة، واستعلام عمود واحد فقط إن لم يكن محمّلاً"""
+    entity = db.session.identity_map.get(db.session.identity_key(model, entity_id))
+    if entity is not None:
+        return entity.order_id
+    return db.session.execute(select(model.order_id).where(model.id == entity_id)).scalar()
+
+
+def _entity_exists(model, entity_id):
+    """وجود الكيان من خريطة هوية الجلسة، أو استعلام على المفتاح فقط"""
+    if db.session.identity_map.get(db.session.identity_key(model, entity_id)) is not None:
+        return True
+    return db.session.execute(select(model.id).where(model.id == entity_id)).first() is not None
+
+
+def _entity_reference(entity):
+    """(نوع الكيان، معرفه، الكائن) من كائن نموذج"""
+    for entity_type, model in (('order', Order), ('expense', Expense), ('transport', Transport), ('worker', Worker)):
+        if isinstance(entity, model):
+            return entity_type, entity.id, entity
+    raise ValueError(f"نوع كيان غير مدعوم في سجل النشاط: {type(entity).__name__}")
+
+
+def _build_entry(user_name, entity_type, entity_id, action, details, amount, order_id, entity=None):
+    """(النموذج، القيم) للسجل، أو None إن لم يكن للحدث سجل (مصروف غير مرتبط بطلبية)"""
+    values = {'user': user_name, 'timestamp': now_utc()}
+
+    if entity_type == 'order':
+        if entity_id is None and entity is not None:
+            # طلبية جديدة لم تُكتب بعد: الربط بالعلاقة فيُملأ order_id عند الـ flush
+            return OrderHistory, {**values, 'order': entity, 'change_type': action, 'details': details}
+        return OrderHistory, {**values, 'order_id': entity_id, 'change_type': action, 'details': details}
+
+    if entity_type in ORDER_LINKED:
+        model, change_type = ORDER_LINKED[entity_type]
+        if order_id is None:
+            order_id = entity.order_id if entity is not None else _related_order_id(model, entity_id)
+        if not order_id:
+            return None
+        return OrderHistory, {
+            **values,
+            'order_id': order_id,
+            'change_type': change_type,
+            'details': f"{details} - المبلغ: {amount} دج",
+        }
+
+    if entity_type == 'worker':
+        if entity_id is None and entity is not None:
+            return WorkerHistory, {**values, 'worker': entity, 'change_type': action, 'details': details, 'amount': amount}
+        return WorkerHistory, {**values, 'worker_id': entity_id, 'change_type': action, 'details': details, 'amount': amount}
+
+    raise ValueError(f"نوع كيان غير مدعوم في سجل النشاط: {entity_type}")
+
+
+def log_entity_activity(user_name, entity_type, entity_id, action, details, amount=0.0,
+                        order_id=None, priority=PRIORITY_NORMAL, entity=None):
+    """تسجيل نشاط على كيان بنوعه ومعرفه
+
+    الأولوية العادية: السجل يُضاف إلى db.session ويُثبّت أو يُلغى مع معاملة المستدعي.
+    الأولوية المنخفضة: السجل يُخزن مؤقتاً ويُدرج في الخلفية (لأحداث القراءة التي لا تثبّت شيئاً).
+    تعيد كائن السجل المضاف للجلسة، أو None إن خُزن مؤقتاً أو لم يكن للحدث سجل.
+    """
+    entry = _build_entry(user_name, entity_type, entity_id, action, details, amount, order_id, entity)
+    if entry is None:
+        return None
+    model, values = entry
+
+    if priority == PRIORITY_LOW and 'order' not in values and 'worker' not in values:
+        # الإدراج المؤجل لا يرى الخطأ عند الطلب: مفتاح أجنبي لكيان غير موجود يُرفض هنا
+        parent, parent_id = (Order, values['order_id']) if model is OrderHistory else (Worker, values['worker_id'])
+        if not _entity_exists(parent, parent_id):
+            raise ValueError(f"لا يوجد {'طلبية' if parent is Order else 'عامل'} برقم {parent_id}")
+        _buffer_entry(model, values)
+        return None
+
+    record = model(**values)
+    if entity_type in ORDER_LINKED:
+        # الكيان نفسه يُنتج حدثاً في activity_event عند إضافته، فلا يتكرر الحدث من هذا السجل
+        record._activity_entity = (entity_type, entity if entity is not None else entity_id)
+    db.session.add(record)
+    return record
+
+
+def log_activity(user_name, entity, action, details, amount=0.0, priority=PRIORITY_NORMAL):
+    """تسجيل نشاط على كائن نموذج (Order, Expense, Transport, Worker) دون أي استعلام إضافي"""
+    entity_type, entity_id, entity = _entity_reference(entity)
+    return log_entity_activity(user_name, entity_type, entity_id, action, details, amount,
+                               priority=priority, entity=entity)
+
+
+# ========================
+# المخزن المؤقت والإدراج الجماعي
+# ========================
+def _config(key, default):
+    if has_app_context():
+        return current_app.config.get(key, default)
+    return default
+
+
+def _buffer_entry(model, values):
+    with _BUFFER_LOCK:
+        if len(_BUFFER) >= MAX_BUFFER_SIZE:
+            del _BUFFER[0]
+        _BUFFER.append((model, values))
+        size = len(_BUFFER)
+
+    flusher = _ensure_flusher()
+    if flusher is None:
+        # بدون سياق تطبيق (أو مع فاصل 0) يُدرج فوراً
+        flush_buffered_activities()
+    elif size >= _config('AUDIT_BUFFER_SIZE', DEFAULT_BUFFER_SIZE):
+        flusher.wake()
+
+
+def flush_buffered_activities():
+    """إدراج كل السجلات المخزنة مؤقتاً (INSERT واحد لكل جدول) في معاملة مستقلة، يعيد عددها
+
+    الإدراج على اتصال خاص من المحرك وليس db.session: عند التفريغ الفوري داخل طلب
+    لا يثبّت أو يلغي commit/rollback هنا أي تغييرات معلقة في جلسة المستدعي.
+    """
+    with _BUFFER_LOCK:
+        entries = list(_BUFFER)
+        _BUFFER.clear()
+    if not entries:
+        return 0
+
+    try:
+        with db.engine.begin() as connection:
+            events = _insert_entries(connection, entries)
+    except IntegrityError as e:
+        # صف واحد غير صالح لا يوقف الدفعة كلها: إعادة الإدراج صفاً صفاً وإسقاط المرفوض فقط
+        print(f"⚠️ رُفضت دفعة سجلات النشاط المؤجلة ({len(entries)})، الإدراج صفاً صفاً: {e.orig}")
+        return _insert_one_by_one(entries)
+    except Exception as e:
+        print(f"❌ خطأ في إدراج سجلات النشاط المؤجلة ({len(entries)}): {e}")
+        _requeue(entries)
+        return 0
+
+    publish_events(events)
+    return len(entries)
+
+
+def _insert_entries(connection, entries):
+    """INSERT واحد لكل جدول ثم أحداث activity_event على نفس الاتصال، يعيد الأحداث"""
+    rows_by_model = {}
+    for model, values in entries:
+        rows_by_model.setdefault(model, []).append(values)
+
+    events = []
+    for model, rows in rows_by_model.items():
+        statement = insert(model).returning(model.id, sort_by_parameter_order=True)
+        ids = connection.execute(statement, rows).scalars().all()
+        to_event = order_history_event if model is OrderHistory else worker_history_event
+        events.extend(to_event(values, source_id) for values, source_id in zip(rows, ids))
+    # الإدراج الجماعي لا يمر بـ flush الجلسة، فأحداث activity_event تُضاف هنا في نفس المعاملة
+    insert_events(connection, events)
+    return events
+
+
+def _insert_one_by_one(entries):
+    """كل سجل في معاملته: المرفوض (قيد سلامة) يُسجل ويُسقط، وخطأ آخر يعيد الباقي للمخزن"""
+    inserted = 0
+    for index, entry in enumerate(entries):
+        try:
+            with db.engine.begin() as connection:
+                events = _insert_entries(connection, [entry])
+        except IntegrityError as e:
+            model, values = entry
+            print(f"❌ إسقاط سجل نشاط مؤجل غير صالح ({model.__tablename__}: {values}): {e.orig}")
+            continue
+        except Exception as e:
+            print(f"❌ خطأ في إدراج سجلات النشاط المؤجلة ({len(entries) - index}): {e}")
+            _requeue(entries[index:])
+            break
+        publish_events(events)
+        inserted += 1
+    return inserted
+
+
+def _requeue(entries):
+    with _BUFFER_LOCK:
+        _BUFFER[:0] = entries[-MAX_BUFFER_SIZE:]
+
+
+def get_buffered_count():
+    return len(_BUFFER)
+
+
+class AuditFlusher:
+    """خيط خلفي يفرغ المخزن كل interval ثانية أو عند إيقاظه"""
+
+    def __init__(self, app, interval):
+        self.app = app
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="audit-flusher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def flush(self):
+        with self.app.app_context():
+            flush_buffered_activities()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ خطأ في خيط سجل النشاط: {e}")
+
+
+def _ensure_flusher():
+    """تشغيل خيط الإدراج مرة واحدة لكل عملية (None خارج سياق التطبيق)"""
+    if not has_app_context():
+        return None
+    interval = current_app.config.get('AUDIT_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+    if interval <= 0:
+        return None
+    flusher = _FLUSHER.get('instance')
+    if flusher is not None:
+        return flusher
+    with _BUFFER_LOCK:
+        if 'instance' not in _FLUSHER:
+            flusher = AuditFlusher(current_app._get_current_object(), interval)
+            flusher.start()
+            _FLUSHER['instance'] = flusher
+            # إدراج ما تبقى عند إيقاف العملية
+            atexit.register(flusher.flush)
+    return _FLUSHER['instance']
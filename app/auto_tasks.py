@@ -0,0 +1,47 @@
+# ====== auto_tasks.py ======
+# توليد المهام التلقائية كمهمة خلفية دورية بدل توليدها عند كل عرض لصفحة المهام
+from datetime import timedelta, timezone
+from flask import current_app
+from models import db, JobWatermark, now_utc, generate_auto_tasks
+from jobs import periodic_job
+
+WATERMARK_NAME = 'auto_tasks'
+
+
+def _as_utc(value):
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+@periodic_job('auto_tasks', 'AUTO_TASKS_INTERVAL', 900)
+def run_auto_tasks(full=False):
+    """تشغيل التوليد من آخر علامة مائية، مع فحص كامل دوري
+
+    الفحص الكامل (كل AUTO_TASKS_FULL_SWEEP_HOURS) يلتقط ما لا يمكن تتبعه
+    بالتواريخ، مثل دين متأخر أُغلقت مهمته ولا يزال غير مسدد.
+    """
+    started = now_utc()
+    watermark = db.session.get(JobWatermark, WATERMARK_NAME)
+
+    since = None
+    if watermark is not None and watermark.last_run_at is not None and not full:
+        sweep_every = timedelta(hours=current_app.config.get('AUTO_TASKS_FULL_SWEEP_HOURS', 24))
+        last_full = _as_utc(watermark.last_full_run_at)
+        if last_full is not None and started - last_full < sweep_every:
+            since = _as_utc(watermark.last_run_at)
+
+    created = generate_auto_tasks(since=since, raise_errors=True)
+
+    # العلامة تُسجل بوقت بداية التشغيل حتى لا تضيع تغييرات حدثت أثناءه
+    if watermark is None:
+        watermark = JobWatermark(name=WATERMARK_NAME)
+        db.session.add(watermark)
+    watermark.last_run_at = started
+    if since is None:
+        watermark.last_full_run_at = started
+    watermark.last_result = created
+    db.session.commit()
+
+    print(f"✅ توليد المهام التلقائية ({'كامل' if since is None else 'تزايدي'}): {created} مهمة جديدة")
+    return created
@@ -1,23 +1,590 @@
-# backup.py
-import sqlite3
-import datetime
+# ====== backup.py ======
+# النسخ الاحتياطي لقاعدة بيانات SQLite أثناء التشغيل
+# النسخ بواجهة SQLite الرسمية (backup API) على دفعات من الصفحات مع استراحة بينها، فلا يُحجب الكُتّاب
+# ولا تُنسخ صفحات نصف مكتوبة، ثم ضغط متدفق (gzip أو zstd) مع SHA-256 وملف فهرس (manifest.json)
+# يحمل سجل النسخ، وحذف النسخ الأقدم من عدد الاحتفاظ
+# النسخ التزايدية تحفظ الصفحات التي تغيرت بصمتها منذ النسخة السابقة فقط (خريطة بصمات لكل نسخة)،
+# والاستعادة لأي نقطة زمنية = النسخة الكاملة الأساس ثم تطبيق التزايدية بالترتيب
+import gzip
+import hashlib
+import json
 import os
+import sqlite3
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from flask import current_app
+from models import db
+from jobs import periodic_job
+
+CHUNK_SIZE = 1024 * 1024
+MANIFEST_NAME = 'manifest.json'
+DEFAULT_KEEP = 14
+STEP_PAGES = 256          # صفحات كل خطوة نسخ (1MB بصفحات 4KB)
+STEP_SLEEP = 0.01         # استراحة بين الخطوات ليأخذ الكُتّاب القفل
+MAX_RESTARTS = 3          # إعادة البدء بسبب كتابة أثناء النسخ قبل اللجوء إلى VACUUM INTO
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+BACKUP_MODES = ('full', 'incremental')
+PAGE_DIGEST_SIZE = 16     # بصمة blake2b لكل صفحة في خريطة الصفحات
+DELTA_MAGIC = b'SQLDELTA1'
+DEFAULT_MAX_CHAIN = 30    # أقصى عدد نسخ تزايدية متتالية قبل نسخة كاملة جديدة
+MAX_CHANGED_RATIO = 0.5   # إن تغير أكثر من هذا من الصفحات تُكتب نسخة كاملة بدل التزايدية
+
+_MANIFEST_LOCK = threading.Lock()
+
+
+class BackupError(Exception):
+    """تعذر إنشاء النسخة أو التحقق منها"""
+
+
+class _CopyRestarted(Exception):
+    """واجهة النسخ أعادت البدء مرات كثيرة بسبب كتابات متواصلة"""
+
+
+# ========================
+# المسارات والفهرس
+# ========================
+def get_backup_dir():
+    path = current_app.config.get('BACKUP_DIR') or os.path.join(current_app.instance_path, 'backups')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def get_database_path():
+    """مسار ملف SQLite الفعلي من المحرك (وليس data.db نسبة إلى مجلد التشغيل)"""
+    url = db.engine.url
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        raise BackupError("النسخ الاحتياطي المدمج يدعم ملفات SQLite فقط (استخدم pg_dump مع PostgreSQL)")
+    return os.path.abspath(url.database)
+
+
+def _manifest_path():
+    return os.path.join(get_backup_dir(), MANIFEST_NAME)
+
+
+def read_manifest():
+    """سجل النسخ من الفهرس (قائمة فارغة إن لم يوجد)"""
+    try:
+        with open(_manifest_path(), 'r', encoding='utf-8') as handle:
+            return json.load(handle).get('backups', [])
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        print(f"❌ خطأ في قراءة فهرس النسخ الاحتياطية: {e}")
+        return []
+
+
+def _write_manifest(entries):
+    """كتابة ذرية: ملف مؤقت ثم os.replace، فالقارئ لا يرى فهرساً نصف مكتوب"""
+    path = _manifest_path()
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as handle:
+        json.dump({'version': 1, 'backups': entries}, handle, ensure_ascii=False, indent=2)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temp_path, path)
+
+
+def _update_manifest(change):
+    """تعديل الفهرس تحت القفل: change(entries) تعدل القائمة وتعيد ما تشاء"""
+    with _MANIFEST_LOCK:
+        entries = read_manifest()
+        result = change(entries)
+        _write_manifest(entries)
+        return result
+
+
+def get_backup(filename):
+    """مدخل نسخة من الفهرس بالاسم (الأسماء خارج الفهرس مرفوضة، فلا وصول لملفات أخرى)"""
+    for entry in read_manifest():
+        if entry['filename'] == filename:
+            return entry
+    return None
+
+
+def get_backup_path(entry):
+    return os.path.join(get_backup_dir(), entry['filename'])
+
+
+# ========================
+# النسخ
+# ========================
+def _copy_with_backup_api(source_path, target_path, step_pages, step_sleep):
+    """نسخ صفحة بصفحة بدفعات؛ كل خطوة تأخذ قفل قراءة قصير ثم تتركه للكُتّاب"""
+    state = {'remaining': None, 'restarts': 0}
+
+    def progress(status, remaining, total):
+        # زيادة المتبقي تعني أن SQLite أعاد البدء لأن اتصالاً آخر كتب في القاعدة
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > MAX_RESTARTS:
+                raise _CopyRestarted()
+        state['remaining'] = remaining
+        # sleep في backup() يُطبق فقط عند BUSY، فالاستراحة بين الخطوات هنا
+        if remaining and step_sleep:
+            time.sleep(step_sleep)
+
+    source = sqlite3.connect(source_path, timeout=30)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target, pages=step_pages, progress=progress, sleep=step_sleep)
+    finally:
+        target.close()
+        source.close()
+    return state['restarts']
+
+
+def _copy_with_vacuum_into(source_path, target_path):
+    """VACUUM INTO: لقطة قراءة واحدة متسقة (لا تحجب الكُتّاب مع WAL) ونسخة مضغوطة الصفحات"""
+    source = sqlite3.connect(source_path, timeout=30)
+    try:
+        source.execute("VACUUM INTO ?", (target_path,))
+    finally:
+        source.close()
+
+
+def _check_copy(path):
+    """quick_check على النسخة قبل اعتمادها، مع عدد الصفحات وحجمها"""
+    connection = sqlite3.connect(path)
+    try:
+        result = connection.execute("PRAGMA quick_check").fetchone()[0]
+        page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+        page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+    finally:
+        connection.close()
+    if result != 'ok':
+        raise BackupError(f"فشل فحص سلامة النسخة: {result}")
+    return page_count, page_size
+
+
+class _HashingWriter:
+    """يمرر الكتابة إلى الملف ويحسب SHA-256 والحجم للمخرجات المضغوطة"""
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.handle.write(data)
+
+    def flush(self):
+        self.handle.flush()
+
+
+def resolve_compression(requested=None):
+    """zstd إن طُلب وكانت مكتبة zstandard مثبتة، وإلا gzip"""
+    requested = (requested or current_app.config.get('BACKUP_COMPRESSION') or 'gzip').lower()
+    if requested == 'zstd':
+        try:
+            import zstandard  # noqa: F401
+            return 'zstd'
+        except ImportError:
+            print("⚠️ مكتبة zstandard غير مثبتة - سيُستخدم gzip للنسخ الاحتياطي")
+    return 'gzip'
+
+
+def _compressor(compression, writer):
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=3).stream_writer(writer, closefd=False)
+    return gzip.GzipFile(fileobj=writer, mode='wb', compresslevel=6, mtime=0)
+
+
+def _decompressor(compression, handle):
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(handle)
+    return gzip.GzipFile(fileobj=handle, mode='rb')
+
+
+def _read_exact(stream, size):
+    """قراءة size بايت بالضبط من مجرى فك الضغط (قد يعيد أقل في كل استدعاء)"""
+    parts = []
+    while size:
+        data = stream.read(size)
+        if not data:
+            break
+        parts.append(data)
+        size -= len(data)
+    return b''.join(parts)
+
+
+def _iter_pages(path, page_size):
+    """صفحات ملف قاعدة البيانات بالترتيب (CHUNK_SIZE من مضاعفات أي حجم صفحة في SQLite)"""
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+            for offset in range(0, len(chunk), page_size):
+                yield chunk[offset:offset + page_size]
+
+
+def _page_digest(page):
+    return hashlib.blake2b(page, digest_size=PAGE_DIGEST_SIZE).digest()
+
+
+def _write_compressed(target_path, compression, write_body):
+    """فتح الملف المضغوط وتمرير المجرى إلى write_body، يعيد (بصمة المضغوط، حجمه، ناتج write_body)"""
+    with open(target_path, 'wb') as handle:
+        writer = _HashingWriter(handle)
+        with _compressor(compression, writer) as stream:
+            result = write_body(stream)
+        handle.flush()
+        os.fsync(handle.fileno())
+    return writer.sha256.hexdigest(), writer.size, result
+
+
+def _write_full(copy_path, target_path, compression, page_size):
+    """نسخة كاملة: كل الصفحات في مجرى مضغوط واحد، مع خريطة بصمات الصفحات للنسخ التزايدية"""
+    def write_body(stream):
+        raw_sha256 = hashlib.sha256()
+        digests = bytearray()
+        for page in _iter_pages(copy_path, page_size):
+            raw_sha256.update(page)
+            digests += _page_digest(page)
+            stream.write(page)
+        return raw_sha256.hexdigest(), bytes(digests), 0
+
+    return _write_compressed(target_path, compression, write_body)
+
+
+class _DeltaTooLarge(Exception):
+    """تغيرت صفحات كثيرة فالنسخة الكاملة أنسب"""
+
+
+def _write_delta(copy_path, target_path, compression, page_size, page_count, parent_pagemap, max_changed):
+    """نسخة تزايدية: رقم الصفحة ومحتواها لكل صفحة تختلف بصمتها عن النسخة الأب فقط"""
+    def write_body(stream):
+        raw_sha256 = hashlib.sha256()
+        digests = bytearray()
+        changed = 0
+        stream.write(DELTA_MAGIC + struct.pack('>II', page_size, page_count))
+        for number, page in enumerate(_iter_pages(copy_path, page_size), 1):
+            raw_sha256.update(page)
+            digest = _page_digest(page)
+            digests += digest
+            offset = (number - 1) * PAGE_DIGEST_SIZE
+            if parent_pagemap[offset:offset + PAGE_DIGEST_SIZE] != digest:
+                changed += 1
+                if changed > max_changed:
+                    raise _DeltaTooLarge()
+                stream.write(struct.pack('>I', number))
+                stream.write(page)
+        return raw_sha256.hexdigest(), bytes(digests), changed
+
+    return _write_compressed(target_path, compression, write_body)
+
+
+def _apply_delta(entry, output):
+    """كتابة صفحات نسخة تزايدية فوق ملف قاعدة البيانات المفتوح output"""
+    with open(get_backup_path(entry), 'rb') as handle, _decompressor(entry['compression'], handle) as stream:
+        header = _read_exact(stream, len(DELTA_MAGIC) + 8)
+        if header[:len(DELTA_MAGIC)] != DELTA_MAGIC:
+            raise BackupError(f"ملف النسخة التزايدية تالف: {entry['filename']}")
+        page_size, _ = struct.unpack('>II', header[len(DELTA_MAGIC):])
+        while True:
+            number = _read_exact(stream, 4)
+            if not number:
+                break
+            page = _read_exact(stream, page_size)
+            if len(number) != 4 or len(page) != page_size:
+                raise BackupError(f"ملف النسخة التزايدية مقطوع: {entry['filename']}")
+            output.seek((struct.unpack('>I', number)[0] - 1) * page_size)
+            output.write(page)
+
+
+def _pagemap_path(entry):
+    return os.path.join(get_backup_dir(), entry['pagemap'])
+
+
+def _read_pagemap(entry):
+    if not entry.get('pagemap'):
+        return None
+    try:
+        with open(_pagemap_path(entry), 'rb') as handle:
+            return handle.read()
+    except FileNotFoundError:
+        return None
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _incremental_parent(page_size):
+    """آخر نسخة إن صلحت أباً لنسخة تزايدية (نفس حجم الصفحة، لها خريطة، والسلسلة لم تبلغ حدها)"""
+    entries = list_backups()
+    if not entries:
+        return None, None
+    parent = entries[0]
+    max_chain = current_app.config.get('BACKUP_MAX_CHAIN', DEFAULT_MAX_CHAIN)
+    if parent.get('page_size') != page_size or parent.get('chain_length', 0) + 1 > max_chain:
+        return None, None
+    pagemap = _read_pagemap(parent)
+    if pagemap is None:
+        return None, None
+    return parent, pagemap
+
+
+def create_backup(compression=None, keep=None, mode=None):
+    """إنشاء نسخة مضغوطة وتسجيلها في الفهرس ثم تطبيق الاحتفاظ
+
+    mode='incremental' (BACKUP_MODE الافتراضي) تحفظ الصفحات المتغيرة منذ آخر نسخة فقط، وتصبح
+    كاملة إن لم توجد نسخة أب صالحة أو تغير أكثر من نصف الصفحات؛ mode='full' كاملة دائماً.
+    تعيد مدخل الفهرس: filename, kind, parent, chain_length, created_at, size_bytes, sha256,
+    raw_size_bytes, raw_sha256, changed_pages, page_count, page_size, compression, method, duration_ms.
+    """
+    started = time.perf_counter()
+    source_path = get_database_path()
+    backup_dir = get_backup_dir()
+    compression = resolve_compression(compression)
+    mode = mode or current_app.config.get('BACKUP_MODE', 'incremental')
+    if mode not in BACKUP_MODES:
+        raise BackupError(f"نوع نسخ غير معروف: {mode}")
+
+    created_at = datetime.now(timezone.utc)
+    name = f"backup_{created_at.strftime('%Y%m%d_%H%M%S_%f')}"
+    copy_path = os.path.join(backup_dir, f".{name}.partial.db")
+    target_path = None
+
+    try:
+        method = 'backup_api'
+        restarts = 0
+        try:
+            restarts = _copy_with_backup_api(
+                source_path, copy_path,
+                current_app.config.get('BACKUP_STEP_PAGES', STEP_PAGES),
+                current_app.config.get('BACKUP_STEP_SLEEP', STEP_SLEEP)
+            )
+        except _CopyRestarted:
+            _remove_quietly(copy_path)
+            method = 'vacuum_into'
+            restarts = MAX_RESTARTS + 1
+            _copy_with_vacuum_into(source_path, copy_path)
+
+        page_count, page_size = _check_copy(copy_path)
+
+        parent, parent_pagemap = _incremental_parent(page_size) if mode == 'incremental' else (None, None)
+        written = None
+        if parent is not None:
+            filename = name + '.delta' + COMPRESSION_SUFFIXES[compression]
+            target_path = os.path.join(backup_dir, filename)
+            try:
+                written = _write_delta(copy_path, target_path, compression, page_size, page_count,
+                                       parent_pagemap, int(page_count * MAX_CHANGED_RATIO))
+            except _DeltaTooLarge:
+                _remove_quietly(target_path)
+                parent = None
+        if written is None:
+            filename = name + '.db' + COMPRESSION_SUFFIXES[compression]
+            target_path = os.path.join(backup_dir, filename)
+            written = _write_full(copy_path, target_path, compression, page_size)
+
+        sha256, size_bytes, (raw_sha256, pagemap, changed_pages) = written
+        pagemap_name = filename + '.pages'
+        with open(os.path.join(backup_dir, pagemap_name), 'wb') as handle:
+            handle.write(pagemap)
+    except Exception:
+        if target_path:
+            _remove_quietly(target_path)
+        raise
+    finally:
+        _remove_quietly(copy_path)
+
+    entry = {
+        'filename': filename,
+        'kind': 'incremental' if parent else 'full',
+        'parent': parent['filename'] if parent else None,
+        'chain_length': parent.get('chain_length', 0) + 1 if parent else 0,
+        'pagemap': pagemap_name,
+        'created_at': created_at.isoformat(),
+        'compression': compression,
+        'method': method,
+        'restarts': restarts,
+        'page_count': page_count,
+        'page_size': page_size,
+        'changed_pages': changed_pages if parent else page_count,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+        'sha256': sha256,
+        'size_bytes': size_bytes,
+        'raw_sha256': raw_sha256,
+        'raw_size_bytes': page_count * page_size,
+    }
+    _update_manifest(lambda entries: entries.append(entry))
+    rotate_backups(keep)
+    print(f"✅ تم إنشاء نسخة احتياطية ({entry['kind']}): {filename} ({size_bytes / (1024 * 1024):.2f}MB)")
+    return entry
+
+
+# ========================
+# السلاسل والاستعادة
+# ========================
+def _ancestors(entry, by_name):
+    """أسماء النسخ التي تعتمد عليها النسخة (هي ثم آباؤها حتى النسخة الكاملة)"""
+    names = []
+    while entry is not None:
+        names.append(entry['filename'])
+        entry = by_name.get(entry.get('parent')) if entry.get('parent') else None
+    return names
+
+
+def backup_chain(entry):
+    """النسخة الكاملة الأساس ثم النسخ التزايدية حتى entry بالترتيب"""
+    by_name = {item['filename']: item for item in read_manifest()}
+    chain = [entry]
+    while chain[0].get('parent'):
+        parent = by_name.get(chain[0]['parent'])
+        if parent is None:
+            raise BackupError(f"سلسلة النسخة ناقصة: {chain[0]['parent']} غير موجودة")
+        chain.insert(0, parent)
+    return chain
+
+
+def find_backup_at(moment):
+    """آخر نسخة أُنشئت في moment أو قبلها (الاستعادة إلى نقطة زمنية)"""
+    if moment.tzinfo is None:
+        moment = moment.astimezone()
+    for entry in list_backups():
+        if datetime.fromisoformat(entry['created_at']) <= moment:
+            return entry
+    return None
+
+
+def restore_backup(entry, output_path):
+    """إعادة بناء قاعدة البيانات كما كانت عند entry في output_path (الكاملة ثم تطبيق التزايدية)
+
+    لا تلمس قاعدة البيانات الحية؛ الناتج يُطابق ببصمته في الفهرس قبل وضعه في مكانه.
+    تعيد أسماء نسخ السلسلة المطبقة.
+    """
+    chain = backup_chain(entry)
+    temp_path = output_path + '.partial'
+    try:
+        base = chain[0]
+        with open(get_backup_path(base), 'rb') as handle, \
+                _decompressor(base['compression'], handle) as stream, \
+                open(temp_path, 'wb') as output:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                output.write(chunk)
+
+        with open(temp_path, 'r+b') as output:
+            for delta in chain[1:]:
+                _apply_delta(delta, output)
+            output.truncate(entry['page_count'] * entry['page_size'])
+            output.flush()
+            os.fsync(output.fileno())
+
+        raw_sha256 = hashlib.sha256()
+        with open(temp_path, 'rb') as restored:
+            for chunk in iter(lambda: restored.read(CHUNK_SIZE), b''):
+                raw_sha256.update(chunk)
+        if raw_sha256.hexdigest() != entry['raw_sha256']:
+            raise BackupError("بصمة قاعدة البيانات المستعادة لا تطابق الفهرس")
+
+        os.replace(temp_path, output_path)
+    except Exception:
+        _remove_quietly(temp_path)
+        raise
+    return [item['filename'] for item in chain]
+
+
+# ========================
+# الاحتفاظ والتحقق والحذف
+# ========================
+def _remove_files(entry):
+    _remove_quietly(get_backup_path(entry))
+    if entry.get('pagemap'):
+        _remove_quietly(_pagemap_path(entry))
+
+
+def rotate_backups(keep=None):
+    """الاحتفاظ بآخر keep نسخة (BACKUP_KEEP) مع كل ما تعتمد عليه من سلاسلها، يعيد أسماء المحذوفة"""
+    if keep is None:
+        keep = current_app.config.get('BACKUP_KEEP', DEFAULT_KEEP)
+    if not keep or keep <= 0:
+        return []
+
+    def drop_old(entries):
+        by_name = {entry['filename']: entry for entry in entries}
+        ordered = sorted(entries, key=lambda entry: entry['created_at'], reverse=True)
+        kept = set()
+        for entry in ordered[:keep]:
+            kept.update(_ancestors(entry, by_name))
+        expired = [entry for entry in entries if entry['filename'] not in kept]
+        for entry in expired:
+            entries.remove(entry)
+        return expired
+
+    expired = _update_manifest(drop_old)
+    for entry in expired:
+        _remove_files(entry)
+    return [entry['filename'] for entry in expired]
+
+
+def verify_backup(entry, deep=False):
+    """مطابقة SHA-256 للملف مع الفهرس؛ deep يعيد بناء قاعدة البيانات ويطابق بصمتها الخام أيضاً"""
+    path = get_backup_path(entry)
+    if not os.path.exists(path):
+        return False, "الملف غير موجود"
+
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    if sha256.hexdigest() != entry['sha256']:
+        return False, "بصمة الملف المضغوط لا تطابق الفهرس"
+
+    if deep:
+        temp_path = os.path.join(get_backup_dir(), f".verify_{entry['filename']}.db")
+        try:
+            restore_backup(entry, temp_path)
+        except BackupError as e:
+            return False, str(e)
+        finally:
+            _remove_quietly(temp_path)
+    return True, "سليمة"
+
+
+def delete_backup(filename):
+    """حذف نسخة من الفهرس ثم من القرص، يعيد False إن لم تكن في الفهرس
+
+    النسخة التي تعتمد عليها نسخ تزايدية لا تُحذف (BackupError).
+    """
+    def remove(entries):
+        for entry in entries:
+            if entry['filename'] == filename:
+                if any(other.get('parent') == filename for other in entries):
+                    raise BackupError("لا يمكن حذف نسخة تعتمد عليها نسخ تزايدية أحدث")
+                entries.remove(entry)
+                return entry
+        return None
+
+    entry = _update_manifest(remove)
+    if entry is None:
+        return False
+    _remove_files(entry)
+    return True
+
+
+def list_backups():
+    """سجل النسخ من الفهرس، الأحدث أولاً"""
+    return sorted(read_manifest(), key=lambda entry: entry['created_at'], reverse=True)
+
+
+# ========================
+# الجدولة
+# ========================
+@periodic_job('database_backup', 'BACKUP_INTERVAL', 86400)
+def run_scheduled_backup(mode=None):
+    """نسخة دورية في منفذ المهام الخلفية (BACKUP_INTERVAL بالثواني، 0 للتعطيل)
 
-def backup_database():
-    """إنشاء نسخة احتياطية من قاعدة البيانات"""
-    try:
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_file = f"backup/data_backup_{timestamp}.db"
-        
-        os.makedirs("backup", exist_ok=True)
-        
-        # نسخ الملف
-        with open('data.db', 'rb') as original:
-            with open(backup_file, 'wb') as backup:
-                backup.write(original.read())
-        
-        print(f"✅ تم إنشاء نسخة احتياطية: {backup_file}")
-        return True
-    except Exception as e:
-        print(f"❌ خطأ في النسخ الاحتياطي: {e}")
-        return False
\ No newline at end of file
+    نفس المهمة تُضاف يدوياً من صفحة الإعدادات مع mode في الحمولة.
+    """
+    if db.engine.url.get_backend_name() != 'sqlite':
+        print("⚠️ تخطي النسخ الاحتياطي الدوري: قاعدة البيانات ليست SQLite")
+        return
+    create_backup(mode=mode)
@@ -0,0 +1,242 @@
+# ====== blob_store.py ======
+# مخزن الملفات الثنائية (المرفقات والفواتير) خارج قاعدة البيانات
+# كل ملف يُخزَّن مرة واحدة بمفتاح SHA-256 لمحتواه، والصفوف تحتفظ بالمفتاح فقط
+import hashlib
+import os
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from flask import current_app
+
+CHUNK_SIZE = 64 * 1024
+HASH_LENGTH = 64
+
+
+class BlobNotFound(Exception):
+    """المحتوى المطلوب غير موجود في المخزن"""
+
+
+# ========================
+# الواجهة العامة للمخزن
+# ========================
+class BlobStore(ABC):
+    """واجهة مخزن المحتوى - كل خلفية تخزين يجب أن توفر هذه الدوال"""
+
+    @abstractmethod
+    def put_stream(self, stream):
+        """حفظ محتوى من كائن ملف، يعيد (content_hash, size)"""
+
+    @abstractmethod
+    def open(self, content_hash):
+        """فتح المحتوى للقراءة كملف ثنائي"""
+
+    @abstractmethod
+    def exists(self, content_hash):
+        """هل المحتوى موجود في المخزن"""
+
+    @abstractmethod
+    def size(self, content_hash):
+        """حجم المحتوى بالبايت"""
+
+    @abstractmethod
+    def delete(self, content_hash):
+        """حذف المحتوى من المخزن"""
+
+    @abstractmethod
+    def iter_hashes(self):
+        """المرور على جميع المفاتيح المخزنة مع وقت آخر تعديل"""
+
+    def put(self, data):
+        """حفظ بايتات في الذاكرة، يعيد content_hash"""
+        from io import BytesIO
+        content_hash, _ = self.put_stream(BytesIO(data))
+        return content_hash
+
+    def read(self, content_hash):
+        """قراءة المحتوى كاملاً - للملفات الصغيرة فقط"""
+        with self.open(content_hash) as handle:
+            return handle.read()
+
+
+# ========================
+# خلفية نظام الملفات المحلي
+# ========================
+class LocalBlobStore(BlobStore):
+    """تخزين على القرص مقسّم حسب أول بايتين من البصمة: root/ab/cd/<sha256>"""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, content_hash):
+        if len(content_hash) != HASH_LENGTH or not all(c in '0123456789abcdef' for c in content_hash):
+            raise BlobNotFound(content_hash)
+        return os.path.join(self.root, content_hash[:2], content_hash[2:4], content_hash)
+
+    def put_stream(self, stream):
+        digest = hashlib.sha256()
+        size = 0
+        # الكتابة إلى ملف مؤقت داخل نفس القرص ثم نقله ذرياً بعد معرفة البصمة
+        fd, temp_path = tempfile.mkstemp(prefix='.upload-', dir=self.root)
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    size += len(chunk)
+                    temp_file.write(chunk)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+
+            content_hash = digest.hexdigest()
+            final_path = self._path(content_hash)
+            if os.path.exists(final_path):
+                # نفس المحتوى موجود مسبقاً - لا حاجة لنسخة ثانية
+                os.remove(temp_path)
+                os.utime(final_path, None)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(temp_path, final_path)
+            return content_hash, size
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def open(self, content_hash):
+        try:
+            return open(self._path(content_hash), 'rb')
+        except FileNotFoundError:
+            raise BlobNotFound(content_hash)
+
+    def exists(self, content_hash):
+        try:
+            return os.path.exists(self._path(content_hash))
+        except BlobNotFound:
+            return False
+
+    def size(self, content_hash):
+        try:
+            return os.path.getsize(self._path(content_hash))
+        except FileNotFoundError:
+            raise BlobNotFound(content_hash)
+
+    def delete(self, content_hash):
+        try:
+            os.remove(self._path(content_hash))
+            return True
+        except (FileNotFoundError, BlobNotFound):
+            return False
+
+    def iter_hashes(self):
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if len(filename) == HASH_LENGTH and not filename.startswith('.'):
+                    path = os.path.join(directory, filename)
+                    yield filename, os.path.getmtime(path)
+
+
+BACKENDS = {
+    'local': LocalBlobStore,
+}
+
+
+def get_blob_store(app=None):
+    """إرجاع مخزن المحتوى المُعدّ للتطبيق (يُنشأ مرة واحدة)"""
+    app = app or current_app
+    store = app.extensions.get('blob_store')
+    if store is None:
+        backend = app.config.get('BLOB_STORE_BACKEND', 'local')
+        root = app.config.get('BLOB_STORE_PATH') or os.path.join(app.instance_path, 'blobs')
+        store = BACKENDS[backend](root)
+        app.extensions['blob_store'] = store
+    return store
+
+
+# ========================
+# دوال مساعدة للمسارات
+# ========================
+def store_upload(data):
+    """حفظ بايتات ملف مرفوع، يعيد content_hash"""
+    return get_blob_store().put(data)
+
+
+def referenced_hashes():
+    """جميع البصمات المستخدمة في جداول المرفقات والفواتير ونسخها المصغرة"""
+    from models import db, OrderAttachment, ExpenseReceipt, TransportReceipt, AttachmentDerivative
+
+    hashes = set()
+    for model in (OrderAttachment, ExpenseReceipt, TransportReceipt, AttachmentDerivative):
+        rows = db.session.query(model.content_hash).filter(model.content_hash.isnot(None)).distinct()
+        hashes.update(content_hash for (content_hash,) in rows)
+    return hashes
+
+
+# ========================
+# الترحيل من أعمدة LargeBinary وتنظيف المخزن
+# ========================
+BLOB_COLUMNS = (
+    ('order_attachment', 'file_data'),
+    ('expense_receipt', 'image_data'),
+    ('transport_receipt', 'image_data'),
+)
+
+
+def migrate_legacy_blobs(batch_size=50):
+    """نقل البايتات المخزنة في قاعدة البيانات إلى المخزن على دفعات
+
+    كل دفعة تقرأ عدداً محدوداً من الصفوف فقط، تكتب محتواها إلى المخزن،
+    ثم تسجل البصمة وتفرغ العمود القديم وتُثبّت قبل الانتقال للدفعة التالية.
+    """
+    from sqlalchemy import text
+    from models import db
+
+    store = get_blob_store()
+    stats = {}
+    for table, column in BLOB_COLUMNS:
+        moved = 0
+        moved_bytes = 0
+        last_id = 0
+        while True:
+            rows = db.session.execute(text(
+                f"SELECT id, {column} FROM {table} "
+                f"WHERE id > :last_id AND {column} IS NOT NULL "
+                f"ORDER BY id LIMIT :limit"
+            ), {'last_id': last_id, 'limit': batch_size}).fetchall()
+            if not rows:
+                break
+
+            for row_id, data in rows:
+                content_hash = store.put(bytes(data))
+                db.session.execute(text(
+                    f"UPDATE {table} SET content_hash = :content_hash, {column} = NULL WHERE id = :id"
+                ), {'content_hash': content_hash, 'id': row_id})
+                moved += 1
+                moved_bytes += len(data)
+                last_id = row_id
+
+            db.session.commit()
+        stats[table] = {'rows': moved, 'bytes': moved_bytes}
+    return stats
+
+
+def collect_garbage(grace_seconds=3600, dry_run=False):
+    """حذف المحتوى غير المرتبط بأي صف
+
+    الملفات الأحدث من grace_seconds تُترك حتى لا يُحذف رفع لم يُثبّت بعد.
+    """
+    store = get_blob_store()
+    in_use = referenced_hashes()
+    cutoff = time.time() - grace_seconds
+    removed = 0
+    kept = 0
+    for content_hash, modified_at in list(store.iter_hashes()):
+        if content_hash in in_use or modified_at > cutoff:
+            kept += 1
+            continue
+        if not dry_run:
+            store.delete(content_hash)
+        removed += 1
+    return {'removed': removed, 'kept': kept}
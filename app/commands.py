@@ -0,0 +1,296 @@
+# ====== commands.py ======
+# أوامر سطر الأوامر الخاصة بالتطبيق (flask <command>)
+import click
+
+
+def register_commands(app):
+    """تسجيل أوامر CLI على التطبيق"""
+
+    @app.cli.command("rebuild-financials")
+    @click.option("--verify", is_flag=True, help="فحص الانحراف فقط دون تعديل الجدول")
+    @click.option("--batch-size", default=1000, show_default=True, help="عدد الطلبيات في كل دفعة كتابة")
+    def rebuild_financials_command(verify, batch_size):
+        """إعادة حساب جدول order_financials بالكامل أو فحص انحرافه"""
+        from financials import rebuild_order_financials
+
+        result = rebuild_order_financials(verify_only=verify, batch_size=batch_size)
+        click.echo(f"📊 عدد الطلبيات: {result['total_orders']}")
+        click.echo(f"⚠️ صفوف منحرفة أو مفقودة: {result['drifted_orders']}")
+        click.echo(f"🗑️ صفوف يتيمة: {result['orphaned_rows']}")
+        if verify:
+            if result['drifted_orders'] or result['orphaned_rows']:
+                raise SystemExit(1)
+            click.echo("✅ الجدول مطابق للحساب المباشر")
+        else:
+            click.echo("✅ تمت إعادة بناء جدول الملخص المالي")
+
+    @app.cli.command("blobs-migrate")
+    @click.option("--batch-size", default=50, show_default=True, help="عدد الصفوف المقروءة في كل دفعة")
+    def blobs_migrate_command(batch_size):
+        """نقل المرفقات والفواتير المخزنة داخل قاعدة البيانات إلى مخزن الملفات"""
+        from blob_store import migrate_legacy_blobs
+        from migrations import latest_version, current_version
+        from models import db
+
+        with db.engine.connect() as connection:
+            if current_version(connection) < latest_version():
+                raise click.ClickException("مخطط قاعدة البيانات قديم - نفّذ flask db-upgrade أولاً")
+        stats = migrate_legacy_blobs(batch_size=batch_size)
+        for table, info in stats.items():
+            click.echo(f"📦 {table}: {info['rows']} صف ({info['bytes'] / (1024 * 1024):.2f}MB)")
+        click.echo("✅ اكتمل الترحيل - يمكن الآن تنفيذ VACUUM لاستعادة مساحة قاعدة البيانات")
+
+    @app.cli.command("blobs-gc")
+    @click.option("--grace", default=3600, show_default=True, help="تجاهل الملفات الأحدث من هذا العدد من الثواني")
+    @click.option("--dry-run", is_flag=True, help="عرض ما سيُحذف دون حذفه")
+    def blobs_gc_command(grace, dry_run):
+        """حذف المحتوى غير المرتبط بأي مرفق أو فاتورة من المخزن"""
+        from blob_store import collect_garbage
+        from derivatives import prune_orphan_derivatives
+
+        if not dry_run:
+            pruned = prune_orphan_derivatives()
+            click.echo(f"🧹 نسخ مصغرة يتيمة: {pruned}")
+        result = collect_garbage(grace_seconds=grace, dry_run=dry_run)
+        action = "سيُحذف" if dry_run else "تم حذف"
+        click.echo(f"🗑️ {action}: {result['removed']} ملف")
+        click.echo(f"📦 محتفظ به: {result['kept']} ملف")
+
+    @app.cli.command("derivatives-backfill")
+    @click.option("--batch-size", default=200, show_default=True, help="عدد الصفوف في كل دفعة")
+    @click.option("--force", is_flag=True, help="إعادة التوليد حتى للصفوف التي تملك نسخاً مصغرة")
+    @click.option("--run", "run_now", is_flag=True, help="تنفيذ المهام فوراً بدل انتظار المنفذ الخلفي")
+    def derivatives_backfill_command(batch_size, force, run_now):
+        """جدولة توليد النسخ المصغرة للمرفقات والفواتير الموجودة"""
+        from derivatives import backfill_derivatives
+        from jobs import run_pending_jobs
+
+        queued = backfill_derivatives(batch_size=batch_size, force=force)
+        for owner_type, count in queued.items():
+            click.echo(f"🖼️ {owner_type}: {count} مهمة")
+        if run_now:
+            processed = run_pending_jobs()
+            click.echo(f"✅ تم تنفيذ {processed} مهمة")
+
+    @app.cli.command("jobs-run")
+    @click.option("--limit", default=None, type=int, help="أقصى عدد مهام يتم تنفيذها")
+    def jobs_run_command(limit):
+        """تنفيذ المهام الخلفية المستحقة في هذه العملية ثم الخروج"""
+        from jobs import run_pending_jobs
+
+        processed = run_pending_jobs(limit=limit)
+        click.echo(f"✅ تم تنفيذ {processed} مهمة")
+
+    @app.cli.command("jobs-stats")
+    def jobs_stats_command():
+        """عرض عمق قائمة المهام الخلفية وتوزيعها"""
+        from jobs import get_job_stats
+
+        stats = get_job_stats()
+        click.echo(f"📥 في القائمة: {stats.get('queue_depth', 0)} (مستحقة الآن: {stats.get('due_now', 0)})")
+        click.echo(f"⏱️ أقدم مهمة منتظرة: {stats.get('oldest_pending_seconds')} ثانية")
+        for kind, counts in stats.get('by_kind', {}).items():
+            click.echo(f"  • {kind}: {counts}")
+
+    @app.cli.command("generate-tasks")
+    @click.option("--full", is_flag=True, help="فحص كامل بدل الفحص التزايدي منذ آخر تشغيل")
+    def generate_tasks_command(full):
+        """توليد المهام التلقائية الآن (نفس مهمة الخلفية الدورية)"""
+        from auto_tasks import run_auto_tasks
+
+        created = run_auto_tasks(full=full)
+        click.echo(f"✅ تم إنشاء {created} مهمة تلقائية")
+
+    @app.cli.command("backup-create")
+    @click.option("--mode", type=click.Choice(["full", "incremental"]), default=None, help="نوع النسخة (الافتراضي BACKUP_MODE)")
+    @click.option("--compression", type=click.Choice(["gzip", "zstd"]), default=None, help="طريقة الضغط (الافتراضي BACKUP_COMPRESSION)")
+    @click.option("--keep", default=None, type=int, help="عدد النسخ المحتفظ بها بعد الإنشاء (الافتراضي BACKUP_KEEP)")
+    def backup_create_command(mode, compression, keep):
+        """إنشاء نسخة احتياطية أثناء التشغيل دون إيقاف التطبيق"""
+        from backup import create_backup, BackupError
+
+        try:
+            entry = create_backup(compression=compression, keep=keep, mode=mode)
+        except BackupError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"📦 {entry['filename']} ({entry['kind']}): {entry['size_bytes'] / (1024 * 1024):.2f}MB "
+                   f"من {entry['raw_size_bytes'] / (1024 * 1024):.2f}MB ({entry['method']}, {entry['duration_ms']}ms)")
+        click.echo(f"📄 صفحات متغيرة: {entry['changed_pages']} من {entry['page_count']}")
+        click.echo(f"🔑 sha256: {entry['sha256']}")
+
+    @app.cli.command("backup-restore")
+    @click.option("--output", required=True, type=click.Path(dir_okay=False), help="مسار ملف قاعدة البيانات المستعادة")
+    @click.option("--backup", "filename", default=None, help="اسم النسخة في الفهرس (الافتراضي آخر نسخة)")
+    @click.option("--at", "moment", default=None, help="الاستعادة إلى نقطة زمنية: آخر نسخة قبل هذا الوقت (ISO، مثلاً 2024-05-01T18:00)")
+    def backup_restore_command(output, filename, moment):
+        """إعادة بناء قاعدة البيانات من نسخة كاملة ونسخها التزايدية في ملف منفصل (لا يلمس القاعدة الحية)"""
+        from datetime import datetime
+        from backup import get_backup, find_backup_at, list_backups, restore_backup, BackupError
+
+        if filename:
+            entry = get_backup(filename)
+        elif moment:
+            try:
+                entry = find_backup_at(datetime.fromisoformat(moment))
+            except ValueError:
+                raise click.BadParameter("صيغة الوقت غير صحيحة", param_hint="--at")
+        else:
+            entry = next(iter(list_backups()), None)
+        if entry is None:
+            raise click.ClickException("لا توجد نسخة مطابقة في الفهرس")
+
+        try:
+            chain = restore_backup(entry, output)
+        except BackupError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"🕒 النسخة: {entry['filename']} ({entry['created_at']})")
+        for name in chain:
+            click.echo(f"  ↳ {name}")
+        click.echo(f"✅ تمت الاستعادة في {output} - أوقف التطبيق واستبدل به ملف قاعدة البيانات لتفعيلها")
+
+    @app.cli.command("backup-verify")
+    @click.option("--deep", is_flag=True, help="فك الضغط ومطابقة بصمة قاعدة البيانات الخام أيضاً")
+    def backup_verify_command(deep):
+        """التحقق من بصمات كل النسخ المسجلة في الفهرس"""
+        from backup import list_backups, verify_backup
+
+        failed = 0
+        for entry in list_backups():
+            ok, message = verify_backup(entry, deep=deep)
+            failed += not ok
+            click.echo(f"  {'✅' if ok else '❌'} {entry['filename']}: {message}")
+        if failed:
+            raise SystemExit(1)
+
+    @app.cli.command("db-advise")
+    @click.option("--apply", "apply_indexes", is_flag=True, help="إنشاء الفهارس المعرفة في النماذج والناقصة من قاعدة البيانات")
+    @click.option("--verbose", is_flag=True, help="عرض خطة التنفيذ كاملة لكل استعلام")
+    def db_advise_command(apply_indexes, verbose):
+        """فحص خطط تنفيذ الاستعلامات الساخنة والإبلاغ عن المسح الكامل للجداول"""
+        from db_advisor import advise, missing_indexes, ensure_indexes
+
+        if apply_indexes:
+            for name in ensure_indexes():
+                click.echo(f"🧱 تم إنشاء الفهرس: {name}")
+        else:
+            for index in missing_indexes():
+                click.echo(f"⚠️ فهرس ناقص: {index.name} على {index.table.name} (نفّذ مع --apply)")
+
+        report = advise()
+        scans = 0
+        for entry in report:
+            if entry['error']:
+                scans += 1
+                click.echo(f"❌ {entry['name']}: تعذر التحليل - {entry['error']}")
+            elif entry['problems']:
+                scans += 1
+                click.echo(f"❌ {entry['name']}")
+                for detail in entry['problems']:
+                    click.echo(f"    {detail}")
+            else:
+                click.echo(f"✅ {entry['name']}")
+            for detail in entry['sorts']:
+                click.echo(f"    ⚠️ {detail}")
+            if verbose:
+                for detail in entry['plan']:
+                    click.echo(f"      · {detail}")
+
+        click.echo(f"📊 استعلامات بها مسح كامل أو خطأ: {scans} من أصل {len(report)}")
+        if scans:
+            raise SystemExit(1)
+
+    @app.cli.command("migrate-data")
+    @click.option("--source", default=None, help="رابط قاعدة المصدر (افتراضياً data.db في مجلد instance)")
+    @click.option("--target", default=None, help="رابط قاعدة الهدف (افتراضياً DATABASE_URL للتطبيق)")
+    @click.option("--batch-size", default=1000, show_default=True, help="عدد الصفوف في كل دفعة")
+    @click.option("--truncate", is_flag=True, help="حذف بيانات الهدف قبل النسخ")
+    def migrate_data_command(source, target, batch_size, truncate):
+        """نقل كل الجداول من SQLite إلى PostgreSQL (أو بين أي قاعدتين) على دفعات"""
+        import os
+        from models import db
+        from database import copy_database
+
+        source = source or 'sqlite:///' + os.path.join(app.instance_path, 'data.db')
+        target = target or app.config['SQLALCHEMY_DATABASE_URI']
+        if source == target:
+            raise click.UsageError("قاعدة المصدر والهدف متطابقتان - حدد --target أو DATABASE_URL")
+
+        def report(table_name, copied):
+            if copied % (batch_size * 10) == 0:
+                click.echo(f"  ⏳ {table_name}: {copied} صف")
+
+        click.echo(f"🚚 النقل من {source} إلى {target.split('@')[-1]}")
+        try:
+            stats = copy_database(db.metadata, source, target, batch_size=batch_size,
+                                  truncate=truncate, progress=report)
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        for table_name, copied in stats.items():
+            click.echo(f"📦 {table_name}: {copied} صف")
+        click.echo(f"✅ تم نقل {sum(stats.values())} صف")
+
+    @app.cli.command("db-upgrade")
+    @click.option("--to", "target", default=None, type=int, help="الترقية حتى هذا الإصدار فقط")
+    @click.option("--batch-size", default=1000, show_default=True, help="حجم دفعات تعبئة البيانات")
+    def db_upgrade_command(target, batch_size):
+        """تطبيق ترحيلات المخطط المعلقة"""
+        from models import db
+        from migrations import upgrade
+
+        applied = upgrade(db.engine, target=target, batch_size=batch_size, echo=click.echo)
+        click.echo(f"✅ تم تطبيق {len(applied)} ترحيل" if applied else "✅ قاعدة البيانات محدثة")
+
+    @app.cli.command("db-downgrade")
+    @click.option("--to", "target", required=True, type=int, help="التراجع حتى هذا الإصدار (يبقى مطبقاً)")
+    def db_downgrade_command(target):
+        """التراجع عن الترحيلات الأحدث من إصدار معين"""
+        from models import db
+        from migrations import downgrade, MigrationError
+
+        try:
+            reverted = downgrade(db.engine, target, echo=click.echo)
+        except MigrationError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"✅ تم التراجع عن {len(reverted)} ترحيل")
+
+    @app.cli.command("db-version")
+    def db_version_command():
+        """عرض إصدار المخطط الحالي والترحيلات المعلقة"""
+        from models import db
+        from migrations import discover, current_version, applied_migrations
+
+        with db.engine.connect() as connection:
+            current = current_version(connection)
+            history = {row.version: row for row in applied_migrations(connection)}
+        click.echo(f"📌 الإصدار الحالي: {current}")
+        for migration in discover():
+            row = history.get(migration.version)
+            if row is not None:
+                click.echo(f"  ✅ {migration.version:03d} {migration.description} ({row.applied_at:%Y-%m-%d %H:%M})")
+            else:
+                click.echo(f"  ⏳ {migration.version:03d} {migration.description}")
+
+    @app.cli.command("seed")
+    def seed_command():
+        """إنشاء البيانات الأساسية مرة واحدة (الحالات، التصنيفات، الإعدادات، المستخدم admin)"""
+        from models import initialize_system
+
+        if not initialize_system():
+            raise SystemExit(1)
+
+    @app.cli.command("startup-profile")
+    @click.option("--module", default="app", show_default=True, help="الوحدة التي يتم قياس استيرادها")
+    @click.option("--runs", default=3, show_default=True, help="عدد المحاولات (تؤخذ الأسرع)")
+    @click.option("--limit", default=15, show_default=True, help="عدد الوحدات المعروضة في كل قسم")
+    def startup_profile_command(module, runs, limit):
+        """قياس زمن استيراد التطبيق (python -X importtime) كما يدفعه كل عامل عند الإقلاع"""
+        from startup_profile import import_time_report
+
+        report = import_time_report(module=module, runs=runs, limit=limit)
+        click.echo(f"⏱️ استيراد {report['module']}: {report['total_ms']:.1f}ms (منها {report['own_ms']:.1f}ms في وحدات التطبيق)")
+        click.echo("📦 المكتبات الخارجية (تراكمي):")
+        for entry in report['dependencies']:
+            click.echo(f"  {entry['cumulative_ms']:8.1f}ms  {entry['module']}")
+        click.echo("🏠 وحدات التطبيق (ذاتي):")
+        for entry in report['own_modules']:
+            click.echo(f"  {entry['self_ms']:8.1f}ms  {entry['module']}")
@@ -0,0 +1,167 @@
+# ====== compression.py ======
+# خدمة ضغط الصور المرفوعة (مرفقات الطلبيات وفواتير المصاريف والنقل)
+# الرفع متعدد الملفات يُوزَّع على مجموعة عمليات محدودة بدل الضغط المتسلسل داخل خيط الطلب
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+MAX_SIZE = (1200, 1200)
+QUALITY = 85
+MIN_ATTACHMENT_SIZE = 300 * 1024  # المرفقات الأصغر من ذلك لا تُضغط
+TASK_TIMEOUT = 60
+
+# attachment: يحافظ على PNG ويعيد الأصل إذا لم يصغر الحجم
+# receipt: يحول دائماً إلى JPEG (صور فواتير)
+MODES = ('attachment', 'receipt')
+
+_EXECUTOR = {}
+_EXECUTOR_LOCK = threading.Lock()
+# fork من عملية الويب متعددة الخيوط ينسخ أقفالاً محجوزة (السجلات، مجمع الاتصالات) فقد تتجمد العملية الفرعية:
+# forkserver يبدأ العمليات من عملية نظيفة، و spawn حيث لا يتوفر (ويندوز)
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def _compress(data, mode, max_size=MAX_SIZE, quality=QUALITY):
+    """تُنفذ داخل عملية فرعية: يعيد (bytes أو None، الصيغة، التوقيتات)"""
+    from PIL import Image
+
+    timings = {}
+    started = time.perf_counter()
+
+    image = Image.open(BytesIO(data))
+    source_format = image.format
+    # draft يطلب من مفكك JPEG دقة مخفضة مباشرة (1/2، 1/4، 1/8) بدل فك الصورة كاملة
+    image.draft('RGB', max_size)
+    image.load()
+    timings['decode_ms'] = _elapsed_ms(started)
+
+    step = time.perf_counter()
+    if image.size[0] > max_size[0] or image.size[1] > max_size[1]:
+        image.thumbnail(max_size, Image.Resampling.LANCZOS)
+    timings['resize_ms'] = _elapsed_ms(step)
+
+    step = time.perf_counter()
+    output = BytesIO()
+    if mode == 'attachment' and source_format == 'PNG':
+        out_format = 'PNG'
+        image.save(output, format='PNG', optimize=True)
+    else:
+        out_format = 'JPEG'
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(output, format='JPEG', quality=quality, optimize=True)
+    timings['encode_ms'] = _elapsed_ms(step)
+    timings['total_ms'] = _elapsed_ms(started)
+
+    compressed = output.getvalue()
+    if mode == 'attachment' and len(compressed) >= len(data):
+        return None, source_format, timings
+    return compressed, out_format, timings
+
+
+def _get_executor():
+    """مجموعة العمليات تُنشأ عند أول رفع متعدد (عدد العمليات محدود)"""
+    executor = _EXECUTOR.get('pool')
+    if executor is not None:
+        return executor
+    with _EXECUTOR_LOCK:
+        executor = _EXECUTOR.get('pool')
+        if executor is None:
+            try:
+                from flask import current_app
+                workers = current_app.config.get('COMPRESSION_WORKERS')
+            except RuntimeError:
+                workers = None
+            workers = workers or min(4, os.cpu_count() or 1)
+            executor = ProcessPoolExecutor(max_workers=workers,
+                                           mp_context=multiprocessing.get_context(START_METHOD))
+            _EXECUTOR['pool'] = executor
+        return executor
+
+
+def _reset_executor():
+    executor = _EXECUTOR.pop('pool', None)
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def should_compress(data, mime_type, mode):
+    if mode == 'receipt':
+        return bool(data)
+    return len(data) >= MIN_ATTACHMENT_SIZE and (mime_type or '').startswith('image/')
+
+
+def _result(item, output, out_format, timings, wall_ms):
+    data = item['data']
+    if output is None:
+        output, mime_type = data, item.get('mime_type')
+    else:
+        mime_type = 'image/png' if out_format == 'PNG' else 'image/jpeg'
+    return {
+        'filename': item.get('filename'),
+        'data': output,
+        'mime_type': mime_type,
+        'original_size': len(data),
+        'size': len(output),
+        'compressed': output is not data,
+        'timings': dict(timings, wall_ms=wall_ms),
+    }
+
+
+def compress_uploads(items):
+    """ضغط قائمة ملفات مرفوعة مع الحفاظ على ترتيبها
+
+    كل عنصر: {'data', 'mime_type', 'filename', 'mode'}
+    يعيد لكل عنصر: البيانات النهائية ونوعها والأحجام وتوقيتات الضغط بالمللي ثانية.
+    الملف المفرد يُضغط في نفس العملية، والملفات المتعددة تُوزع على مجموعة العمليات.
+    أي فشل في ملف يعيد أصله دون ضغط.
+    """
+    results = [_result(item, None, None, {}, 0.0) for item in items]
+    pending = [index for index, item in enumerate(items)
+               if should_compress(item['data'], item.get('mime_type'), item.get('mode', 'attachment'))]
+    if not pending:
+        return results
+
+    started = time.perf_counter()
+    futures = {}
+    if len(pending) > 1:
+        try:
+            executor = _get_executor()
+            for index in pending:
+                item = items[index]
+                futures[index] = executor.submit(_compress, item['data'], item.get('mode', 'attachment'))
+        except Exception as e:
+            print(f"⚠️ تعذر استخدام مجموعة عمليات الضغط، سيتم الضغط مباشرة: {e}")
+            _reset_executor()
+            futures = {}
+
+    for index in pending:
+        item = items[index]
+        try:
+            outcome = None
+            if index in futures:
+                try:
+                    outcome = futures[index].result(timeout=TASK_TIMEOUT)
+                except BrokenProcessPool as e:
+                    print(f"❌ توقفت مجموعة عمليات الضغط، سيتم الضغط مباشرة: {e}")
+                    _reset_executor()
+            if outcome is None:
+                outcome = _compress(item['data'], item.get('mode', 'attachment'))
+            output, out_format, timings = outcome
+            results[index] = _result(item, output, out_format, timings, _elapsed_ms(started))
+        except Exception as e:
+            print(f"❌ خطأ في ضغط الصورة {item.get('filename')}: {e}")
+    return results
+
+
+def compress_upload(data, mime_type=None, filename=None, mode='attachment'):
+    """ضغط ملف واحد - واجهة مختصرة لـ compress_uploads"""
+    return compress_uploads([{'data': data, 'mime_type': mime_type, 'filename': filename, 'mode': mode}])[0]
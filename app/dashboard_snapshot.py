@@ -0,0 +1,215 @@
+# ====== dashboard_snapshot.py ======
+# لقطة لوحة التحكم: العدادات وآخر أحداث activity_event محفوظة في ذاكرة العملية
+# تُحدّث تدريجياً عند تثبيت التعديلات (زيادة/نقص العدادات وإدراج الأحداث الجديدة في مكانها)،
+# و TTL احتياطي لتعديلات العمليات الأخرى والتحديثات الجماعية التي لا تمر بالجلسة
+import threading
+import time
+from itertools import chain
+from datetime import datetime, timezone
+from flask import current_app, has_app_context
+from sqlalchemy import event, select, func, inspect
+from sqlalchemy.orm import Session
+from models import db, Order, Worker, Debt, Expense, Purchase
+from activity_stream import recent_events, on_events_committed
+
+DEFAULT_TTL_SECONDS = 120
+FEED_SIZE = 15
+
+# العدادات البسيطة: النموذج -> اسم العداد (كل إضافة +1 وكل حذف -1)
+_SIMPLE_COUNTS = {
+    Order: 'total_orders',
+    Expense: 'total_expenses',
+    Purchase: 'total_purchases',
+}
+# العدادات المشروطة: النموذج -> الحقل الذي يغير عضوية الصف (تعديله يعني إعادة العد)
+_CONDITIONAL_COUNTS = {
+    Worker: 'is_active',
+    Debt: 'status',
+}
+
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+_SNAPSHOT = {'value': None}
+_SNAPSHOT_LOCK = threading.Lock()
+_VERSION = {'value': 0}
+
+
+def _ttl():
+    if has_app_context():
+        return current_app.config.get('DASHBOARD_SNAPSHOT_TTL', DEFAULT_TTL_SECONDS)
+    return DEFAULT_TTL_SECONDS
+
+
+def as_utc(timestamp):
+    """التواريخ المخزنة في SQLite بدون منطقة زمنية تُعامل كـ UTC"""
+    if timestamp is None:
+        return None
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+
+def _sort_key(activity):
+    return activity['timestamp'] or _EPOCH
+
+
+# ========================
+# الأحداث
+# ========================
+def _activity(event):
+    """حدث activity_event بالشكل الذي تعرضه لوحة التحكم"""
+    return {
+        'key': event['id'],
+        'type': event['kind'],
+        'title': event['action'],
+        'description': event['details'],
+        'user': event['user'],
+        'timestamp': as_utc(event['timestamp']),
+    }
+
+
+def _merge(activities, new_activities):
+    """دمج أحداث جديدة مع القائمة مرتبة بالوقت الفعلي، الأحدث أولاً"""
+    by_key = {activity['key']: activity for activity in activities}
+    for activity in new_activities:
+        by_key[activity['key']] = activity
+    return sorted(by_key.values(), key=_sort_key, reverse=True)[:FEED_SIZE]
+
+
+# ========================
+# البناء من قاعدة البيانات
+# ========================
+def _load_counts():
+    """كل العدادات في استعلام واحد"""
+    def count(model, *filters):
+        return select(func.count(model.id)).where(*filters).scalar_subquery()
+
+    row = db.session.execute(select(
+        count(Order).label('total_orders'),
+        count(Worker, Worker.is_active == True).label('total_workers'),
+        count(Debt, Debt.status == 'unpaid').label('total_debts'),
+        count(Expense).label('total_expenses'),
+        count(Purchase).label('total_purchases'),
+    )).one()
+    return dict(row._mapping)
+
+
+def _load_activities():
+    """آخر FEED_SIZE حدث (مسح واحد لفهرس activity_event)"""
+    return [_activity(event) for event in recent_events(FEED_SIZE)]
+
+
+def _build():
+    return {
+        'counts': _load_counts(),
+        'activities': _load_activities(),
+        'expires_at': time.monotonic() + _ttl(),
+        'counts_stale': False,
+    }
+
+
+def get_snapshot():
+    """اللقطة الحالية (قراءة من الذاكرة)، وتُعاد بناؤها عند انتهاء مدتها أو بعد تعديل لا يمكن تطبيقه تدريجياً
+
+    تعيد {'counts': {...}, 'activities': [...]} - نسخة يمكن للمستدعي تعديلها.
+    """
+    snapshot = _SNAPSHOT['value']
+    if snapshot is None or snapshot['expires_at'] <= time.monotonic() or _ttl() <= 0:
+        version = _VERSION['value']
+        snapshot = _build()
+        with _SNAPSHOT_LOCK:
+            # لا نخزن لقطة بُنيت قبل تعديل ثُبّت أثناء البناء
+            if _VERSION['value'] == version:
+                _SNAPSHOT['value'] = snapshot
+    elif snapshot['counts_stale']:
+        version = _VERSION['value']
+        counts = _load_counts()
+        with _SNAPSHOT_LOCK:
+            if _VERSION['value'] == version and _SNAPSHOT['value'] is snapshot:
+                snapshot['counts'] = counts
+                snapshot['counts_stale'] = False
+
+    return {
+        'counts': dict(snapshot['counts']),
+        'activities': [dict(activity) for activity in snapshot['activities']],
+    }
+
+
+def invalidate_dashboard_snapshot():
+    """إسقاط اللقطة لتُبنى من جديد عند القراءة التالية"""
+    with _SNAPSHOT_LOCK:
+        _VERSION['value'] += 1
+        _SNAPSHOT['value'] = None
+
+
+# ========================
+# التحديث التدريجي عند التعديل
+# ========================
+def _pending(session):
+    return session.info.setdefault('dashboard_changes', {
+        'deltas': {},
+        'recount': False,
+    })
+
+
+def _changed(obj, attribute):
+    return inspect(obj).attrs[attribute].history.has_changes()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_dashboard_changes(session, flush_context):
+    """تسجيل تغييرات العدادات كقيم عادية (الكائنات تنتهي صلاحيتها بعد التثبيت)"""
+    for obj, delta in chain(((obj, 1) for obj in session.new), ((obj, -1) for obj in session.deleted)):
+        counter = _SIMPLE_COUNTS.get(type(obj))
+        if counter:
+            deltas = _pending(session)['deltas']
+            deltas[counter] = deltas.get(counter, 0) + delta
+        elif type(obj) in _CONDITIONAL_COUNTS:
+            _pending(session)['recount'] = True
+
+    for obj in session.dirty:
+        attribute = _CONDITIONAL_COUNTS.get(type(obj))
+        if attribute and _changed(obj, attribute):
+            _pending(session)['recount'] = True
+
+
+def _replace_snapshot(snapshot, counts=None, activities=None, recount=False):
+    """نسخة جديدة بدل التعديل في المكان: القراءات الجارية ترى لقطة متسقة"""
+    _SNAPSHOT['value'] = {
+        'counts': counts if counts is not None else snapshot['counts'],
+        'activities': activities if activities is not None else snapshot['activities'],
+        'expires_at': snapshot['expires_at'],
+        'counts_stale': snapshot['counts_stale'] or recount,
+    }
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session):
+    changes = session.info.pop('dashboard_changes', None)
+    if not changes:
+        return
+    with _SNAPSHOT_LOCK:
+        _VERSION['value'] += 1
+        snapshot = _SNAPSHOT['value']
+        if snapshot is None:
+            return
+        counts = dict(snapshot['counts'])
+        for counter, delta in changes['deltas'].items():
+            counts[counter] = max(0, counts.get(counter, 0) + delta)
+        _replace_snapshot(snapshot, counts=counts, recount=changes['recount'])
+
+
+@on_events_committed
+def _add_committed_events(events):
+    """الأحداث الجديدة تدخل القائمة حسب وقتها (activity_event للإضافة فقط، فلا حذف ولا تعديل)"""
+    with _SNAPSHOT_LOCK:
+        _VERSION['value'] += 1
+        snapshot = _SNAPSHOT['value']
+        if snapshot is None:
+            return
+        activities = [_activity(event) for event in events]
+        _replace_snapshot(snapshot, activities=_merge(snapshot['activities'], activities))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_dashboard_changes(session):
+    session.info.pop('dashboard_changes', None)
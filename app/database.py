@@ -0,0 +1,193 @@
+# ====== database.py ======
+# اختيار قاعدة البيانات من DATABASE_URL (SQLite افتراضياً أو PostgreSQL) وضبط مجمع الاتصالات
+# مع SQLite: كل اتصال جديد يمر بـ _apply_pragmas (WAL، مهلة القفل، mmap والذاكرة المؤقتة)
+import os
+import sqlite3
+from sqlalchemy import event, create_engine, inspect, select, text, Integer
+
+DEFAULT_DATABASE_URI = 'sqlite:///data.db'
+
+# القيم الافتراضية - كل منها يمكن تغييره بمتغير بيئة بنفس الاسم
+SQLITE_DEFAULTS = {
+    'SQLITE_JOURNAL_MODE': 'WAL',            # القراء لا يحجبون الكاتب والعكس
+    'SQLITE_SYNCHRONOUS': 'NORMAL',          # آمن مع WAL وأسرع بكثير من FULL
+    'SQLITE_BUSY_TIMEOUT_MS': 10000,         # انتظار تحرر القفل بدل "database is locked" فوراً
+    'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,   # قراءة الصفحات عبر mmap
+    'SQLITE_CACHE_SIZE_KB': 64 * 1024,       # ذاكرة مؤقتة للصفحات لكل اتصال
+    'SQLITE_TEMP_STORE': 'MEMORY',           # الجداول والفهارس المؤقتة في الذاكرة
+}
+
+# مجمع الاتصالات (لكل عملية) - يطبق على SQLite و PostgreSQL
+POOL_DEFAULTS = {
+    'DB_POOL_SIZE': 10,
+    'DB_MAX_OVERFLOW': 10,
+    'DB_POOL_TIMEOUT': 30,
+    'DB_POOL_RECYCLE': 1800,                 # PostgreSQL فقط: تجديد الاتصالات قبل أن يغلقها الخادم
+}
+
+# pragmas تُعرض في فحص الصحة
+REPORTED_PRAGMAS = (
+    'journal_mode', 'synchronous', 'busy_timeout', 'mmap_size',
+    'cache_size', 'temp_store', 'foreign_keys', 'wal_autocheckpoint'
+)
+
+
+def resolve_database_uri(default=DEFAULT_DATABASE_URI):
+    """رابط قاعدة البيانات من DATABASE_URL، مع قبول الصيغة القديمة postgres://"""
+    uri = os.environ.get('DATABASE_URL') or default
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def configure_database(app):
+    """إعداد خيارات المحرك قبل db.init_app (المجمع ومهلة الاتصال)"""
+    for key, default in {**SQLITE_DEFAULTS, **POOL_DEFAULTS}.items():
+        value = os.environ.get(key, default)
+        app.config.setdefault(key, type(default)(value))
+
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI', '')
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+
+    if uri.startswith('postgresql'):
+        options.setdefault('pool_size', app.config['DB_POOL_SIZE'])
+        options.setdefault('max_overflow', app.config['DB_MAX_OVERFLOW'])
+        options.setdefault('pool_timeout', app.config['DB_POOL_TIMEOUT'])
+        options.setdefault('pool_recycle', app.config['DB_POOL_RECYCLE'])
+        # اكتشاف الاتصالات المقطوعة (إعادة تشغيل الخادم، انقطاع الشبكة) قبل استخدامها
+        options.setdefault('pool_pre_ping', True)
+        return
+
+    if not uri.startswith('sqlite'):
+        return
+
+    connect_args = options.setdefault('connect_args', {})
+    # مهلة مكتبة sqlite3 بالثواني - تطابق busy_timeout
+    connect_args.setdefault('timeout', app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000)
+    # الاتصالات تتنقل بين خيوط الطلبات والمنفذ الخلفي عبر المجمع
+    connect_args.setdefault('check_same_thread', False)
+    if ':memory:' not in uri and uri not in ('sqlite://', 'sqlite:///'):
+        options.setdefault('pool_size', app.config['DB_POOL_SIZE'])
+        options.setdefault('max_overflow', app.config['DB_MAX_OVERFLOW'])
+        options.setdefault('pool_timeout', app.config['DB_POOL_TIMEOUT'])
+
+
+def _pragma_statements(config):
+    return [
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        # القيمة السالبة تعني الحجم بالكيلوبايت بدل عدد الصفحات
+        f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KB'])}",
+        f"PRAGMA temp_store={config['SQLITE_TEMP_STORE']}",
+    ]
+
+
+def init_sqlite_tuning(app, db):
+    """ربط تطبيق الـ pragmas بكل اتصال جديد في محرك التطبيق (بعد db.init_app)"""
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != 'sqlite':
+            return
+        statements = _pragma_statements(app.config)
+
+        @event.listens_for(engine, "connect")
+        def _apply_pragmas(dbapi_connection, connection_record):
+            if not isinstance(dbapi_connection, sqlite3.Connection):
+                return
+            cursor = dbapi_connection.cursor()
+            try:
+                for statement in statements:
+                    cursor.execute(statement)
+            finally:
+                cursor.close()
+
+
+def get_database_health(db):
+    """حالة قاعدة البيانات: الـ pragmas الفعالة على اتصال من المجمع وحالة المجمع"""
+    engine = db.engine
+    health = {
+        'dialect': engine.dialect.name,
+        'pool': engine.pool.status(),
+    }
+    with engine.connect() as connection:
+        connection.exec_driver_sql("SELECT 1")
+        if engine.dialect.name == 'postgresql':
+            health['server_version'] = connection.exec_driver_sql("SHOW server_version").scalar()
+        if engine.dialect.name == 'sqlite':
+            pragmas = {}
+            for name in REPORTED_PRAGMAS:
+                row = connection.exec_driver_sql(f"PRAGMA {name}").fetchone()
+                pragmas[name] = row[0] if row else None
+            health['pragmas'] = pragmas
+    health['ok'] = True
+    return health
+
+
+# ========================
+# نقل البيانات بين قاعدتين (مثلاً من data.db إلى PostgreSQL)
+# ========================
+def _reset_sequences(connection, tables):
+    """بعد إدراج المعرفات صراحة يجب تقديم تسلسلات PostgreSQL إلى ما بعد أكبر معرف"""
+    preparer = connection.dialect.identifier_preparer
+    for table in tables:
+        primary_key = list(table.primary_key.columns)
+        if len(primary_key) != 1 or not isinstance(primary_key[0].type, Integer):
+            continue
+        table_name = preparer.format_table(table)
+        column_name = preparer.quote(primary_key[0].name)
+        connection.execute(text(
+            f"SELECT setval(pg_get_serial_sequence(:table_name, :column_name), "
+            f"COALESCE((SELECT MAX({column_name}) FROM {table_name}), 0) + 1, false)"
+        ), {'table_name': table_name, 'column_name': primary_key[0].name})
+
+
+def copy_database(metadata, source_url, target_url, batch_size=1000, truncate=False, progress=None):
+    """نسخ كل جداول النماذج من قاعدة المصدر إلى قاعدة الهدف على دفعات
+
+    - المخطط في الهدف يُنشأ من النماذج، والجداول تُنسخ بترتيب المفاتيح الأجنبية
+    - المصدر يُقرأ بالبث (batch_size صف في كل مرة) فلا تُحمّل الجداول في الذاكرة
+    - الأعمدة غير الموجودة في مصدر قديم تأخذ قيمها الافتراضية
+    - النسخ كله معاملة واحدة في الهدف: أي فشل يلغي النقل بالكامل
+    """
+    source = create_engine(source_url)
+    target = create_engine(target_url)
+    stats = {}
+    try:
+        metadata.create_all(target)
+        source_inspector = inspect(source)
+        source_tables = set(source_inspector.get_table_names())
+        tables = metadata.sorted_tables
+
+        with target.begin() as target_connection:
+            if truncate:
+                for table in reversed(tables):
+                    target_connection.execute(table.delete())
+            else:
+                for table in tables:
+                    if target_connection.execute(select(table).limit(1)).first() is not None:
+                        raise RuntimeError(f"الجدول {table.name} في قاعدة الهدف ليس فارغاً (استخدم --truncate)")
+
+            with source.connect() as source_connection:
+                for table in tables:
+                    if table.name not in source_tables:
+                        continue
+                    source_columns = {column['name'] for column in source_inspector.get_columns(table.name)}
+                    columns = [column for column in table.columns if column.name in source_columns]
+                    result = source_connection.execution_options(yield_per=batch_size)\
+                        .execute(select(*columns).order_by(*table.primary_key.columns))
+                    copied = 0
+                    for rows in result.partitions():
+                        target_connection.execute(table.insert(), [dict(row._mapping) for row in rows])
+                        copied += len(rows)
+                        if progress:
+                            progress(table.name, copied)
+                    stats[table.name] = copied
+
+            if target.dialect.name == 'postgresql':
+                _reset_sequences(target_connection, tables)
+        return stats
+    finally:
+        source.dispose()
+        target.dispose()
@@ -0,0 +1,144 @@
+# ====== db_advisor.py ======
+# مستشار الفهارس: يشغّل EXPLAIN QUERY PLAN على الاستعلامات الساخنة في التطبيق
+# ويبلّغ عن أي مسح كامل لجدول، مع إنشاء الفهارس المعرّفة في النماذج والناقصة من قاعدة قديمة
+from datetime import datetime, timedelta
+from sqlalchemy import inspect, select, func, tuple_
+from models import (
+    db, Order, OrderHistory, OrderAssignment, Expense, Transport, Debt, Task, ActivityEvent, now_utc
+)
+
+# المسح باستخدام فهرس ليس مشكلة - المشكلة في SCAN بدون فهرس
+_INDEXED_SCAN_MARKERS = ('USING INDEX', 'USING COVERING INDEX', 'USING INTEGER PRIMARY KEY')
+# صفحات بعد المؤشر يجب أن تبدأ من موضعه في الفهرس (SEARCH): مسح الفهرس من أوله يكلف مثل OFFSET
+_SEEK_SUFFIX = '.after_cursor'
+
+
+def query_catalogue():
+    """الاستعلامات الفعلية الأكثر تنفيذاً في المسارات والمهام الخلفية: (الاسم، الاستعلام)"""
+    today = now_utc().date()
+    cursor_at = datetime(today.year, today.month, 1)  # موضع مؤشر في منتصف القائمة
+    return [
+        ('debts.unpaid_by_source', select(Debt).where(
+            Debt.status == 'unpaid', Debt.source_type == 'expense', Debt.source_id == 1)),
+        ('debts.overdue', select(Debt).where(
+            Debt.status == 'unpaid', Debt.start_date < today - timedelta(days=30))),
+        ('expenses.by_order', select(Expense).where(Expense.order_id == 1)),
+        ('transport.by_order', select(Transport).where(Transport.order_id == 1)),
+        ('order_history.by_order', select(OrderHistory).where(OrderHistory.order_id == 1)
+            .order_by(OrderHistory.timestamp.desc())),
+        ('tasks.urgent', select(Task).where(
+            Task.status.in_(['pending', 'in_progress']),
+            Task.priority.in_(['high', 'critical'])
+        ).order_by(Task.priority.desc(), Task.due_date.asc()).limit(10)),
+        ('tasks.overdue', select(func.count(Task.id)).where(
+            Task.status == 'pending', Task.due_date < today)),
+        ('tasks.by_entity', select(Task.id).where(
+            Task.related_entity_type == 'order', Task.related_entity_id == 1,
+            Task.status.in_(['pending', 'in_progress']))),
+        ('orders.paid_since', select(func.count(Order.id)).where(
+            Order.is_paid == True, Order.created_at >= datetime(today.year, today.month, 1))),
+        ('assignments.active_by_order', select(OrderAssignment).where(
+            OrderAssignment.order_id == 1, OrderAssignment.is_active == True)),
+        ('assignments.active_by_worker', select(OrderAssignment).where(
+            OrderAssignment.worker_id == 1, OrderAssignment.is_active == True)),
+        # صفحات القوائم (pagination.keyset_paginate)
+        ('orders.unpaid_page', select(Order).where(Order.is_paid == False)
+            .order_by(Order.created_at.desc().nulls_last(), Order.id.desc()).limit(26)),
+        ('expenses.page', select(Expense)
+            .order_by(Expense.created_at.desc().nulls_last(), Expense.id.desc()).limit(26)),
+        ('debts.page', select(Debt)
+            .order_by(Debt.created_at.desc().nulls_last(), Debt.id.desc()).limit(26)),
+        ('expenses.page.after_cursor', select(Expense)
+            .where(tuple_(Expense.created_at, Expense.id) < tuple_(cursor_at, 1000))
+            .order_by(Expense.created_at.desc().nulls_last(), Expense.id.desc()).limit(26)),
+        ('debts.page.after_cursor', select(Debt)
+            .where(tuple_(Debt.created_at, Debt.id) < tuple_(cursor_at, 1000))
+            .order_by(Debt.created_at.desc().nulls_last(), Debt.id.desc()).limit(26)),
+        # صفحة الأحداث وقائمة لوحة التحكم (activity_stream)
+        ('activity.page', select(ActivityEvent)
+            .order_by(ActivityEvent.timestamp.desc(), ActivityEvent.id.desc()).limit(26)),
+        ('activity.by_kind_page', select(ActivityEvent).where(ActivityEvent.kind == 'payment')
+            .order_by(ActivityEvent.timestamp.desc(), ActivityEvent.id.desc()).limit(26)),
+        ('activity.by_user_page', select(ActivityEvent).where(ActivityEvent.user == 'admin')
+            .order_by(ActivityEvent.timestamp.desc(), ActivityEvent.id.desc()).limit(26)),
+        ('activity.page.after_cursor', select(ActivityEvent)
+            .where(tuple_(ActivityEvent.timestamp, ActivityEvent.id) < tuple_(cursor_at, 1000))
+            .order_by(ActivityEvent.timestamp.desc(), ActivityEvent.id.desc()).limit(26)),
+    ]
+
+
+def explain(statement):
+    """خطة تنفيذ SQLite للاستعلام كقائمة أسطر"""
+    compiled = statement.compile(dialect=db.engine.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.construct_params()
+    if compiled.positiontup:
+        params = tuple(params[name] for name in compiled.positiontup)
+    with db.engine.connect() as connection:
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def _is_full_scan(detail):
+    return detail.startswith('SCAN ') and not any(marker in detail for marker in _INDEXED_SCAN_MARKERS)
+
+
+def _plan_problems(name, plan):
+    """المسح الكامل دائماً، وأي SCAN لاستعلام صفحة بعد المؤشر"""
+    if name.endswith(_SEEK_SUFFIX):
+        return [detail for detail in plan if detail.startswith('SCAN ')]
+    return [detail for detail in plan if _is_full_scan(detail)]
+
+
+# ========================
+# الفهارس المعرفة في النماذج
+# ========================
+def missing_indexes():
+    """الفهارس المعرفة في النماذج وغير الموجودة في قاعدة البيانات (قواعد أنشئت قبل إضافتها)"""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables or not table.indexes:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend(index for index in table.indexes if index.name not in existing)
+    return missing
+
+
+def ensure_indexes():
+    """إنشاء الفهارس الناقصة ثم تحديث إحصائيات المخطِّط، يعيد أسماء الفهارس المنشأة"""
+    created = []
+    indexes = missing_indexes()
+    with db.engine.begin() as connection:
+        for index in indexes:
+            index.create(bind=connection, checkfirst=True)
+            created.append(index.name)
+        if created and db.engine.dialect.name == 'sqlite':
+            connection.exec_driver_sql("ANALYZE")
+    return created
+
+
+def advise():
+    """تقرير لكل استعلام في الكتالوج: خطة التنفيذ، أسطر المسح الكامل، والترتيب المؤقت
+
+    الترتيب المؤقت (USE TEMP B-TREE) يُعرض كتنبيه فقط، فهو رخيص إذا سبقه بحث بفهرس.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        raise RuntimeError("مستشار الفهارس يدعم SQLite فقط (EXPLAIN QUERY PLAN)")
+
+    report = []
+    for name, statement in query_catalogue():
+        error = None
+        try:
+            plan = explain(statement)
+        except Exception as e:
+            error = str(e).splitlines()[0]
+            plan = []
+        report.append({
+            'name': name,
+            'plan': plan,
+            'problems': _plan_problems(name, plan),
+            'sorts': [detail for detail in plan if 'USE TEMP B-TREE' in detail],
+            'error': error,
+        })
+    return report
@@ -0,0 +1,164 @@
+# ====== delivery.py ======
+# تسليم المرفقات والفواتير للمتصفح: بث على أجزاء، طلبات Range، و ETag/304
+import hashlib
+import uuid
+from datetime import timezone
+from io import BytesIO
+from urllib.parse import quote
+from flask import request, Response
+from werkzeug.http import http_date
+from blob_store import get_blob_store, CHUNK_SIZE
+
+MAX_RANGES = 16  # أكثر من ذلك نرسل الملف كاملاً بدل عشرات الأجزاء
+
+
+def _content_disposition(disposition, filename):
+    """ترويسة Content-Disposition آمنة للأسماء العربية"""
+    if not filename:
+        return disposition
+    try:
+        filename.encode('latin-1')
+        return f'{disposition}; filename="{filename}"'
+    except UnicodeEncodeError:
+        return f"{disposition}; filename*=UTF-8''{quote(filename)}"
+
+
+def _as_utc(value):
+    """SQLite يعيد تواريخ بدون منطقة زمنية - نعتبرها UTC ونحذف الأجزاء من الثانية"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.replace(microsecond=0)
+
+
+def _stream(opener, start, end):
+    """قراءة البايتات [start, end) على أجزاء دون تحميل الملف كاملاً"""
+    with opener() as handle:
+        handle.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = handle.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _resolve_ranges(size):
+    """تحويل ترويسة Range إلى قائمة [(start, end)] صالحة
+
+    يعيد None إذا لم يكن هناك طلب جزئي قابل للتطبيق، وقائمة فارغة إذا كانت
+    كل الأجزاء خارج حدود الملف (416).
+    """
+    range_header = request.range
+    if range_header is None or range_header.units != 'bytes':
+        return None
+    if len(range_header.ranges) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for start, end in range_header.ranges:
+        if start < 0:
+            # bytes=-N : آخر N بايت
+            start = max(0, size + start)
+            end = size
+        else:
+            end = size if end is None else min(end, size)
+        if start < end:
+            ranges.append((start, end))
+    return ranges
+
+
+def _if_range_matches(etag, last_modified):
+    """If-Range: لا نرسل جزءاً إلا إذا لم يتغير المحتوى"""
+    if_range = request.if_range
+    if if_range.etag:
+        return if_range.etag == etag
+    if if_range.date:
+        return last_modified is not None and last_modified <= _as_utc(if_range.date)
+    return True
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag) or request.if_none_match.star_tag
+    if request.if_modified_since and last_modified is not None:
+        return last_modified <= _as_utc(request.if_modified_since)
+    return False
+
+
+def send_content(content_hash, legacy_data=None, mimetype=None, filename=None,
+                 as_attachment=False, last_modified=None):
+    """إرسال محتوى مرفق أو فاتورة
+
+    - البث من مخزن الملفات على أجزاء (أو من البايتات القديمة إن لم يُرحّل الصف)
+    - ETag قوي من بصمة المحتوى و Last-Modified من تاريخ الرفع
+    - 304 للطلبات الشرطية، و 206 لطلبات Range المفردة والمتعددة
+    """
+    mimetype = mimetype or 'application/octet-stream'
+    if content_hash:
+        store = get_blob_store()
+        size = store.size(content_hash)
+        opener = lambda: store.open(content_hash)
+        etag = content_hash
+    else:
+        data = legacy_data or b''
+        size = len(data)
+        opener = lambda: BytesIO(data)
+        etag = hashlib.sha256(data).hexdigest()
+
+    last_modified = _as_utc(last_modified)
+    headers = {
+        'ETag': f'"{etag}"',
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'private, no-cache',
+        'Content-Disposition': _content_disposition('attachment' if as_attachment else 'inline', filename),
+    }
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+
+    if _not_modified(etag, last_modified):
+        return Response(status=304, headers=headers)
+
+    ranges = _resolve_ranges(size) if _if_range_matches(etag, last_modified) else None
+
+    if ranges == []:
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status=416, headers=headers)
+
+    if not ranges:
+        headers['Content-Length'] = str(size)
+        return Response(_stream(opener, 0, size), status=200, mimetype=mimetype,
+                        headers=headers, direct_passthrough=True)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+        headers['Content-Length'] = str(end - start)
+        return Response(_stream(opener, start, end), status=206, mimetype=mimetype,
+                        headers=headers, direct_passthrough=True)
+
+    # عدة أجزاء: multipart/byteranges
+    boundary = uuid.uuid4().hex
+    part_headers = [
+        (f'--{boundary}\r\nContent-Type: {mimetype}\r\n'
+         f'Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n').encode('latin-1')
+        for start, end in ranges
+    ]
+    closing = f'\r\n--{boundary}--\r\n'.encode('latin-1')
+    length = sum(len(head) + (end - start) + 2 for head, (start, end) in zip(part_headers, ranges))
+    length += len(closing) - 2
+
+    def generate():
+        for index, (head, (start, end)) in enumerate(zip(part_headers, ranges)):
+            if index:
+                yield b'\r\n'
+            yield head
+            yield from _stream(opener, start, end)
+        yield closing
+
+    headers['Content-Length'] = str(length)
+    return Response(generate(), status=206, headers=headers,
+                    content_type=f'multipart/byteranges; boundary={boundary}',
+                    direct_passthrough=True)
@@ -0,0 +1,324 @@
+# ====== derivatives.py ======
+# توليد النسخ المصغرة (thumb) ونسخ المعاينة (preview) للمرفقات والفواتير في الخلفية
+import os
+import shutil
+import subprocess
+import tempfile
+from functools import lru_cache
+from io import BytesIO
+from sqlalchemy.orm import undefer
+from models import db, OrderAttachment, ExpenseReceipt, TransportReceipt, AttachmentDerivative
+from blob_store import get_blob_store, store_upload, CHUNK_SIZE
+from jobs import job_handler, enqueue
+
+# نوع المالك -> (النموذج، عمود البايتات القديم)
+OWNER_MODELS = {
+    'attachment': (OrderAttachment, 'file_data'),
+    'expense_receipt': (ExpenseReceipt, 'image_data'),
+    'transport_receipt': (TransportReceipt, 'image_data'),
+}
+
+RENDITIONS = {
+    'preview': (1280, 1280),
+    'thumb': (320, 240),
+}
+
+VIDEO_FRAME_SECONDS = 1
+FFMPEG_TIMEOUT = 60
+
+
+def _media_kind(owner_type, owner):
+    """image / video / None حسب نوع الملف"""
+    if owner_type == 'attachment' and owner.file_type in ('image', 'video'):
+        return owner.file_type
+    mime_type = owner.mime_type or ''
+    if mime_type.startswith('image/'):
+        return 'image'
+    if mime_type.startswith('video/'):
+        return 'video'
+    return None
+
+
+@lru_cache(maxsize=1)
+def _output_format():
+    """WebP إن كان Pillow يدعمه، وإلا JPEG"""
+    from PIL import features
+    if features.check('webp'):
+        return 'WEBP', 'image/webp'
+    return 'JPEG', 'image/jpeg'
+
+
+# ========================
+# إضافة المهام والاستعلام
+# ========================
+def enqueue_derivatives(owner_type, owner_id):
+    """جدولة توليد النسخ المصغرة لمرفق أو فاتورة"""
+    return enqueue('derivatives', {'owner_type': owner_type, 'owner_id': owner_id})
+
+
+def get_derivative(owner_type, owner_id, rendition='thumb'):
+    return AttachmentDerivative.query.filter_by(
+        owner_type=owner_type, owner_id=owner_id, rendition=rendition
+    ).first()
+
+
+def delete_derivatives(owner_type, owner_id):
+    """حذف سجلات النسخ المصغرة (المحتوى نفسه يُنظف بأمر blobs-gc)"""
+    AttachmentDerivative.query.filter_by(owner_type=owner_type, owner_id=owner_id)\
+        .delete(synchronize_session=False)
+
+
+def prune_orphan_derivatives():
+    """حذف النسخ المصغرة لمرفقات أو فواتير لم تعد موجودة (مثلاً بعد حذف طلبية)"""
+    removed = 0
+    for owner_type, (model, _) in OWNER_MODELS.items():
+        removed += AttachmentDerivative.query\
+            .filter(AttachmentDerivative.owner_type == owner_type,
+                    ~AttachmentDerivative.owner_id.in_(db.session.query(model.id)))\
+            .delete(synchronize_session=False)
+    db.session.commit()
+    return removed
+
+
+# ========================
+# التوليد
+# ========================
+def _extract_video_frame(owner, legacy_column):
+    """استخراج إطار من الفيديو عبر ffmpeg إن كان مثبتاً، يعيد بايتات PNG أو None"""
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        return None
+
+    fd, source_path = tempfile.mkstemp(suffix='.video')
+    try:
+        with os.fdopen(fd, 'wb') as target:
+            if owner.content_hash:
+                with get_blob_store().open(owner.content_hash) as source:
+                    shutil.copyfileobj(source, target, CHUNK_SIZE)
+            else:
+                target.write(getattr(owner, legacy_column) or b'')
+
+        for offset in (VIDEO_FRAME_SECONDS, 0):
+            result = subprocess.run(
+                [ffmpeg, '-v', 'error', '-ss', str(offset), '-i', source_path,
+                 '-frames:v', '1', '-f', 'image2pipe', '-vcodec', 'png', 'pipe:1'],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=FFMPEG_TIMEOUT
+            )
+            if result.returncode == 0 and result.stdout:
+                return result.stdout
+        return None
+    finally:
+        os.remove(source_path)
+
+
+def _render(image, size):
+    """تصغير الصورة وحفظها بالصيغة المعتمدة، يعيد (bytes, width, height)"""
+    from PIL import Image
+
+    rendition = image.copy()
+    rendition.thumbnail(size, Image.Resampling.LANCZOS)
+    pil_format, _ = _output_format()
+    output = BytesIO()
+    if pil_format == 'WEBP':
+        rendition.save(output, format=pil_format, quality=80, method=4)
+    else:
+        rendition.save(output, format=pil_format, quality=80, optimize=True)
+    return output.getvalue(), rendition.width, rendition.height
+
+
+@job_handler('derivatives')
+def generate_derivatives(owner_type, owner_id):
+    """توليد thumb و preview وحفظهما في المخزن - آمن لإعادة التنفيذ"""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    model, legacy_column = OWNER_MODELS[owner_type]
+    owner = model.query.options(undefer(getattr(model, legacy_column))).get(owner_id)
+    if owner is None:
+        return  # حُذف قبل تنفيذ المهمة
+
+    kind = _media_kind(owner_type, owner)
+    if kind == 'video':
+        source = _extract_video_frame(owner, legacy_column)
+        if source is None:
+            print(f"⚠️ تعذر استخراج إطار من الفيديو {owner_type}#{owner_id} (ffmpeg غير متوفر؟)")
+            return
+    elif kind == 'image':
+        if owner.content_hash:
+            source = get_blob_store().read(owner.content_hash)
+        else:
+            source = getattr(owner, legacy_column)
+    else:
+        return
+
+    try:
+        image = Image.open(BytesIO(source))
+        # draft يجعل فك ترميز JPEG يتم مباشرة بدقة أقل - أسرع بكثير للصور الكبيرة
+        image.draft('RGB', RENDITIONS['preview'])
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+    except (UnidentifiedImageError, OSError) as e:
+        # ملف تالف أو غير مدعوم - إعادة المحاولة لن تفيد
+        print(f"⚠️ لا يمكن قراءة صورة {owner_type}#{owner_id}: {e}")
+        return
+
+    _, mime_type = _output_format()
+    delete_derivatives(owner_type, owner_id)
+    for rendition, size in RENDITIONS.items():
+        data, width, height = _render(image, size)
+        db.session.add(AttachmentDerivative(
+            owner_type=owner_type,
+            owner_id=owner_id,
+            rendition=rendition,
+            mime_type=mime_type,
+            width=width,
+            height=height,
+            file_size=len(data),
+            content_hash=store_upload(data)
+        ))
+    db.session.commit()
+
+
+def backfill_derivatives(batch_size=200, force=False):
+    """جدولة التوليد للصفوف القديمة التي لا تملك نسخاً مصغرة"""
+    queued = {}
+    for owner_type, (model, _) in OWNER_MODELS.items():
+        count = 0
+        last_id = 0
+        while True:
+            query = model.query.filter(model.id > last_id)
+            if owner_type == 'attachment':
+                query = query.filter(model.file_type.in_(('image', 'video')))
+            if not force:
+                has_thumb = db.session.query(AttachmentDerivative.id).filter(
+                    AttachmentDerivative.owner_type == owner_type,
+                    AttachmentDerivative.owner_id == model.id,
+                    AttachmentDerivative.rendition == 'thumb'
+                ).exists()
+                query = query.filter(~has_thumb)
+            owners = query.order_by(model.id).limit(batch_size).all()
+            if not owners:
+                break
+            for owner in owners:
+                if _media_kind(owner_type, owner):
+                    enqueue_derivatives(owner_type, owner.id)
+                    count += 1
+            last_id = owners[-1].id
+            db.session.commit()
+        queued[owner_type] = count
+    return queued
+
+
+# ========================
+# الصورة الافتراضية قبل جاهزية النسخة المصغرة
+# ========================
+@lru_cache(maxsize=16)
+def generate_default_thumbnail(file_type, size=(200, 150)):
+    """إنشاء صورة مصغرة افتراضية حسب نوع الملف"""
+    from PIL import Image, ImageDraw, ImageFont
+    import io
+    
+    try:
+        # ألوان حسب نوع الملف
+        colors = {
+            'video': (41, 128, 185),     # أزرق
+            'image': (39, 174, 96),      # أخضر
+            'pdf': (231, 76, 60),        # أحمر
+            'document': (52, 152, 219),  # أزرق فاتح
+            'other': (149, 165, 166)     # رمادي
+        }
+        
+        color = colors.get(file_type, (149, 165, 166))
+        
+        # إنشاء الصورة
+        img = Image.new('RGB', size, color)
+        draw = ImageDraw.Draw(img)
+        
+        # إضافة أيقونة
+        icons = {
+            'video': '▶',
+            'image': '🖼️',
+            'pdf': '📄',
+            'document': '📝',
+            'other': '📎'
+        }
+        
+        icon = icons.get(file_type, '📎')
+        
+        try:
+            # محاولة استخدام خط كبير للأيقونة
+            font = ImageFont.truetype("arial.ttf", 40)
+        except:
+            font = ImageFont.load_default()
+        
+        # رسم الأيقونة
+        bbox = draw.textbbox((0, 0), icon, font=font)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+        
+        x = (size[0] - text_width) // 2
+        y = (size[1] - text_height) // 2 - 10
+        
+        draw.text((x, y), icon, fill=(255, 255, 255), font=font)
+        
+        # إضافة نص نوع الملف
+        type_names = {
+            'video': 'فيديو',
+            'image': 'صورة',
+            'pdf': 'PDF',
+            'document': 'مستند',
+            'other': 'ملف'
+        }
+        
+        type_name = type_names.get(file_type, 'ملف')
+        
+        try:
+            small_font = ImageFont.truetype("arial.ttf", 16)
+        except:
+            small_font = ImageFont.load_default()
+        
+        bbox_small = draw.textbbox((0, 0), type_name, font=small_font)
+        text_width_small = bbox_small[2] - bbox_small[0]
+        
+        x_small = (size[0] - text_width_small) // 2
+        y_small = y + text_height + 5
+        
+        draw.text((x_small, y_small), type_name, fill=(255, 255, 255), font=small_font)
+        
+        # حفظ الصورة
+        output = io.BytesIO()
+        img.save(output, format='JPEG', quality=85)
+        return output.getvalue()
+        
+    except Exception as e:
+        print(f"❌ خطأ في إنشاء الصورة الافتراضية: {e}")
+        # صورة بديلة بسيطة
+        img = Image.new('RGB', size, (200, 200, 200))
+        output = io.BytesIO()
+        img.save(output, format='JPEG')
+        return output.getvalue()
+
+
+def send_thumbnail(owner_type, owner_id, rendition, file_type):
+    """إرسال النسخة المولدة مسبقاً، أو صورة افتراضية صغيرة إن لم تجهز بعد"""
+    from flask import Response
+    from delivery import send_content
+
+    derivative = get_derivative(owner_type, owner_id, rendition)
+    if derivative is not None:
+        extension = 'webp' if derivative.mime_type == 'image/webp' else 'jpg'
+        return send_content(
+            derivative.content_hash,
+            mimetype=derivative.mime_type,
+            filename=f"{rendition}_{owner_id}.{extension}",
+            last_modified=derivative.created_at
+        )
+
+    return Response(
+        generate_default_thumbnail(file_type),
+        mimetype='image/jpeg',
+        headers={
+            "Content-Disposition": f"inline; filename={rendition}_{owner_id}.jpg",
+            "Cache-Control": "no-store"  # النسخة الحقيقية ستجهز قريباً
+        }
+    )
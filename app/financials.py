@@ -0,0 +1,377 @@
+# ====== financials.py ======
+# محرك الحسابات المالية للطلبيات: يحسب المصاريف والنقل والديون المرتبطة
+# والتكاليف والربح لأي مجموعة من الطلبيات بعدد ثابت من استعلامات التجميع
+from flask import g, has_app_context
+from itertools import chain
+from sqlalchemy import select, func, and_, event, inspect, insert, delete, case
+from sqlalchemy.orm import Session
+from models import db, Order, Expense, Transport, Debt, OrderFinancials, BackgroundJob, now_utc
+from jobs import job_handler
+
+# حد عدد المعرفات في كل جملة IN (حد SQLite الافتراضي للمعاملات 999)
+CHUNK_SIZE = 500
+# مهمة خلفية تعيد حساب صفوف الملخص التي فشل تحديثها أثناء الكتابة
+REPAIR_JOB = 'refresh_order_financials'
+
+
+def _empty_financials(total=0.0):
+    return {
+        'total_expenses': 0.0,
+        'total_transports': 0.0,
+        'expense_debts': 0.0,
+        'transport_debts': 0.0,
+        'total_related_debts': 0.0,
+        'total_costs': 0.0,
+        'profit': float(total or 0),
+    }
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def _grouped_sums(connection, order_ids):
+    """تنفيذ استعلامات التجميع الأربعة وإرجاع النتائج حسب الطلبية"""
+    debt_remaining = func.sum(Debt.debt_amount - Debt.paid_amount)
+
+    def statements(id_filter):
+        yield 'total_expenses', select(Expense.order_id, func.sum(Expense.total_amount))\
+            .where(Expense.order_id.isnot(None), *id_filter(Expense.order_id))\
+            .group_by(Expense.order_id)
+
+        yield 'total_transports', select(Transport.order_id, func.sum(Transport.transport_amount))\
+            .where(Transport.order_id.isnot(None), *id_filter(Transport.order_id))\
+            .group_by(Transport.order_id)
+
+        yield 'expense_debts', select(Expense.order_id, debt_remaining)\
+            .select_from(Debt)\
+            .join(Expense, and_(Debt.source_type == 'expense', Debt.source_id == Expense.id))\
+            .where(Debt.status == 'unpaid', Expense.order_id.isnot(None), *id_filter(Expense.order_id))\
+            .group_by(Expense.order_id)
+
+        yield 'transport_debts', select(Transport.order_id, debt_remaining)\
+            .select_from(Debt)\
+            .join(Transport, and_(Debt.source_type == 'transport', Debt.source_id == Transport.id))\
+            .where(Debt.status == 'unpaid', Transport.order_id.isnot(None), *id_filter(Transport.order_id))\
+            .group_by(Transport.order_id)
+
+    sums = {}
+    if order_ids is None:
+        batches = [lambda column: ()]
+    else:
+        batches = [lambda column, chunk=chunk: (column.in_(chunk),) for chunk in _chunks(order_ids)]
+
+    for id_filter in batches:
+        for key, statement in statements(id_filter):
+            for order_id, value in connection.execute(statement):
+                sums.setdefault(order_id, {})[key] = float(value or 0)
+    return sums
+
+
+def compute_order_financials(order_ids=None, connection=None):
+    """حساب الملخص المالي لمجموعة طلبيات (أو لكل الطلبيات إذا كانت order_ids=None)
+
+    يرجع قاموساً {order_id: {...}} يحتوي على إجمالي المصاريف والنقل
+    والديون المرتبطة والتكاليف والربح.
+    """
+    if order_ids is not None:
+        order_ids = {int(order_id) for order_id in order_ids if order_id is not None}
+        if not order_ids:
+            return {}
+
+    if connection is None:
+        connection = db.session
+
+    # إجمالي الطلبيات لحساب الربح
+    totals = {}
+    if order_ids is None:
+        for order_id, total in connection.execute(select(Order.id, Order.total)):
+            totals[order_id] = total
+    else:
+        for chunk in _chunks(order_ids):
+            for order_id, total in connection.execute(select(Order.id, Order.total).where(Order.id.in_(chunk))):
+                totals[order_id] = total
+
+    sums = _grouped_sums(connection, order_ids)
+
+    result = {}
+    for order_id, total in totals.items():
+        row = _empty_financials(total)
+        row.update(sums.get(order_id, {}))
+        row['expense_debts'] = round(row['expense_debts'], 2)
+        row['transport_debts'] = round(row['transport_debts'], 2)
+        row['total_related_debts'] = round(row['expense_debts'] + row['transport_debts'], 2)
+        row['total_costs'] = row['total_expenses'] + row['total_transports']
+        row['profit'] = float(total or 0) - row['total_costs']
+        result[order_id] = row
+    return result
+
+
+# ========================
+# 🗂️ ذاكرة مؤقتة لكل طلب HTTP
+# ========================
+
+def _request_cache():
+    if not has_app_context():
+        return None
+    if 'order_financials' not in g:
+        g.order_financials = {}
+    return g.order_financials
+
+
+def prefetch_order_financials(orders_or_ids):
+    """تحميل الملخص المالي لمجموعة طلبيات دفعة واحدة في ذاكرة الطلب"""
+    ids = {getattr(item, 'id', item) for item in orders_or_ids}
+    cache = _request_cache()
+    if cache is None:
+        return compute_order_financials(ids)
+
+    missing = {order_id for order_id in ids if order_id is not None and order_id not in cache}
+    if missing:
+        cache.update(compute_order_financials(missing))
+        # الطلبيات غير الموجودة بعد في قاعدة البيانات
+        for order_id in missing:
+            cache.setdefault(order_id, _empty_financials())
+    return {order_id: cache[order_id] for order_id in ids if order_id in cache}
+
+
+def get_order_financials(order):
+    """الملخص المالي لطلبية واحدة عبر ذاكرة الطلب
+
+    عند أول طلب لطلبية غير محمّلة يتم حساب جميع الطلبيات الموجودة في
+    جلسة SQLAlchemy دفعة واحدة، حتى لا يكلف عرض قائمة الطلبيات استعلامات لكل صف.
+    """
+    cache = _request_cache()
+    if cache is None:
+        return compute_order_financials([order.id]).get(order.id, _empty_financials(order.total))
+
+    if order.id not in cache:
+        loaded_ids = {
+            obj.id for obj in list(db.session.identity_map.values())
+            if isinstance(obj, Order) and obj.id is not None
+        }
+        loaded_ids.add(order.id)
+        prefetch_order_financials(loaded_ids)
+    return cache[order.id]
+
+
+def invalidate_order_financials(order_ids=None):
+    """مسح الملخصات المخزنة في ذاكرة الطلب الحالي"""
+    cache = _request_cache()
+    if cache is None:
+        return
+    if order_ids is None:
+        cache.clear()
+    else:
+        for order_id in order_ids:
+            cache.pop(order_id, None)
+
+
+@event.listens_for(Session, "after_commit")
+def _clear_cache_after_commit(session):
+    """أي عملية حفظ قد تغير المصاريف أو النقل أو الديون، فنمسح ذاكرة الطلب"""
+    invalidate_order_financials()
+
+
+# ========================
+# 📊 جدول الملخص المجمّع order_financials
+# ========================
+
+def _rollup_rows(financials):
+    now = now_utc()
+    return [{
+        'order_id': order_id,
+        'expenses_total': row['total_expenses'],
+        'transports_total': row['total_transports'],
+        'expense_debt_remaining': row['expense_debts'],
+        'transport_debt_remaining': row['transport_debts'],
+        'profit': row['profit'],
+        'updated_at': now,
+    } for order_id, row in financials.items()]
+
+
+def refresh_order_financials(order_ids, connection):
+    """إعادة حساب صفوف الملخص المجمّع لطلبيات محددة ضمن المعاملة الحالية"""
+    order_ids = {order_id for order_id in order_ids if order_id is not None}
+    if not order_ids:
+        return 0
+
+    financials = compute_order_financials(order_ids, connection=connection)
+    for chunk in _chunks(order_ids):
+        connection.execute(delete(OrderFinancials.__table__).where(OrderFinancials.order_id.in_(chunk)))
+    rows = _rollup_rows(financials)
+    if rows:
+        connection.execute(insert(OrderFinancials.__table__), rows)
+    return len(rows)
+
+
+def _attribute_values(obj, attribute):
+    """القيمة الحالية والقيمة السابقة (إن تغيرت) لحقل في كائن"""
+    history = inspect(obj).attrs[attribute].history
+    values = set(history.added or ()) | set(history.deleted or ()) | set(history.unchanged or ())
+    if not values:
+        values.add(getattr(obj, attribute, None))
+    return values
+
+
+# تحميل القيمة السابقة عند التعديل حتى لو كانت الخاصية منتهية الصلاحية بعد commit،
+# وإلا لن نعرف الطلبية القديمة عند نقل مصروف أو نقل أو دين إلى طلبية أخرى
+def _keep_previous_value(target, value, oldvalue, initiator):
+    return value
+
+for _attribute in (Expense.order_id, Transport.order_id, Debt.source_type, Debt.source_id):
+    event.listen(_attribute, "set", _keep_previous_value, active_history=True, retval=True)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_affected_orders(session, flush_context):
+    """تجميع الطلبيات المتأثرة بالتغييرات قبل مسح قوائم new/dirty/deleted"""
+    affected = session.info.setdefault('financials_affected_orders', set())
+    debt_sources = session.info.setdefault('financials_debt_sources', set())
+
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, (Expense, Transport)):
+            affected.update(_attribute_values(obj, 'order_id'))
+        elif isinstance(obj, Debt):
+            for source_type in _attribute_values(obj, 'source_type'):
+                if source_type in ('expense', 'transport'):
+                    for source_id in _attribute_values(obj, 'source_id'):
+                        debt_sources.add((source_type, source_id))
+        elif isinstance(obj, Order) and obj.id is not None:
+            affected.add(obj.id)
+
+    affected.discard(None)
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _refresh_affected_orders(session, flush_context):
+    """تحديث الملخص المجمّع للطلبيات المتأثرة داخل نفس المعاملة"""
+    affected = session.info.pop('financials_affected_orders', set())
+    debt_sources = session.info.pop('financials_debt_sources', set())
+    if not affected and not debt_sources:
+        return
+
+    connection = session.connection()
+    savepoint = connection.begin_nested()
+    try:
+        refresh_order_financials(affected | _debt_source_orders(connection, debt_sources), connection)
+        savepoint.commit()
+    except Exception as e:
+        savepoint.rollback()
+        print(f"❌ خطأ في تحديث الملخص المالي للطلبيات، جدولة إصلاحه في الخلفية: {e}")
+        # الكتابة نفسها تُثبّت، والطلبيات المتأثرة تُسجل كمهمة في نفس المعاملة فلا يبقى الانحراف صامتاً
+        # (إن فشل تسجيل المهمة أيضاً يصل الخطأ إلى flush فتُلغى المعاملة كلها)
+        connection.execute(insert(BackgroundJob.__table__).values(
+            kind=REPAIR_JOB,
+            payload={
+                'order_ids': sorted(affected),
+                'debt_sources': sorted([kind, source_id] for kind, source_id in debt_sources if source_id is not None),
+            },
+        ))
+        session.info['jobs_enqueued'] = True
+
+
+def _debt_source_orders(connection, debt_sources):
+    """الطلبيات المرتبطة بمصادر ديون (مصروف أو نقل) من أزواج (النوع، المعرف)"""
+    order_ids = set()
+    for source_type, model in (('expense', Expense), ('transport', Transport)):
+        source_ids = [source_id for kind, source_id in debt_sources if kind == source_type and source_id is not None]
+        for chunk in _chunks(source_ids):
+            rows = connection.execute(
+                select(model.order_id).where(model.id.in_(chunk), model.order_id.isnot(None))
+            )
+            order_ids.update(order_id for (order_id,) in rows)
+    return order_ids
+
+
+@job_handler(REPAIR_JOB)
+def repair_order_financials(order_ids=(), debt_sources=()):
+    """إعادة حساب صفوف الملخص لطلبيات فشل تحديثها أثناء الكتابة (تُعاد المحاولة بتأخير متصاعد عند الفشل)"""
+    connection = db.session.connection()
+    affected = set(order_ids) | _debt_source_orders(connection, [tuple(source) for source in debt_sources])
+    count = refresh_order_financials(affected, connection)
+    db.session.commit()
+    print(f"✅ إصلاح الملخص المالي: {count} طلبية")
+    return count
+
+
+def rebuild_order_financials(verify_only=False, batch_size=1000):
+    """إعادة بناء جدول الملخص بالكامل ومقارنته بالحساب المباشر
+
+    يرجع قاموساً بعدد الطلبيات والصفوف المنحرفة (المختلفة أو المفقودة أو الزائدة).
+    """
+    expected = compute_order_financials()
+    stored = {
+        row.order_id: row for row in db.session.execute(select(OrderFinancials.__table__))
+    }
+
+    drifted = []
+    fields = (
+        ('expenses_total', 'total_expenses'),
+        ('transports_total', 'total_transports'),
+        ('expense_debt_remaining', 'expense_debts'),
+        ('transport_debt_remaining', 'transport_debts'),
+        ('profit', 'profit'),
+    )
+    for order_id, row in expected.items():
+        current = stored.get(order_id)
+        if current is None or any(
+            abs((getattr(current, column) or 0) - row[key]) > 0.005 for column, key in fields
+        ):
+            drifted.append(order_id)
+    orphaned = [order_id for order_id in stored if order_id not in expected]
+
+    if not verify_only:
+        connection = db.session.connection()
+        for chunk in _chunks(orphaned):
+            connection.execute(delete(OrderFinancials.__table__).where(OrderFinancials.order_id.in_(chunk)))
+        for start in range(0, len(drifted), batch_size):
+            batch = drifted[start:start + batch_size]
+            for chunk in _chunks(batch):
+                connection.execute(delete(OrderFinancials.__table__).where(OrderFinancials.order_id.in_(chunk)))
+            connection.execute(
+                insert(OrderFinancials.__table__),
+                _rollup_rows({order_id: expected[order_id] for order_id in batch})
+            )
+        db.session.commit()
+
+    return {
+        'total_orders': len(expected),
+        'drifted_orders': len(drifted),
+        'orphaned_rows': len(orphaned),
+    }
+
+
+def get_orders_health_stats():
+    """إحصائيات صحة الطلبيات من جدول الملخص المجمّع"""
+    try:
+        debt = OrderFinancials.expense_debt_remaining + OrderFinancials.transport_debt_remaining
+        total_orders, debt_count, total_debts_amount = db.session.query(
+            func.count(Order.id),
+            func.count(case((debt > 0, Order.id))),
+            func.sum(case((debt > 0, debt), else_=0))
+        ).outerjoin(OrderFinancials, OrderFinancials.order_id == Order.id).one()
+
+        total_debts_amount = round(total_debts_amount or 0, 2)
+        healthy_count = total_orders - debt_count
+
+        return {
+            'total_orders': total_orders,
+            'healthy_orders': healthy_count,
+            'debt_orders': debt_count,
+            'total_debts_amount': total_debts_amount,
+            'healthy_percentage': (healthy_count / total_orders * 100) if total_orders > 0 else 0,
+            'debt_percentage': (debt_count / total_orders * 100) if total_orders > 0 else 0
+        }
+    except Exception as e:
+        print(f"❌ خطأ في حساب إحصائيات الصحة: {e}")
+        return {
+            'total_orders': 0,
+            'healthy_orders': 0,
+            'debt_orders': 0,
+            'total_debts_amount': 0,
+            'healthy_percentage': 0,
+            'debt_percentage': 0
+        }
@@ -0,0 +1,192 @@
+# ====== identity.py ======
+# هوية المستخدم الحالي وصلاحياته: تُحمّل مرة واحدة لكل طلب في flask.g
+# ومعها ذاكرة مؤقتة بين الطلبات (TTL) تُمسح عند تثبيت أي تعديل على المستخدمين أو الصلاحيات
+import threading
+import time
+from itertools import chain
+from flask import g, has_app_context, has_request_context, current_app, session
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from models import db, User, UserPermission
+
+ADMIN_ROLES = ('admin', 'manager')
+PERMISSION_ACTIONS = ('view', 'edit', 'delete', 'export')
+DEFAULT_TTL_SECONDS = 60
+
+# حقول المستخدم التي تؤثر على الهوية (تحديث last_login عند الدخول لا يمسح الذاكرة)
+_IDENTITY_ATTRIBUTES = ('username', 'role', 'is_active', 'full_name')
+
+# الذاكرة المشتركة بين الطلبات في هذه العملية: المفتاح -> (وقت الانتهاء، القيمة)
+# مع عدة عمليات (gunicorn) كل عملية تمسح ذاكرتها عند تعديلاتها، والـ TTL يحد تقادم البقية
+_CACHE = {}
+_CACHE_LOCK = threading.Lock()
+_GENERATION = {'value': 0}
+
+
+def _ttl():
+    if has_app_context():
+        return current_app.config.get('IDENTITY_CACHE_TTL', DEFAULT_TTL_SECONDS)
+    return DEFAULT_TTL_SECONDS
+
+
+def _request_cache():
+    """ذاكرة الطلب الحالي في flask.g (أو None خارج سياق التطبيق)"""
+    if not has_app_context():
+        return None
+    cache = getattr(g, '_identity_cache', None)
+    if cache is None:
+        cache = g._identity_cache = {}
+    return cache
+
+
+def _cached(key, loader, aliases=None):
+    """قراءة من ذاكرة الطلب ثم الذاكرة المشتركة، وإلا التحميل من قاعدة البيانات
+
+    aliases(value) تعيد مفاتيح إضافية لنفس القيمة (الهوية بالاسم وبالمعرف معاً).
+    """
+    request_cache = _request_cache()
+    if request_cache is not None and key in request_cache:
+        return request_cache[key]
+
+    ttl = _ttl()
+    now = time.monotonic()
+    entry = _CACHE.get(key) if ttl > 0 else None
+    if entry is not None and entry[0] > now:
+        value = entry[1]
+        keys = [key]
+    else:
+        generation = _GENERATION['value']
+        value = loader()
+        keys = [key] + (list(aliases(value)) if aliases and value is not None else [])
+        if ttl > 0:
+            with _CACHE_LOCK:
+                # عدم تخزين قيمة حُمّلت قبل إبطال حدث أثناء التحميل
+                if generation == _GENERATION['value']:
+                    for cache_key in keys:
+                        _CACHE[cache_key] = (now + ttl, value)
+
+    if request_cache is not None:
+        for cache_key in keys:
+            request_cache[cache_key] = value
+    return value
+
+
+# ========================
+# تحميل الهوية
+# ========================
+def _load_identity(**criteria):
+    """المستخدم ومصفوفة صلاحياته في استعلامين، كقاموس عادي لا يرتبط بجلسة قاعدة البيانات"""
+    user = User.query.filter_by(**criteria).first()
+    if user is None:
+        return None
+
+    permissions = {}
+    for permission in UserPermission.query.filter_by(user_id=user.id).all():
+        permissions[permission.module] = {
+            'view': bool(permission.can_view),
+            'edit': bool(permission.can_edit),
+            'delete': bool(permission.can_delete),
+            'export': bool(permission.can_export),
+        }
+    return {
+        'id': user.id,
+        'username': user.username,
+        'full_name': user.full_name or user.username,
+        'role': user.role,
+        'is_active': bool(user.is_active),
+        'is_admin': user.role in ADMIN_ROLES,
+        'permissions': permissions,
+    }
+
+
+def _identity_keys(identity):
+    return [('username', identity['username']), ('id', identity['id'])]
+
+
+def get_identity(username=None):
+    """هوية مستخدم بالاسم، أو المستخدم المسجل في الجلسة إن لم يُمرر اسم
+
+    تعيد None للعمال (جلسات user_type=worker ليس لها صف في app_user) وللأسماء غير الموجودة.
+    """
+    if username is None:
+        if not has_request_context() or 'user' not in session:
+            return None
+        username = session['user']
+    return _cached(('username', username), lambda: _load_identity(username=username), _identity_keys)
+
+
+def get_identity_by_id(user_id):
+    if user_id is None:
+        return None
+    return _cached(('id', user_id), lambda: _load_identity(id=user_id), _identity_keys)
+
+
+def is_admin(username=None):
+    identity = get_identity(username)
+    return bool(identity and identity['is_admin'])
+
+
+def has_permission(identity, module, action):
+    """المديرون لديهم كل الصلاحيات، والبقية حسب صفوف user_permission"""
+    if not identity:
+        return False
+    if identity['is_admin']:
+        return True
+    if action not in PERMISSION_ACTIONS:
+        return False
+    return identity['permissions'].get(module, {}).get(action, False)
+
+
+def get_admin_users():
+    """المديرون النشطون (للفلاتر والقوائم)"""
+    def load():
+        admin_users = User.query.filter(
+            User.role.in_(ADMIN_ROLES),
+            User.is_active == True
+        ).all()
+        return [{
+            "username": user.username,
+            "full_name": user.full_name or user.username
+        } for user in admin_users]
+    return _cached(('admins',), load)
+
+
+# ========================
+# الإبطال
+# ========================
+def invalidate_identity_cache():
+    """مسح ذاكرة الهويات في هذه العملية وذاكرة الطلب الحالي"""
+    with _CACHE_LOCK:
+        _GENERATION['value'] += 1
+        _CACHE.clear()
+    request_cache = getattr(g, '_identity_cache', None) if has_app_context() else None
+    if request_cache is not None:
+        request_cache.clear()
+
+
+def _identity_changed(obj):
+    if isinstance(obj, UserPermission):
+        return True
+    if not isinstance(obj, User):
+        return False
+    state = inspect(obj)
+    return any(state.attrs[attribute].history.has_changes() for attribute in _IDENTITY_ATTRIBUTES)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_identity_changes(session, flush_context):
+    """تسجيل تعديل المستخدمين أو الصلاحيات، والمسح الفعلي بعد التثبيت فقط"""
+    added_or_deleted = any(isinstance(obj, (User, UserPermission)) for obj in chain(session.new, session.deleted))
+    if added_or_deleted or any(_identity_changed(obj) for obj in session.dirty):
+        session.info['identity_changed'] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop('identity_changed', False):
+        invalidate_identity_cache()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_identity_changes(session):
+    session.info.pop('identity_changed', None)
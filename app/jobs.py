@@ -0,0 +1,420 @@
+# ====== jobs.py ======
+# قائمة مهام خلفية دائمة (جدول background_job) مع مجموعة خيوط لتنفيذها
+# المهمة تُضاف داخل نفس معاملة الطلب، فلا تُنفذ إلا إذا ثُبّتت البيانات المرتبطة بها
+import importlib
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from sqlalchemy import event, func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import db, BackgroundJob, now_utc
+
+# الوحدات التي تسجل معالجات مهام عند استيرادها
+HANDLER_MODULES = ('derivatives', 'auto_tasks', 'backup', 'financials')
+HANDLERS = {}
+# نوع المهمة الدورية -> (مفتاح الإعداد للفاصل الزمني بالثواني، القيمة الافتراضية)
+PERIODIC = {}
+
+STALE_AFTER = timedelta(minutes=15)
+# كل كم ثانية يُجدد locked_at لمهمة قيد التنفيذ (أقل بكثير من STALE_AFTER)
+HEARTBEAT_SECONDS = 60
+MAX_BACKOFF_SECONDS = 3600
+# مدة الاحتفاظ بصفوف المهام المنتهية بالأيام (الفاشلة أطول للتشخيص)
+DONE_RETENTION_DAYS = 7
+FAILED_RETENTION_DAYS = 30
+
+
+def job_handler(kind):
+    """تسجيل دالة كمعالج لنوع مهمة"""
+    def decorator(func_):
+        HANDLERS[kind] = func_
+        return func_
+    return decorator
+
+
+def periodic_job(kind, interval_key, default_interval):
+    """تسجيل معالج لمهمة تُعاد جدولتها تلقائياً بعد كل تشغيل"""
+    def decorator(func_):
+        HANDLERS[kind] = func_
+        PERIODIC[kind] = (interval_key, default_interval)
+        return func_
+    return decorator
+
+
+def _periodic_interval(kind):
+    from flask import current_app
+    interval_key, default_interval = PERIODIC[kind]
+    return current_app.config.get(interval_key, default_interval) or 0
+
+
+def _load_handlers():
+    for module_name in HANDLER_MODULES:
+        importlib.import_module(module_name)
+
+
+# ========================
+# إضافة المهام
+# ========================
+def enqueue(kind, payload=None, max_attempts=5, delay_seconds=0, dedupe_key=None):
+    """إضافة مهمة إلى الجلسة الحالية - تُثبّت مع commit الطلب
+
+    dedupe_key: لا تُقبل مهمتان منتظرتان بنفس المفتاح (فهرس فريد جزئي)، فالـ commit الثاني يفشل بـ IntegrityError.
+    """
+    job = BackgroundJob(
+        kind=kind,
+        payload=payload or {},
+        max_attempts=max_attempts,
+        run_after=now_utc() + timedelta(seconds=delay_seconds),
+        dedupe_key=dedupe_key
+    )
+    db.session.add(job)
+    db.session.info['jobs_enqueued'] = True
+    return job
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_runner_after_commit(session):
+    """إيقاظ المنفذ فور تثبيت مهام جديدة بدل انتظار دورة الاستطلاع"""
+    if session.info.pop('jobs_enqueued', False):
+        runner = _RUNNER.get('instance')
+        if runner is not None:
+            runner.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_enqueued_after_rollback(session):
+    session.info.pop('jobs_enqueued', None)
+
+
+# ========================
+# حجز المهام وتنفيذها
+# ========================
+def _enqueue_periodic(kind, delay_seconds=0):
+    """تثبيت الموعد القادم لمهمة دورية بمفتاح نوعها
+
+    عمليتان تجدولان نفس النوع معاً: الفهرس الفريد يقبل الأولى ويرفض الثانية، فتُلغى بدون خطأ.
+    """
+    try:
+        enqueue(kind, delay_seconds=delay_seconds, dedupe_key=kind)
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+
+def ensure_periodic_jobs():
+    """ضمان وجود موعد قادم لكل مهمة دورية مفعّلة (فاصل أكبر من صفر)"""
+    for kind in PERIODIC:
+        if _periodic_interval(kind) <= 0:
+            continue
+        scheduled = db.session.query(BackgroundJob.id)\
+            .filter(BackgroundJob.kind == kind, BackgroundJob.status.in_(['pending', 'running']))\
+            .first()
+        if scheduled is None:
+            _enqueue_periodic(kind)
+    db.session.commit()
+
+
+def _schedule_next(kind):
+    if kind in PERIODIC:
+        interval = _periodic_interval(kind)
+        if interval > 0:
+            _enqueue_periodic(kind, delay_seconds=interval)
+
+
+def recover_stale_jobs():
+    """إرجاع المهام العالقة في running (بعد توقف مفاجئ) إلى الانتظار"""
+    cutoff = now_utc() - STALE_AFTER
+    count = BackgroundJob.query\
+        .filter(BackgroundJob.status == 'running', BackgroundJob.locked_at < cutoff)\
+        .update({'status': 'pending', 'locked_at': None}, synchronize_session=False)
+    db.session.commit()
+    return count
+
+
+def prune_finished_jobs(done_days=None, failed_days=None):
+    """حذف صفوف المهام المنتهية الأقدم من مدة الاحتفاظ، يعيد عدد المحذوف"""
+    from flask import current_app
+    if done_days is None:
+        done_days = current_app.config.get('JOBS_DONE_RETENTION_DAYS', DONE_RETENTION_DAYS)
+    if failed_days is None:
+        failed_days = current_app.config.get('JOBS_FAILED_RETENTION_DAYS', FAILED_RETENTION_DAYS)
+
+    now = now_utc()
+    count = 0
+    for status, days in (('done', done_days), ('failed', failed_days)):
+        count += BackgroundJob.query\
+            .filter(BackgroundJob.status == status, BackgroundJob.finished_at < now - timedelta(days=days))\
+            .delete(synchronize_session=False)
+    db.session.commit()
+    return count
+
+
+class _Heartbeat:
+    """خيط يجدد locked_at لمهمة قيد التنفيذ على اتصال مستقل
+
+    recover_stale_jobs تعيد للانتظار فقط ما لم يُجدد منذ STALE_AFTER، فلا تُكرر مهمة طويلة وهي حية.
+    """
+
+    def __init__(self, engine, job_id, interval=HEARTBEAT_SECONDS):
+        self.engine = engine
+        self.job_id = job_id
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'job-heartbeat-{job_id}', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(update(BackgroundJob)
+                                       .where(BackgroundJob.id == self.job_id, BackgroundJob.status == 'running')
+                                       .values(locked_at=now_utc()))
+            except Exception as e:
+                print(f"❌ خطأ في تجديد قفل المهمة #{self.job_id}: {e}")
+
+
+def claim_next_job():
+    """حجز أقدم مهمة مستحقة - التحديث المشروط يمنع تنفيذها مرتين من عمليتين"""
+    while True:
+        now = now_utc()
+        row = db.session.query(BackgroundJob.id)\
+            .filter(BackgroundJob.status == 'pending', BackgroundJob.run_after <= now)\
+            .order_by(BackgroundJob.run_after, BackgroundJob.id)\
+            .first()
+        if row is None:
+            db.session.commit()
+            return None
+
+        claimed = BackgroundJob.query\
+            .filter(BackgroundJob.id == row.id, BackgroundJob.status == 'pending')\
+            .update({
+                'status': 'running',
+                'locked_at': now,
+                'attempts': BackgroundJob.attempts + 1
+            }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return row.id
+
+
+def run_job(job_id):
+    """تنفيذ مهمة محجوزة مع إعادة المحاولة بتأخير متصاعد عند الفشل"""
+    job = db.session.get(BackgroundJob, job_id)
+    if job is None:
+        return False
+
+    handler = HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f"لا يوجد معالج لنوع المهمة: {job.kind}")
+        with _Heartbeat(db.engine, job_id):
+            handler(**(job.payload or {}))
+        job = db.session.get(BackgroundJob, job_id)
+        job.status = 'done'
+        job.finished_at = now_utc()
+        job.last_error = None
+        kind = job.kind
+        db.session.commit()
+        _schedule_next(kind)
+        return True
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ فشل تنفيذ المهمة #{job_id}: {e}")
+        job = db.session.get(BackgroundJob, job_id)
+        job.last_error = traceback.format_exc()[-2000:]
+        failed = job.attempts >= job.max_attempts
+        if failed:
+            job.status = 'failed'
+            job.finished_at = now_utc()
+        else:
+            delay = min(30 * (2 ** (job.attempts - 1)), MAX_BACKOFF_SECONDS)
+            job.status = 'pending'
+            job.run_after = now_utc() + timedelta(seconds=delay)
+        job.locked_at = None
+        kind = job.kind
+        db.session.commit()
+        if failed:
+            _schedule_next(kind)
+        return False
+
+
+def run_pending_jobs(limit=None):
+    """تنفيذ المهام المستحقة في الخيط الحالي (لأوامر CLI)"""
+    _load_handlers()
+    processed = 0
+    while limit is None or processed < limit:
+        job_id = claim_next_job()
+        if job_id is None:
+            break
+        run_job(job_id)
+        processed += 1
+    return processed
+
+
+@periodic_job('prune_background_jobs', 'JOBS_PRUNE_INTERVAL', 86400)
+def run_prune_jobs():
+    """تنظيف دوري لجدول المهام حتى لا ينمو بصفوف المهام المنتهية"""
+    count = prune_finished_jobs()
+    print(f"✅ تنظيف قائمة المهام الخلفية: حذف {count} مهمة منتهية")
+    return count
+
+
+# ========================
+# المنفذ الخلفي داخل عملية الويب
+# ========================
+_RUNNER = {}
+_RUNNER_LOCK = threading.Lock()
+
+
+class JobRunner:
+    """خيط موزع يحجز المهام ويرسلها إلى مجموعة خيوط محدودة"""
+
+    def __init__(self, app, workers=2, poll_interval=5):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._slots = threading.Semaphore(workers)
+        self._wake = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job-worker')
+        self._thread = threading.Thread(target=self._dispatch, name='job-dispatcher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def _dispatch(self):
+        with self.app.app_context():
+            _load_handlers()
+            try:
+                recover_stale_jobs()
+                ensure_periodic_jobs()
+            except Exception as e:
+                print(f"❌ خطأ في تهيئة قائمة المهام الخلفية: {e}")
+
+        while True:
+            self._slots.acquire()
+            job_id = None
+            try:
+                with self.app.app_context():
+                    job_id = claim_next_job()
+            except Exception as e:
+                print(f"❌ خطأ في حجز مهمة خلفية: {e}")
+
+            if job_id is None:
+                self._slots.release()
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+
+            self._executor.submit(self._execute, job_id)
+
+    def _execute(self, job_id):
+        try:
+            with self.app.app_context():
+                run_job(job_id)
+        except Exception as e:
+            print(f"❌ خطأ غير متوقع في المهمة #{job_id}: {e}")
+        finally:
+            self._slots.release()
+
+
+def ensure_job_runner(app):
+    """تشغيل المنفذ مرة واحدة لكل عملية عند أول طلب"""
+    if not app.config.get('JOBS_ENABLED', True) or 'instance' in _RUNNER:
+        return
+    with _RUNNER_LOCK:
+        if 'instance' in _RUNNER:
+            return
+        runner = JobRunner(
+            app,
+            workers=app.config.get('JOBS_WORKERS', 2),
+            poll_interval=app.config.get('JOBS_POLL_INTERVAL', 5)
+        )
+        runner.start()
+        _RUNNER['instance'] = runner
+
+
+def init_jobs(app):
+    """ربط تشغيل المنفذ الكسول بالتطبيق"""
+    app.config.setdefault('JOBS_ENABLED', True)
+    app.config.setdefault('JOBS_WORKERS', 2)
+    app.config.setdefault('JOBS_POLL_INTERVAL', 5)
+    app.config.setdefault('JOBS_PRUNE_INTERVAL', 86400)
+    app.config.setdefault('JOBS_DONE_RETENTION_DAYS', DONE_RETENTION_DAYS)
+    app.config.setdefault('JOBS_FAILED_RETENTION_DAYS', FAILED_RETENTION_DAYS)
+
+    @app.before_request
+    def _start_job_runner():
+        ensure_job_runner(app)
+
+
+# ========================
+# مقاييس القائمة
+# ========================
+def get_job_stats():
+    """عمق القائمة وتوزيع المهام حسب النوع والحالة"""
+    try:
+        by_kind = {}
+        totals = {'pending': 0, 'running': 0, 'done': 0, 'failed': 0}
+        rows = db.session.query(BackgroundJob.kind, BackgroundJob.status, func.count(BackgroundJob.id))\
+            .group_by(BackgroundJob.kind, BackgroundJob.status).all()
+        for kind, status, count in rows:
+            by_kind.setdefault(kind, {})[status] = count
+            totals[status] = totals.get(status, 0) + count
+
+        now = now_utc()
+        oldest_pending, due_now = db.session.query(
+            func.min(BackgroundJob.created_at),
+            func.count(BackgroundJob.id)
+        ).filter(BackgroundJob.status == 'pending', BackgroundJob.run_after <= now).one()
+
+        oldest_age = None
+        if oldest_pending is not None:
+            if oldest_pending.tzinfo is None:
+                oldest_pending = oldest_pending.replace(tzinfo=now.tzinfo)
+            oldest_age = round((now - oldest_pending).total_seconds(), 1)
+
+        recent_failures = BackgroundJob.query\
+            .filter(BackgroundJob.status == 'failed')\
+            .order_by(BackgroundJob.finished_at.desc())\
+            .limit(5).all()
+
+        runner = _RUNNER.get('instance')
+        return {
+            'queue_depth': totals['pending'] + totals['running'],
+            'due_now': due_now,
+            'oldest_pending_seconds': oldest_age,
+            'totals': totals,
+            'by_kind': by_kind,
+            'recent_failures': [{
+                'id': job.id,
+                'kind': job.kind,
+                'attempts': job.attempts,
+                'error': ((job.last_error or '').strip().splitlines() or [''])[-1],
+                'finished_at': job.finished_at.isoformat() if job.finished_at else None
+            } for job in recent_failures],
+            'runner': {
+                'alive': bool(runner and runner.is_alive()),
+                'workers': runner.workers if runner else 0
+            }
+        }
+    except Exception as e:
+        print(f"❌ خطأ في حساب إحصائيات المهام الخلفية: {e}")
+        return {}
@@ -0,0 +1,202 @@
+# ====== lookups.py ======
+# بيانات القوائم المنسدلة المشتركة (التصنيفات، الموردون، الحالات، العمال، المستخدمون، آخر الطلبيات)
+# محفوظة في ذاكرة العملية مع رقم إصدار لكل مجموعة يزداد عند تثبيت أي تعديل على جداولها،
+# و TTL احتياطي للتعديلات من عمليات أخرى أو بتحديثات جماعية لا تمر بالجلسة
+import threading
+import time
+from itertools import chain
+from flask import current_app, has_app_context
+from sqlalchemy import event, or_, cast, String
+from sqlalchemy.orm import Session, selectinload
+from models import (
+    db, ExpenseCategory, Supplier, TransportCategory, TransportSubType,
+    Status, Worker, User, Order, PhoneNumber
+)
+
+DEFAULT_TTL_SECONDS = 300
+RECENT_ORDERS_LIMIT = 50
+SEARCH_LIMIT = 20
+
+# اسم المجموعة -> (دالة التحميل، النماذج التي يبطلها تعديلها)
+LOOKUPS = {}
+_VERSIONS = {}
+_CACHE = {}
+_CACHE_LOCK = threading.Lock()
+
+
+class Record(dict):
+    """صف للقراءة فقط يعمل مع القوالب والكود كـ record.name أو record['name']"""
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def _records(rows, columns=None):
+    """تحويل كائنات ORM إلى Record (لا ترتبط بجلسة، فتُشارك بين الطلبات والخيوط)"""
+    records = []
+    for row in rows:
+        keys = columns or [attribute.key for attribute in row.__mapper__.column_attrs]
+        records.append(Record((key, getattr(row, key)) for key in keys))
+    return records
+
+
+def lookup(name, *models):
+    """تسجيل دالة تحميل لمجموعة بيانات مرجعية تُبطل عند تعديل models"""
+    def decorator(loader):
+        LOOKUPS[name] = (loader, models)
+        _VERSIONS.setdefault(name, 0)
+        return loader
+    return decorator
+
+
+def _ttl():
+    if has_app_context():
+        return current_app.config.get('LOOKUP_CACHE_TTL', DEFAULT_TTL_SECONDS)
+    return DEFAULT_TTL_SECONDS
+
+
+def get_lookup(name):
+    """المجموعة من الذاكرة إن كان إصدارها حالياً ولم تنتهِ مدتها، وإلا تُحمّل من جديد"""
+    loader, _ = LOOKUPS[name]
+    version = _VERSIONS[name]
+    entry = _CACHE.get(name)
+    now = time.monotonic()
+    if entry is not None and entry[0] == version and entry[1] > now:
+        return entry[2]
+
+    value = loader()
+    with _CACHE_LOCK:
+        # لا نخزن نتيجة حُمّلت قبل إبطال حدث أثناء التحميل
+        if _VERSIONS[name] == version:
+            _CACHE[name] = (version, now + _ttl(), value)
+    return value
+
+
+def invalidate_lookups(*names):
+    """زيادة إصدار المجموعات المحددة (أو كلها)"""
+    with _CACHE_LOCK:
+        for name in names or tuple(LOOKUPS):
+            _VERSIONS[name] = _VERSIONS.get(name, 0) + 1
+            _CACHE.pop(name, None)
+
+
+def get_lookup_versions():
+    return dict(_VERSIONS)
+
+
+# ========================
+# المجموعات المرجعية
+# ========================
+@lookup('expense_categories', ExpenseCategory)
+def _load_expense_categories():
+    return _records(ExpenseCategory.query.order_by(ExpenseCategory.name).all())
+
+
+@lookup('suppliers', Supplier)
+def _load_suppliers():
+    return _records(Supplier.query.order_by(Supplier.name).all())
+
+
+@lookup('transport_categories', TransportCategory)
+def _load_transport_categories():
+    return _records(TransportCategory.query.order_by(TransportCategory.name).all())
+
+
+@lookup('transport_sub_types', TransportSubType)
+def _load_transport_sub_types():
+    return _records(TransportSubType.query.order_by(TransportSubType.name).all())
+
+
+@lookup('statuses', Status)
+def _load_statuses():
+    return _records(Status.query.order_by(Status.id).all())
+
+
+@lookup('active_workers', Worker)
+def _load_active_workers():
+    workers = Worker.query.filter(Worker.is_active == True).order_by(Worker.name).all()
+    return _records(workers, ['id', 'name', 'phone', 'username', 'monthly_salary'])
+
+
+@lookup('users', User)
+def _load_users():
+    # بدون كلمات المرور وبقية الحقول الحساسة
+    users = User.query.order_by(User.username).all()
+    return _records(users, ['id', 'username', 'full_name', 'role', 'is_active'])
+
+
+def _order_option(order):
+    phone = order.phones[0].number if order.phones else ''
+    return Record(
+        id=order.id, name=order.name, product=order.product, wilaya=order.wilaya,
+        phone=phone, is_paid=order.is_paid
+    )
+
+
+@lookup('recent_orders', Order, PhoneNumber)
+def _load_recent_orders():
+    """آخر الطلبيات غير المدفوعة للخيارات الأولية في منتقي الطلبية (البقية بالبحث)"""
+    orders = Order.query.options(selectinload(Order.phones))\
+        .filter(Order.is_paid == False)\
+        .order_by(Order.created_at.desc().nulls_last(), Order.id.desc())\
+        .limit(RECENT_ORDERS_LIMIT).all()
+    return [_order_option(order) for order in orders]
+
+
+def order_search_condition(q):
+    """شرط SQL لبحث الطلبيات بالرقم أو الاسم أو المنتج أو الولاية أو الهاتف، أو None لبحث فارغ"""
+    q = (q or '').strip().lstrip('#')
+    if not q:
+        return None
+
+    pattern = f"%{q}%"
+    conditions = [
+        Order.name.ilike(pattern),
+        Order.product.ilike(pattern),
+        Order.wilaya.ilike(pattern),
+        Order.id.in_(db.session.query(PhoneNumber.order_id).filter(PhoneNumber.number.like(pattern))),
+    ]
+    if q.isdigit():
+        conditions.append(cast(Order.id, String).like(f"{q}%"))
+    return or_(*conditions)
+
+
+def search_orders(q, limit=SEARCH_LIMIT):
+    """بحث الطلبيات لمنتقي الطلبية (آخر الطلبيات غير المدفوعة لبحث فارغ)"""
+    condition = order_search_condition(q)
+    if condition is None:
+        return get_lookup('recent_orders')[:limit]
+
+    orders = Order.query.options(selectinload(Order.phones))\
+        .filter(condition)\
+        .order_by(Order.is_paid.asc(), Order.created_at.desc().nulls_last(), Order.id.desc())\
+        .limit(limit).all()
+    return [_order_option(order) for order in orders]
+
+
+# ========================
+# الإبطال عند التعديل
+# ========================
+@event.listens_for(Session, "after_flush")
+def _collect_changed_lookups(session, flush_context):
+    changed = session.info.setdefault('lookups_changed', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        for name, (_, models) in LOOKUPS.items():
+            if isinstance(obj, models):
+                changed.add(name)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    changed = session.info.pop('lookups_changed', None)
+    if changed:
+        invalidate_lookups(*changed)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_lookups(session):
+    session.info.pop('lookups_changed', None)
@@ -0,0 +1,343 @@
+# ====== migrations/__init__.py ======
+# ترحيلات مخطط قاعدة البيانات المرقمة
+# كل ملف vNNN_*.py يعرّف up(op) و down(op) وأحياناً backfill(batch) لتعبئة البيانات على دفعات
+# الإصدار المطبق محفوظ في جدول schema_version، فبدء التشغيل يقرأ صفاً واحداً بدل فحص كل الجداول
+import importlib
+import pkgutil
+import re
+import time
+from sqlalchemy import (
+    MetaData, Table, Column, Integer, String, DateTime, Index,
+    inspect, select, func, text, bindparam
+)
+from sqlalchemy.schema import CreateColumn
+
+VERSION_TABLE = 'schema_version'
+MODULE_PATTERN = re.compile(r'^v(\d{3,})_(\w+)$')
+# مفتاح قفل PostgreSQL الاستشاري حتى لا ترحّل عقدتان في نفس الوقت
+ADVISORY_LOCK_KEY = 72023001
+
+_version_metadata = MetaData()
+schema_version = Table(
+    VERSION_TABLE, _version_metadata,
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('name', String(100), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+class MigrationError(Exception):
+    """فشل ترحيل أو طلب تراجع غير ممكن"""
+
+
+class Migration:
+    def __init__(self, version, name, module):
+        self.version = version
+        self.name = name
+        self.module = module
+        self.description = (module.__doc__ or name).strip().splitlines()[0]
+
+    def up(self, op):
+        self.module.up(op)
+
+    @property
+    def reversible(self):
+        return hasattr(self.module, 'down')
+
+    def down(self, op):
+        if not self.reversible:
+            raise MigrationError(f"الترحيل {self.version:03d} لا يدعم التراجع")
+        self.module.down(op)
+
+    def backfill(self, batch):
+        backfill = getattr(self.module, 'backfill', None)
+        if backfill is not None:
+            backfill(batch)
+
+
+def discover():
+    """كل ملفات الترحيل في هذه الحزمة مرتبة حسب الإصدار"""
+    migrations = {}
+    for module_info in pkgutil.iter_modules(__path__):
+        match = MODULE_PATTERN.match(module_info.name)
+        if not match:
+            continue
+        version = int(match.group(1))
+        if version in migrations:
+            raise MigrationError(f"رقم الإصدار {version} مكرر")
+        module = importlib.import_module(f"{__name__}.{module_info.name}")
+        migrations[version] = Migration(version, match.group(2), module)
+    return [migrations[version] for version in sorted(migrations)]
+
+
+def latest_version():
+    migrations = discover()
+    return migrations[-1].version if migrations else 0
+
+
+# ========================
+# عمليات المخطط داخل الترحيل
+# ========================
+class Operations:
+    """عمليات DDL آمنة لإعادة التنفيذ: كل عملية تتحقق من الحالة قبل التغيير
+
+    ترحيل انقطع قبل تسجيل إصداره يمكن تنفيذه من جديد دون أخطاء.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.dialect = connection.dialect
+
+    def _inspector(self):
+        # بدون ذاكرة مؤقتة: المخطط يتغير أثناء الترحيل
+        return inspect(self.connection)
+
+    def _quote(self, name):
+        return self.dialect.identifier_preparer.quote(name)
+
+    def has_table(self, table):
+        return self._inspector().has_table(table)
+
+    def has_column(self, table, column):
+        return column in {info['name'] for info in self._inspector().get_columns(table)}
+
+    def has_index(self, table, name):
+        return name in {info['name'] for info in self._inspector().get_indexes(table)}
+
+    def execute(self, sql, params=None):
+        return self.connection.execute(text(sql), params or {})
+
+    def create_tables(self, metadata):
+        """إنشاء الجداول الناقصة فقط (مع فهارسها)"""
+        metadata.create_all(self.connection, checkfirst=True)
+
+    def drop_tables(self, metadata):
+        """حذف جداول metadata الموجودة بترتيب عكسي للاعتماديات"""
+        metadata.drop_all(self.connection, checkfirst=True)
+
+    def add_column(self, table, column):
+        if not self.has_table(table) or self.has_column(table, column.name):
+            return False
+        column_ddl = CreateColumn(column).compile(dialect=self.dialect)
+        self.connection.exec_driver_sql(f"ALTER TABLE {self._quote(table)} ADD COLUMN {column_ddl}")
+        return True
+
+    def drop_column(self, table, column):
+        if not self.has_table(table) or not self.has_column(table, column):
+            return False
+        self.connection.exec_driver_sql(f"ALTER TABLE {self._quote(table)} DROP COLUMN {self._quote(column)}")
+        return True
+
+    def create_index(self, name, table, columns, unique=False, where=None):
+        """where: شرط فهرس جزئي (SQLite و PostgreSQL)"""
+        if not self.has_table(table) or self.has_index(table, name):
+            return False
+        target = Table(table, MetaData(), *(Column(column) for column in columns))
+        options = {'sqlite_where': text(where), 'postgresql_where': text(where)} if where else {}
+        Index(name, *(target.c[column] for column in columns), unique=unique, **options).create(self.connection)
+        return True
+
+    def drop_index(self, name, table):
+        if not self.has_table(table) or not self.has_index(table, name):
+            return False
+        self.connection.exec_driver_sql(f"DROP INDEX {self._quote(name)}")
+        return True
+
+
+class BatchBackfill:
+    """تعبئة بيانات على دفعات، كل دفعة في معاملة قصيرة مستقلة
+
+    تُنفذ بعد تثبيت تغييرات المخطط، فلا يبقى الجدول مقفلاً طوال التعبئة
+    ويستمر التطبيق في العمل على الجداول الكبيرة. شرط where يجب أن يستبعد الصفوف
+    المعبأة حتى يمكن استئناف التعبئة بعد أي انقطاع.
+    """
+
+    def __init__(self, engine, batch_size=1000, pause_seconds=0.0, echo=None):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self.echo = echo
+
+    def update(self, table, values, where, key='id'):
+        """UPDATE table SET values WHERE where - على دفعات حسب المفتاح الأساسي"""
+        preparer = self.engine.dialect.identifier_preparer
+        quoted_table = preparer.quote(table)
+        quoted_key = preparer.quote(key)
+        assignments = ', '.join(f"{preparer.quote(column)} = :set_{column}" for column in values)
+        select_batch = text(
+            f"SELECT {quoted_key} FROM {quoted_table} "
+            f"WHERE {quoted_key} > :last_key AND ({where}) ORDER BY {quoted_key} LIMIT :limit"
+        )
+        update_batch = text(
+            f"UPDATE {quoted_table} SET {assignments} WHERE {quoted_key} IN :keys"
+        ).bindparams(bindparam('keys', expanding=True))
+        params = {f"set_{column}": value for column, value in values.items()}
+
+        updated = 0
+        last_key = 0
+        while True:
+            with self.engine.begin() as connection:
+                keys = connection.execute(select_batch, {'last_key': last_key, 'limit': self.batch_size})\
+                    .scalars().all()
+                if not keys:
+                    break
+                connection.execute(update_batch, {**params, 'keys': keys})
+            updated += len(keys)
+            last_key = keys[-1]
+            if self.echo:
+                self.echo(f"  ⏳ {table}: {updated} صف")
+            if self.pause_seconds:
+                time.sleep(self.pause_seconds)
+        return updated
+
+    def insert_select(self, table, source, values, where='1 = 1', key='id'):
+        """INSERT INTO table (columns) SELECT expressions FROM source - على دفعات حسب مفتاح المصدر
+
+        values: عمود الجدول الهدف -> تعبير SQL على صف المصدر.
+        """
+        preparer = self.engine.dialect.identifier_preparer
+        quoted_source = preparer.quote(source)
+        quoted_key = f"{quoted_source}.{preparer.quote(key)}"
+        columns = ', '.join(preparer.quote(column) for column in values)
+        expressions = ', '.join(values.values())
+        select_batch = text(
+            f"SELECT {quoted_key} FROM {quoted_source} "
+            f"WHERE {quoted_key} > :last_key AND ({where}) ORDER BY {quoted_key} LIMIT :limit"
+        )
+        insert_batch = text(
+            f"INSERT INTO {preparer.quote(table)} ({columns}) "
+            f"SELECT {expressions} FROM {quoted_source} WHERE {quoted_key} IN :keys"
+        ).bindparams(bindparam('keys', expanding=True))
+
+        inserted = 0
+        last_key = 0
+        while True:
+            with self.engine.begin() as connection:
+                keys = connection.execute(select_batch, {'last_key': last_key, 'limit': self.batch_size})\
+                    .scalars().all()
+                if not keys:
+                    break
+                connection.execute(insert_batch, {'keys': keys})
+            inserted += len(keys)
+            last_key = keys[-1]
+            if self.echo:
+                self.echo(f"  ⏳ {source} -> {table}: {inserted} صف")
+            if self.pause_seconds:
+                time.sleep(self.pause_seconds)
+        return inserted
+
+
+# ========================
+# تنفيذ الترحيلات
+# ========================
+def current_version(connection):
+    """أعلى إصدار مطبق، أو 0 لقاعدة أنشئت قبل نظام الترحيلات"""
+    if not inspect(connection).has_table(VERSION_TABLE):
+        return 0
+    return connection.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def applied_migrations(connection):
+    if not inspect(connection).has_table(VERSION_TABLE):
+        return []
+    return connection.execute(select(schema_version).order_by(schema_version.c.version)).fetchall()
+
+
+class _MigrationLock:
+    """قفل استشاري على PostgreSQL (عدة عقد تبدأ معاً)، وبدون أثر على SQLite"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.connection = None
+
+    def __enter__(self):
+        if self.engine.dialect.name == 'postgresql':
+            self.connection = self.engine.connect()
+            self.connection.execute(text("SELECT pg_advisory_lock(:key)"), {'key': ADVISORY_LOCK_KEY})
+            self.connection.commit()
+        return self
+
+    def __exit__(self, *exc):
+        if self.connection is not None:
+            self.connection.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': ADVISORY_LOCK_KEY})
+            self.connection.commit()
+            self.connection.close()
+
+
+def upgrade(engine, target=None, batch_size=1000, echo=print):
+    """تطبيق الترحيلات المعلقة حتى target (أو آخر إصدار)، يعيد قائمة الإصدارات المطبقة"""
+    from models import now_utc
+
+    migrations = discover()
+    applied = []
+    with _MigrationLock(engine):
+        with engine.begin() as connection:
+            schema_version.create(connection, checkfirst=True)
+            current = current_version(connection)
+
+        for migration in migrations:
+            if migration.version <= current or (target is not None and migration.version > target):
+                continue
+            echo(f"⬆️ {migration.version:03d} {migration.description}")
+            with engine.begin() as connection:
+                migration.up(Operations(connection))
+            migration.backfill(BatchBackfill(engine, batch_size=batch_size, echo=echo))
+            with engine.begin() as connection:
+                connection.execute(schema_version.insert().values(
+                    version=migration.version, name=migration.name, applied_at=now_utc()
+                ))
+            applied.append(migration.version)
+    return applied
+
+
+def downgrade(engine, target, echo=print):
+    """التراجع عن الترحيلات الأحدث من target بالترتيب العكسي"""
+    migrations = discover()
+    reverted = []
+    with _MigrationLock(engine):
+        with engine.connect() as connection:
+            current = current_version(connection)
+
+        pending = [migration for migration in reversed(migrations)
+                   if target < migration.version <= current]
+        # التحقق قبل البدء حتى لا يتوقف التراجع في منتصفه
+        for migration in pending:
+            if not migration.reversible:
+                raise MigrationError(f"الترحيل {migration.version:03d} لا يدعم التراجع")
+
+        for migration in pending:
+            echo(f"⬇️ {migration.version:03d} {migration.description}")
+            with engine.begin() as connection:
+                migration.down(Operations(connection))
+                connection.execute(schema_version.delete().where(schema_version.c.version == migration.version))
+            reverted.append(migration.version)
+    return reverted
+
+
+def check_schema(app, db):
+    """فحص بدء التشغيل: قراءة الإصدار فقط، والترقية التلقائية إن فُعّلت SCHEMA_AUTO_UPGRADE
+
+    يعيد True إذا كان المخطط محدثاً.
+    """
+    try:
+        with app.app_context():
+            with db.engine.connect() as connection:
+                current = current_version(connection)
+            latest = latest_version()
+            if current == latest:
+                return True
+            if current > latest:
+                print(f"⚠️ إصدار قاعدة البيانات ({current}) أحدث من الكود ({latest})")
+                return True
+            if app.config.get('SCHEMA_AUTO_UPGRADE'):
+                upgrade(db.engine)
+                return True
+            print(f"⚠️ مخطط قاعدة البيانات قديم ({current} < {latest}) - نفّذ: flask db-upgrade")
+            return False
+    except Exception as e:
+        print(f"❌ خطأ في فحص إصدار قاعدة البيانات: {e}")
+        return False
+    finally:
+        # عدم توريث اتصال مفتوح للعمليات الفرعية (gunicorn --preload يستنسخ العملية بعد الاستيراد)
+        with app.app_context():
+            db.engine.dispose()
@@ -0,0 +1,463 @@
+"""الإصدار الأساسي: مخطط قاعدة البيانات كما كان عند اعتماد نظام الترحيلات
+
+المخطط مُجمّد هنا ولا يُقرأ من النماذج، فلا يتغير هذا الإصدار عند تعديلها؛
+أي تغيير لاحق في المخطط يأتي في ترحيل جديد. قواعد البيانات الموجودة قبل نظام
+الترحيلات تحتفظ بجداولها، ويُنشأ فقط ما ينقصها.
+"""
+from sqlalchemy import (JSON, Boolean, Column, Date, DateTime, Float, ForeignKey, Index,
+                        Integer, LargeBinary, MetaData, String, Table, Text, UniqueConstraint)
+
+
+def _baseline_metadata():
+    metadata = MetaData()
+    Table('app_user', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('username', String(80), nullable=False, unique=True),
+          Column('email', String(120), unique=True),
+          Column('password_hash', String(200), nullable=False),
+          Column('full_name', String(100)),
+          Column('phone', String(20)),
+          Column('role', String(20)),
+          Column('permissions', JSON),
+          Column('is_active', Boolean),
+          Column('last_login', DateTime),
+          Column('created_at', DateTime)
+          )
+    Table('attachment_derivative', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('owner_type', String(30), nullable=False),
+          Column('owner_id', Integer, nullable=False),
+          Column('rendition', String(20), nullable=False),
+          Column('mime_type', String(50), nullable=False),
+          Column('width', Integer),
+          Column('height', Integer),
+          Column('file_size', Integer),
+          Column('content_hash', String(64), nullable=False),
+          Column('created_at', DateTime),
+          UniqueConstraint('owner_type', 'owner_id', 'rendition', name='uq_attachment_derivative_owner'),
+          Index('ix_attachment_derivative_content_hash', 'content_hash')
+          )
+    Table('background_job', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('kind', String(50), nullable=False),
+          Column('payload', JSON),
+          Column('status', String(20), nullable=False),
+          Column('attempts', Integer, nullable=False),
+          Column('max_attempts', Integer, nullable=False),
+          Column('run_after', DateTime, nullable=False),
+          Column('locked_at', DateTime),
+          Column('finished_at', DateTime),
+          Column('last_error', Text),
+          Column('created_at', DateTime),
+          Index('ix_background_job_status_run_after', 'status', 'run_after')
+          )
+    Table('debt', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('name', String(100), nullable=False),
+          Column('phone', String(40)),
+          Column('address', String(200)),
+          Column('debt_amount', Float),
+          Column('paid_amount', Float),
+          Column('start_date', Date),
+          Column('payment_date', Date),
+          Column('status', String(20)),
+          Column('created_at', DateTime),
+          Column('source_type', String(50)),
+          Column('source_id', Integer),
+          Column('description', Text),
+          Column('recorded_by', String(50)),
+          )
+    Table('evaluation_criteria', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('name', String(100), nullable=False),
+          Column('description', Text),
+          Column('max_score', Integer),
+          Column('weight', Float),
+          Column('bonus_per_point', Float),
+          Column('penalty_per_point', Float),
+          Column('is_active', Boolean),
+          Column('created_at', DateTime)
+          )
+    Table('expense_category', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('name', String(100), nullable=False),
+          Column('color', String(7)),
+          Column('icon', String(50)),
+          Column('created_at', DateTime)
+          )
+    Table('financial_summary', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('period', String(20)),
+          Column('period_date', Date),
+          Column('total_orders', Float),
+          Column('total_paid', Float),
+          Column('total_remaining', Float),
+          Column('total_expenses', Float),
+          Column('total_transports', Float),
+          Column('total_profits', Float),
+          Column('created_at', DateTime)
+          )
+    Table('job_watermark', metadata,
+          Column('name', String(50), primary_key=True),
+          Column('last_run_at', DateTime),
+          Column('last_full_run_at', DateTime),
+          Column('last_result', Integer),
+          Column('updated_at', DateTime)
+          )
+    Table('notification', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('user_id', String(50)),
+          Column('title', String(200)),
+          Column('message', Text),
+          Column('type', String(20)),
+          Column('is_read', Boolean),
+          Column('related_entity_type', String(50)),
+          Column('related_entity_id', Integer),
+          Column('created_at', DateTime)
+          )
+    Table('status', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('name', String(60), nullable=False),
+          Column('color', String(20)),
+          Column('is_system', Boolean),
+          Column('created_at', DateTime)
+          )
+    Table('supplier', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('name', String(100), nullable=False),
+          Column('phone', String(40)),
+          Column('address', String(200)),
+          Column('created_at', DateTime)
+          )
+    Table('system_settings', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('company_name', String(100)),
+          Column('logo', String(200)),
+          Column('currency', String(10)),
+          Column('language', String(10)),
+          Column('theme', String(20)),
+          Column('primary_color', String(7)),
+          Column('rows_per_page', Integer),
+          Column('compact_mode', Boolean),
+          Column('two_factor', Boolean),
+          Column('activity_logging', Boolean),
+          Column('session_timeout', Integer),
+          Column('password_strength', String(20)),
+          Column('email_notifications', Boolean),
+          Column('payment_notifications', Boolean),
+          Column('inventory_notifications', Boolean),
+          Column('notification_time', String(20)),
+          Column('updated_at', DateTime)
+          )
+    Table('transport_category', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('name', String(100), nullable=False),
+          Column('color', String(7)),
+          Column('icon', String(50)),
+          Column('created_at', DateTime)
+          )
+    Table('worker', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('name', String(100), nullable=False),
+          Column('phone', String(40), nullable=False),
+          Column('address', String(200)),
+          Column('id_card', String(50)),
+          Column('start_date', Date, nullable=False),
+          Column('monthly_salary', Float),
+          Column('absences', Float),
+          Column('outside_work_days', Integer),
+          Column('outside_work_bonus', Float),
+          Column('advances', Float),
+          Column('incentives', Float),
+          Column('late_hours', Float),
+          Column('is_active', Boolean),
+          Column('created_at', DateTime),
+          Column('username', String(80), unique=True),
+          Column('password_hash', String(200)),
+          Column('is_login_active', Boolean),
+          Column('last_login', DateTime),
+          Column('original_password', String(200))
+          )
+    Table('order', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('name', String(100)),
+          Column('wilaya', String(50)),
+          Column('product', String(200)),
+          Column('paid', Float),
+          Column('total', Float),
+          Column('note', Text),
+          Column('status_id', Integer, ForeignKey('status.id')),
+          Column('created_at', DateTime),
+          Column('is_paid', Boolean),
+          Column('production_details', Text),
+          Column('expected_delivery_date', Date),
+          Column('actual_delivery_date', Date),
+          Column('start_date', Date),
+          Column('completion_date', Date),
+          Column('is_travel_assignment', Boolean),
+          Column('media_attachments', JSON),
+          Column('assigned_worker_id', Integer, ForeignKey('worker.id')),
+          )
+    Table('product', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('name', String(200), nullable=False),
+          Column('category_id', Integer, ForeignKey('expense_category.id')),
+          Column('created_at', DateTime)
+          )
+    Table('product_price_history', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('product_name', String(200), nullable=False),
+          Column('supplier_id', Integer, ForeignKey('supplier.id')),
+          Column('price', Float),
+          Column('purchase_date', Date),
+          Column('recorded_by', String(50), nullable=False),
+          Column('created_at', DateTime)
+          )
+    Table('task', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('title', String(200), nullable=False),
+          Column('description', Text),
+          Column('priority', String(20)),
+          Column('status', String(20)),
+          Column('task_type', String(50)),
+          Column('assigned_to', String(50)),
+          Column('due_date', Date),
+          Column('related_entity_type', String(50)),
+          Column('related_entity_id', Integer),
+          Column('auto_generated', Boolean),
+          Column('created_by', String(50)),
+          Column('created_at', DateTime),
+          Column('updated_at', DateTime),
+          Column('completed_at', DateTime),
+          Column('notes', Text),
+          Column('task_scope', String(20)),
+          Column('worker_id', Integer, ForeignKey('worker.id')),
+          Column('assigned_by_partner', Boolean),
+          Column('visibility_scope', String(20)),
+          Column('waiting_approval', Boolean),
+          Column('completion_notes', Text),
+          Column('approved_by', String(50)),
+          Column('approval_date', DateTime),
+          Column('assignment_type', String(50)),
+          Column('admin_assigned_to', String(50)),
+          Column('admin_approval_required', Boolean),
+          Column('admin_approved', Boolean),
+          Column('admin_approved_by', String(50)),
+          Column('admin_approval_date', DateTime),
+          Column('suspension_requested', Boolean),
+          Column('suspension_reason', Text),
+          Column('suspension_approved', Boolean),
+          )
+    Table('transport_sub_type', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('name', String(100), nullable=False),
+          Column('category_id', Integer, ForeignKey('transport_category.id')),
+          Column('created_at', DateTime)
+          )
+    Table('user_permission', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('user_id', Integer, ForeignKey('app_user.id')),
+          Column('module', String(50)),
+          Column('can_view', Boolean),
+          Column('can_edit', Boolean),
+          Column('can_delete', Boolean),
+          Column('can_export', Boolean),
+          Column('created_at', DateTime)
+          )
+    Table('worker_attendance', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('worker_id', Integer, ForeignKey('worker.id')),
+          Column('date', Date),
+          Column('check_in_morning', DateTime),
+          Column('check_out_morning', DateTime),
+          Column('check_in_afternoon', DateTime),
+          Column('check_out_afternoon', DateTime),
+          Column('total_hours', Float),
+          Column('absence_hours', Float),
+          Column('location_verified', Boolean),
+          Column('notes', Text),
+          Column('created_at', DateTime)
+          )
+    Table('worker_history', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('worker_id', Integer, ForeignKey('worker.id')),
+          Column('change_type', String(120)),
+          Column('details', Text),
+          Column('amount', Float),
+          Column('timestamp', DateTime),
+          Column('user', String(50))
+          )
+    Table('worker_monthly_record', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('worker_id', Integer, ForeignKey('worker.id')),
+          Column('year', Integer, nullable=False),
+          Column('month', Integer, nullable=False),
+          Column('total_salary', Float),
+          Column('paid_amount', Float),
+          Column('advances', Float),
+          Column('absences', Float),
+          Column('late_hours', Float),
+          Column('outside_work_days', Integer),
+          Column('outside_work_bonus', Float),
+          Column('incentives', Float),
+          Column('penalties', Float),
+          Column('notes', Text),
+          Column('recorded_by', String(50)),
+          Column('created_at', DateTime)
+          )
+    Table('attachment_notes', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('order_id', Integer, ForeignKey('order.id')),
+          Column('notes_content', Text, nullable=False),
+          Column('created_by', String(50), nullable=False),
+          Column('created_at', DateTime),
+          Column('updated_at', DateTime)
+          )
+    Table('expense', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('category_id', Integer, ForeignKey('expense_category.id')),
+          Column('description', String(200), nullable=False),
+          Column('amount', Float),
+          Column('quantity', Integer),
+          Column('unit_price', Float),
+          Column('total_amount', Float),
+          Column('supplier_id', Integer, ForeignKey('supplier.id')),
+          Column('order_id', Integer, ForeignKey('order.id')),
+          Column('purchased_by', String(50)),
+          Column('recorded_by', String(50), nullable=False),
+          Column('purchase_date', Date),
+          Column('payment_status', String(20)),
+          Column('payment_method', String(20)),
+          Column('notes', Text),
+          Column('created_at', DateTime),
+          Column('paid_amount', Float),
+          )
+    Table('order_assignment', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('order_id', Integer, ForeignKey('order.id')),
+          Column('worker_id', Integer, ForeignKey('worker.id')),
+          Column('assignment_type', String(20)),
+          Column('assigned_date', DateTime),
+          Column('completed_date', DateTime),
+          Column('is_active', Boolean),
+          Column('notes', Text),
+          Column('assigned_by', String(50)),
+          )
+    Table('order_attachment', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('order_id', Integer, ForeignKey('order.id')),
+          Column('filename', String(255), nullable=False),
+          Column('original_filename', String(255), nullable=False),
+          Column('file_size', Integer),
+          Column('mime_type', String(100)),
+          Column('file_data', LargeBinary),
+          Column('file_type', String(20)),
+          Column('description', String(200)),
+          Column('captured_at', DateTime),
+          Column('captured_by', String(50), nullable=False),
+          )
+    Table('order_financials', metadata,
+          Column('order_id', Integer, ForeignKey('order.id'), primary_key=True),
+          Column('expenses_total', Float),
+          Column('transports_total', Float),
+          Column('expense_debt_remaining', Float),
+          Column('transport_debt_remaining', Float),
+          Column('profit', Float),
+          Column('updated_at', DateTime)
+          )
+    Table('order_history', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('order_id', Integer, ForeignKey('order.id')),
+          Column('change_type', String(120)),
+          Column('details', Text),
+          Column('timestamp', DateTime),
+          Column('user', String(50)),
+          )
+    Table('phone_number', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('order_id', Integer, ForeignKey('order.id')),
+          Column('number', String(40), nullable=False),
+          Column('is_primary', Boolean)
+          )
+    Table('purchase', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('supplier_id', Integer, ForeignKey('supplier.id')),
+          Column('product_id', Integer, ForeignKey('product.id')),
+          Column('price', Float),
+          Column('quantity', Integer),
+          Column('total_price', Float),
+          Column('purchase_date', Date),
+          Column('status', String(20)),
+          Column('type', String(20)),
+          Column('created_at', DateTime)
+          )
+    Table('transport', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('name', String(100), nullable=False),
+          Column('phone', String(40)),
+          Column('address', String(200)),
+          Column('transport_amount', Float),
+          Column('destination', String(200)),
+          Column('paid_amount', Float),
+          Column('type', String(20)),
+          Column('order_id', Integer, ForeignKey('order.id')),
+          Column('category_id', Integer, ForeignKey('transport_category.id')),
+          Column('sub_type_id', Integer, ForeignKey('transport_sub_type.id')),
+          Column('transport_method', String(50)),
+          Column('purpose', String(200)),
+          Column('distance', Float),
+          Column('notes', Text),
+          Column('is_quick', Boolean),
+          Column('recorded_by', String(50), nullable=False),
+          Column('transport_date', Date),
+          Column('created_at', DateTime),
+          )
+    Table('worker_evaluation', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('worker_id', Integer, ForeignKey('worker.id')),
+          Column('order_id', Integer, ForeignKey('order.id')),
+          Column('evaluation_date', Date),
+          Column('quality_score', Integer),
+          Column('timing_score', Integer),
+          Column('accuracy_score', Integer),
+          Column('efficiency_score', Integer),
+          Column('total_score', Integer),
+          Column('bonus_amount', Float),
+          Column('penalty_amount', Float),
+          Column('notes', Text),
+          Column('evaluated_by', String(50)),
+          Column('created_at', DateTime)
+          )
+    Table('expense_receipt', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('expense_id', Integer, ForeignKey('expense.id')),
+          Column('filename', String(255), nullable=False),
+          Column('original_filename', String(255), nullable=False),
+          Column('file_path', String(500)),
+          Column('file_size', Integer),
+          Column('mime_type', String(100)),
+          Column('image_data', LargeBinary),
+          Column('captured_at', DateTime),
+          Column('captured_by', String(50), nullable=False),
+          )
+    Table('transport_receipt', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('transport_id', Integer, ForeignKey('transport.id')),
+          Column('filename', String(255), nullable=False),
+          Column('original_filename', String(255), nullable=False),
+          Column('file_size', Integer),
+          Column('mime_type', String(100)),
+          Column('image_data', LargeBinary),
+          Column('captured_at', DateTime),
+          Column('captured_by', String(50), nullable=False)
+          )
+
+    return metadata
+
+
+def up(op):
+    op.create_tables(_baseline_metadata())
+
+
+def down(op):
+    op.drop_tables(_baseline_metadata())
@@ -0,0 +1,16 @@
+"""إضافة content_hash لجداول المرفقات والفواتير (مخزن الملفات خارج القاعدة)"""
+from sqlalchemy import Column, String
+
+TABLES = ('order_attachment', 'expense_receipt', 'transport_receipt')
+
+
+def up(op):
+    for table in TABLES:
+        op.add_column(table, Column('content_hash', String(64)))
+        op.create_index(f'ix_{table}_content_hash', table, ['content_hash'])
+
+
+def down(op):
+    for table in TABLES:
+        op.drop_index(f'ix_{table}_content_hash', table)
+        op.drop_column(table, 'content_hash')
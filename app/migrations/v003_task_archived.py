@@ -0,0 +1,17 @@
+"""إضافة عمود archived للمهام وتعبئة الصفوف القديمة بـ False
+
+بدون التعبئة تبقى القيمة NULL فتختفي المهام القديمة من الاستعلامات التي تفلتر archived == False.
+"""
+from sqlalchemy import Column, Boolean, false
+
+
+def up(op):
+    op.add_column('task', Column('archived', Boolean, server_default=false()))
+
+
+def backfill(batch):
+    batch.update('task', {'archived': False}, where='archived IS NULL')
+
+
+def down(op):
+    op.drop_column('task', 'archived')
@@ -0,0 +1,23 @@
+"""فهارس الاستعلامات الساخنة (الديون، المصاريف والنقل حسب الطلبية، السجل، المهام، التعيينات)"""
+
+INDEXES = (
+    ('ix_debt_status_source', 'debt', ['status', 'source_type', 'source_id']),
+    ('ix_expense_order_id', 'expense', ['order_id']),
+    ('ix_transport_order_id', 'transport', ['order_id']),
+    ('ix_order_history_order_timestamp', 'order_history', ['order_id', 'timestamp']),
+    ('ix_task_status_priority_due', 'task', ['status', 'priority', 'due_date']),
+    ('ix_task_related_entity', 'task', ['related_entity_type', 'related_entity_id']),
+    ('ix_order_is_paid_created_at', 'order', ['is_paid', 'created_at']),
+    ('ix_order_assignment_order_active', 'order_assignment', ['order_id', 'is_active']),
+    ('ix_order_assignment_worker_active', 'order_assignment', ['worker_id', 'is_active']),
+)
+
+
+def up(op):
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def down(op):
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table)
@@ -0,0 +1,20 @@
+"""فهارس (created_at, id) لترقيم صفحات القوائم بطريقة keyset"""
+
+INDEXES = (
+    ('ix_order_created_at_id', 'order', ['created_at', 'id']),
+    ('ix_expense_created_at_id', 'expense', ['created_at', 'id']),
+    ('ix_transport_created_at_id', 'transport', ['created_at', 'id']),
+    ('ix_debt_created_at_id', 'debt', ['created_at', 'id']),
+    ('ix_worker_created_at_id', 'worker', ['created_at', 'id']),
+    ('ix_task_created_at_id', 'task', ['created_at', 'id']),
+)
+
+
+def up(op):
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def down(op):
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table)
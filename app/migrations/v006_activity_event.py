@@ -0,0 +1,97 @@
+"""جدول activity_event الموحد للأحداث وتعبئته من السجلات الحالية
+
+كل حدث قديم (سجل طلبية أو عامل، مصروف، نقل) يُنسخ مرة واحدة بنوعه المحسوب في SQL،
+وشرط NOT EXISTS على (source, source_id) يسمح باستئناف التعبئة بعد أي انقطاع.
+"""
+from sqlalchemy import MetaData
+
+# تاريخ للصفوف القديمة بدون وقت (activity_event.timestamp إلزامي) فتظهر في آخر القائمة
+MISSING_TIMESTAMP = "'1970-01-01 00:00:00'"
+
+ORDER_KIND = (
+    "CASE"
+    " WHEN change_type LIKE '%دفع%' THEN 'payment'"
+    " WHEN change_type LIKE '%نقل%' THEN 'transport'"
+    " WHEN change_type LIKE '%مصروف%' THEN 'expense'"
+    " WHEN change_type LIKE '%عامل%' OR change_type LIKE '%تعيين%' THEN 'worker'"
+    " ELSE 'order' END"
+)
+
+
+def _not_copied(source):
+    return (
+        "NOT EXISTS (SELECT 1 FROM activity_event"
+        f" WHERE activity_event.source = '{source}' AND activity_event.source_id = {source}.id)"
+    )
+
+
+SOURCES = (
+    ('order_history', {
+        'timestamp': f"COALESCE(timestamp, {MISSING_TIMESTAMP})",
+        'kind': ORDER_KIND,
+        'action': "change_type",
+        'details': "details",
+        'amount': "0.0",
+        'user': "COALESCE(\"user\", 'النظام')",
+        'order_id': "order_id",
+        'entity_type': "'order'",
+        'entity_id': "order_id",
+        'source': "'order_history'",
+        'source_id': "id",
+    }),
+    ('worker_history', {
+        'timestamp': f"COALESCE(timestamp, {MISSING_TIMESTAMP})",
+        'kind': "'worker'",
+        'action': "change_type",
+        'details': "details",
+        'amount': "COALESCE(amount, 0.0)",
+        'user': "COALESCE(\"user\", 'النظام')",
+        'entity_type': "'worker'",
+        'entity_id': "worker_id",
+        'source': "'worker_history'",
+        'source_id': "id",
+    }),
+    ('expense', {
+        'timestamp': f"COALESCE(created_at, {MISSING_TIMESTAMP})",
+        'kind': "'expense'",
+        'action': "'مصروف جديد'",
+        'details': "description || ' - ' || total_amount || ' دج'",
+        'amount': "COALESCE(total_amount, 0.0)",
+        'user': "recorded_by",
+        'order_id': "order_id",
+        'entity_type': "'expense'",
+        'entity_id': "id",
+        'source': "'expense'",
+        'source_id': "id",
+    }),
+    ('transport', {
+        'timestamp': f"COALESCE(created_at, {MISSING_TIMESTAMP})",
+        'kind': "'transport'",
+        'action': "'نقل جديد'",
+        'details': "purpose || ' - ' || transport_amount || ' دج'",
+        'amount': "COALESCE(transport_amount, 0.0)",
+        'user': "recorded_by",
+        'order_id': "order_id",
+        'entity_type': "'transport'",
+        'entity_id': "id",
+        'source': "'transport'",
+        'source_id': "id",
+    }),
+)
+
+
+def up(op):
+    from models import ActivityEvent
+    metadata = MetaData()
+    ActivityEvent.__table__.to_metadata(metadata)
+    op.create_tables(metadata)
+
+
+def backfill(batch):
+    for source, values in SOURCES:
+        batch.insert_select('activity_event', source, values, where=_not_copied(source))
+
+
+def down(op):
+    if op.has_table('activity_event'):
+        op.execute("DROP TABLE activity_event")
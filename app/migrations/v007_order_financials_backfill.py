@@ -0,0 +1,20 @@
+"""تعبئة جدول الملخص المالي order_financials للطلبيات الموجودة
+
+الجدول يُحدّث تدريجياً عند كل تعديل فقط، فقواعد البيانات الموجودة قبل إنشائه
+تبقى بملخص فارغ للطلبيات القديمة حتى تُعاد بناؤه مرة واحدة هنا.
+"""
+
+
+def up(op):
+    from sqlalchemy import MetaData
+    from models import OrderFinancials
+    metadata = MetaData()
+    OrderFinancials.__table__.to_metadata(metadata)
+    op.create_tables(metadata)
+
+
+def backfill(batch):
+    from financials import rebuild_order_financials
+    result = rebuild_order_financials(batch_size=batch.batch_size)
+    if batch.echo:
+        batch.echo(f"  ⏳ order_financials: {result['drifted_orders']} طلبية من {result['total_orders']}")
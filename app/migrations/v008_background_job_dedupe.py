@@ -0,0 +1,19 @@
+"""عمود dedupe_key لجدول background_job مع فهرس فريد جزئي على المهام المنتظرة
+
+المهام الدورية تُضاف بمفتاح يساوي نوعها، فلا تُجدول مرتين عند تشغيل عدة عمليات معاً.
+الصفوف القديمة تبقى بدون مفتاح (NULL لا يتعارض مع الفهرس الفريد).
+"""
+from sqlalchemy import Column, String
+
+PENDING = "status = 'pending'"
+
+
+def up(op):
+    op.add_column('background_job', Column('dedupe_key', String(50)))
+    op.create_index('uq_background_job_pending_dedupe', 'background_job', ['dedupe_key'],
+                    unique=True, where=PENDING)
+
+
+def down(op):
+    op.drop_index('uq_background_job_pending_dedupe', 'background_job')
+    op.drop_column('background_job', 'dedupe_key')
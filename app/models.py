@@ -2,6 +2,8 @@
 from datetime import datetime, timezone, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import deferred
+from sqlalchemy.ext.hybrid import hybrid_property
 import json
 
 db = SQLAlchemy()
@@ -60,40 +62,38 @@ def create_or_update_order_task(order_id, worker_id, assignment_type, user_name)
 def sync_all_assigned_orders_with_tasks():
     """مزامنة جميع التعيينات مع المهام"""
     try:
-        active_assignments = OrderAssignment.query.filter_by(is_active=True).all()
-        tasks_created = 0
+        # مفاتيح المهام المعلقة الموجودة في استعلام واحد بدل استعلام لكل تعيين
+        existing_keys = prefetch_open_task_keys(['order'], statuses=['pending'])
+        active_assignments = db.session.query(
+                OrderAssignment.order_id, OrderAssignment.worker_id, OrderAssignment.assignment_type,
+                Order.name, Worker.name
+            )\
+            .join(Order, Order.id == OrderAssignment.order_id)\
+            .join(Worker, Worker.id == OrderAssignment.worker_id)\
+            .filter(OrderAssignment.is_active == True)\
+            .all()
         
-        for assignment in active_assignments:
-            # التحقق من عدم وجود مهمة نشطة بالفعل
-            existing_task = Task.query.filter_by(
-                related_entity_type='order',
-                related_entity_id=assignment.order_id,
-                worker_id=assignment.worker_id,
-                status='pending'
-            ).first()
-            
-            if not existing_task:
-                order = Order.query.get(assignment.order_id)
-                worker = Worker.query.get(assignment.worker_id)
-                
-                if order and worker:
-                    task = Task(
-                        title=f"طلبية #{order.id} - {assignment.assignment_type}",
-                        description=f"تنفيذ طلبية للعميل {order.name}",
-                        priority='medium',
-                        task_type='order_execution',
-                        task_scope='workshop',
-                        worker_id=worker.id,
-                        assigned_to=worker.name,
-                        due_date=datetime.now(timezone.utc).date() + timedelta(days=3),
-                        related_entity_type='order',
-                        related_entity_id=order.id,
-                        related_entity_info=f"العميل: {order.name} - المنتج: {order.product}",
-                        created_by='system'
-                    )
-                    db.session.add(task)
-                    tasks_created += 1
+        new_tasks = []
+        for order_id, worker_id, assignment_type, customer_name, worker_name in active_assignments:
+            key = ('order', order_id, worker_id)
+            if key in existing_keys:
+                continue
+            existing_keys.add(key)
+            new_tasks.append({
+                'title': f"طلبية #{order_id} - {assignment_type}",
+                'description': f"تنفيذ طلبية للعميل {customer_name}",
+                'priority': 'medium',
+                'task_type': 'order_execution',
+                'task_scope': 'workshop',
+                'worker_id': worker_id,
+                'assigned_to': worker_name,
+                'due_date': datetime.now(timezone.utc).date() + timedelta(days=3),
+                'related_entity_type': 'order',
+                'related_entity_id': order_id,
+                'created_by': 'system'
+            })
         
+        tasks_created = bulk_insert_tasks(new_tasks)
         db.session.commit()
         return tasks_created
     except Exception as e:
@@ -101,11 +101,6 @@ def sync_all_assigned_orders_with_tasks():
         print(f"❌ خطأ في مزامنة المهام: {e}")
         return 0
 
-def is_admin_user(username):
-    """التحقق إذا كان المستخدم مسؤول"""
-    user = User.query.filter_by(username=username).first()
-    return user and user.role in ['admin', 'manager']
-    
 class Status(db.Model):
     __tablename__ = 'status'
     id = db.Column(db.Integer, primary_key=True)
@@ -119,6 +114,10 @@ class Status(db.Model):
 
 class Order(db.Model):
     __tablename__ = 'order'
+    __table_args__ = (
+        db.Index('ix_order_is_paid_created_at', 'is_paid', 'created_at'),
+        db.Index('ix_order_created_at_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100))
     wilaya = db.Column(db.String(50))
@@ -151,18 +150,17 @@ class Order(db.Model):
     assigned_worker = db.relationship('Worker', backref='assigned_orders')
     
     # ========== 🆕 الخصائص الجديدة للديون المرتبطة ==========
+    # جميع الخصائص المالية تقرأ من محرك financials عبر ذاكرة الطلب،
+    # فعرض قائمة طلبيات يكلف عدداً ثابتاً من الاستعلامات بدل استعلامات لكل طلبية
+    def _financials(self):
+        from financials import get_order_financials
+        return get_order_financials(self)
+
     @property
     def total_expense_debts(self):
         """إجمالي ديون المصاريف المرتبطة بالطلبية"""
         try:
-            expense_debts = db.session.query(Debt)\
-                .join(Expense, Debt.source_id == Expense.id)\
-                .filter(
-                    Expense.order_id == self.id,
-                    Debt.status == 'unpaid',
-                    Debt.source_type == 'expense'
-                ).all()
-            return sum(debt.remaining_amount for debt in expense_debts)
+            return self._financials()['expense_debts']
         except Exception as e:
             print(f"❌ خطأ في حساب ديون مصاريف الطلبية {self.id}: {e}")
             return 0.0
@@ -171,14 +169,7 @@ class Order(db.Model):
     def total_transport_debts(self):
         """إجمالي ديون النقل المرتبطة بالطلبية"""
         try:
-            transport_debts = db.session.query(Debt)\
-                .join(Transport, Debt.source_id == Transport.id)\
-                .filter(
-                    Transport.order_id == self.id,
-                    Debt.status == 'unpaid',
-                    Debt.source_type == 'transport'
-                ).all()
-            return sum(debt.remaining_amount for debt in transport_debts)
+            return self._financials()['transport_debts']
         except Exception as e:
             print(f"❌ خطأ في حساب ديون نقل الطلبية {self.id}: {e}")
             return 0.0
@@ -207,24 +198,18 @@ class Order(db.Model):
 
     @property
     def total_expenses(self):
-        """إجمالي المصاريف المرتبطة بالطلبية - الإصلاح النهائي"""
+        """إجمالي المصاريف المرتبطة بالطلبية"""
         try:
-            # الاستعلام المباشر من قاعدة البيانات
-            from models import Expense
-            expenses = Expense.query.filter_by(order_id=self.id).all()
-            return sum(expense.total_amount for expense in expenses)
+            return self._financials()['total_expenses']
         except Exception as e:
             print(f"❌ خطأ في حساب مصاريف الطلبية {self.id}: {e}")
             return 0.0
 
     @property
     def total_transports(self):
-        """إجمالي تكاليف النقل المرتبطة بالطلبية - الإصلاح النهائي"""
+        """إجمالي تكاليف النقل المرتبطة بالطلبية"""
         try:
-            # الاستعلام المباشر من قاعدة البيانات
-            from models import Transport
-            transports = Transport.query.filter_by(order_id=self.id).all()
-            return sum(transport.transport_amount for transport in transports)
+            return self._financials()['total_transports']
         except Exception as e:
             print(f"❌ خطأ في حساب نقل الطلبية {self.id}: {e}")
             return 0.0
@@ -288,6 +273,9 @@ class PhoneNumber(db.Model):
 
 class OrderHistory(db.Model):
     __tablename__ = 'order_history'
+    __table_args__ = (
+        db.Index('ix_order_history_order_timestamp', 'order_id', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'))
     change_type = db.Column(db.String(120))
@@ -301,6 +289,10 @@ class OrderHistory(db.Model):
 
 class OrderAssignment(db.Model):
     __tablename__ = 'order_assignment'
+    __table_args__ = (
+        db.Index('ix_order_assignment_order_active', 'order_id', 'is_active'),
+        db.Index('ix_order_assignment_worker_active', 'worker_id', 'is_active'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'))
     worker_id = db.Column(db.Integer, db.ForeignKey('worker.id'))
@@ -328,6 +320,9 @@ class WorkerHistory(db.Model):
 
 class Worker(db.Model):
     __tablename__ = 'worker'
+    __table_args__ = (
+        db.Index('ix_worker_created_at_id', 'created_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -384,29 +379,24 @@ class Worker(db.Model):
     def password(self, password):
         self.set_password(password)
 
-    @property
+    @hybrid_property
     def total_salary(self):
-        """حساب الراتب الإجمالي المستحق بدقة"""
+        """الراتب الإجمالي المستحق حتى اليوم (انظر payroll.py)"""
+        return self.salary_as_of()
+
+    @total_salary.expression
+    def total_salary(cls):
+        # تعبير SQL: يسمح بـ func.sum(Worker.total_salary) والترتيب والفلترة في قاعدة البيانات
+        from payroll import total_salary_expression
+        return total_salary_expression()
+
+    def salary_as_of(self, as_of=None):
+        """الراتب المستحق حتى تاريخ as_of"""
+        from payroll import salary_breakdown
         try:
-            today = now_utc().date()
-            days_since_start = (today - self.start_date).days
-            days_worked = max(0, days_since_start)
-            
-            daily_salary = self.monthly_salary / 30.0
-            base_salary = days_worked * daily_salary
-            
-            absence_deduction = self.absences * daily_salary
-            late_deduction = (self.late_hours or 0) * 500
-            
-            total = (base_salary + 
-                    self.outside_work_bonus + 
-                    self.incentives - 
-                    self.advances - 
-                    absence_deduction - 
-                    late_deduction)
-            
-            return max(0, round(total, 2))
-        except:
+            return salary_breakdown(self, as_of)['total_salary']
+        except Exception as e:
+            print(f"❌ خطأ في حساب راتب العامل {self.id}: {e}")
             return 0.0
 
     @property
@@ -424,38 +414,8 @@ class Worker(db.Model):
 
 def get_orders_health_stats():
     """جلب إحصائيات صحة الطلبيات بدون تكرار"""
-    try:
-        all_orders = Order.query.all()
-        total_orders = len(all_orders)
-
-        healthy_orders = [order for order in all_orders if order.total_related_debts == 0]
-        healthy_count = len(healthy_orders)
-
-        debt_orders = [order for order in all_orders if order.total_related_debts > 0]
-        debt_count = len(debt_orders)
-
-        total_debts_amount = sum(order.total_related_debts for order in debt_orders)
-
-        return {
-            'total_orders': total_orders,
-            'healthy_orders': healthy_count,
-            'debt_orders': debt_count,
-            'total_debts_amount': total_debts_amount,
-            'healthy_percentage': (healthy_count / total_orders * 100) if total_orders > 0 else 0,
-            'debt_percentage': (debt_count / total_orders * 100) if total_orders > 0 else 0
-        }
-
-    except Exception as e:
-        print(f"❌ خطأ في حساب إحصائيات الصحة: {e}")
-
-        return {
-            'total_orders': 0,
-            'healthy_orders': 0,
-            'debt_orders': 0,
-            'total_debts_amount': 0,
-            'healthy_percentage': 0,
-            'debt_percentage': 0
-        }
+    from financials import get_orders_health_stats as compute_health_stats
+    return compute_health_stats()
 
 
 class WorkerAttendance(db.Model):
@@ -492,6 +452,9 @@ class ExpenseCategory(db.Model):
 
 class Expense(db.Model):
     __tablename__ = 'expense'
+    __table_args__ = (
+        db.Index('ix_expense_created_at_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     category_id = db.Column(db.Integer, db.ForeignKey('expense_category.id'))
     description = db.Column(db.String(200), nullable=False)
@@ -500,7 +463,7 @@ class Expense(db.Model):
     unit_price = db.Column(db.Float, default=0.0)
     total_amount = db.Column(db.Float, default=0.0)
     supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id'))
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=True)  # ربط المصروف بالطلبية
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=True, index=True)  # ربط المصروف بالطلبية
     purchased_by = db.Column(db.String(50), default='owner')
     recorded_by = db.Column(db.String(50), nullable=False)
     purchase_date = db.Column(db.Date, default=lambda: now_utc().date())
@@ -617,7 +580,9 @@ class TransportReceipt(db.Model):
     original_filename = db.Column(db.String(255), nullable=False)
     file_size = db.Column(db.Integer)
     mime_type = db.Column(db.String(100))
-    image_data = db.Column(db.LargeBinary)
+    # قديم - المحتوى الآن في مخزن الملفات؛ لا يُحمَّل إلا عند طلبه صراحةً (undefer)
+    image_data = deferred(db.Column(db.LargeBinary), raiseload=True)
+    content_hash = db.Column(db.String(64), index=True)
     captured_at = db.Column(db.DateTime, default=now_utc)
     captured_by = db.Column(db.String(50), nullable=False)
     
@@ -625,6 +590,9 @@ class TransportReceipt(db.Model):
 
 class Transport(db.Model):
     __tablename__ = 'transport'
+    __table_args__ = (
+        db.Index('ix_transport_created_at_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(40))
@@ -633,7 +601,7 @@ class Transport(db.Model):
     destination = db.Column(db.String(200))
     paid_amount = db.Column(db.Float, default=0.0)
     type = db.Column(db.String(20), default="inside")
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'))  # ربط النقل بالطلبية
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), index=True)  # ربط النقل بالطلبية
     
     # الحقول الجديدة للنظام المحسّن
     category_id = db.Column(db.Integer, db.ForeignKey('transport_category.id'))
@@ -662,6 +630,10 @@ class Transport(db.Model):
 
 class Debt(db.Model):
     __tablename__ = 'debt'
+    __table_args__ = (
+        db.Index('ix_debt_status_source', 'status', 'source_type', 'source_id'),
+        db.Index('ix_debt_created_at_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(40))
@@ -731,55 +703,40 @@ class User(db.Model):
 # 👤 نظام تتبع المستخدمين المحسن
 # ========================
 
-def record_activity(user_name, entity_type, entity_id, action, details, amount=0.0):
-    """تسجيل نشاط المستخدم في النظام - محدث"""
+class ActivityEvent(db.Model):
+    """سجل أحداث موحد للإضافة فقط (يُكتب من activity_stream عند إضافة أي سجل أو مصروف أو نقل)
+
+    order_id بدون مفتاح خارجي: الأحداث تبقى بعد حذف الطلبية.
+    """
+    __tablename__ = 'activity_event'
+    __table_args__ = (
+        db.Index('ix_activity_event_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_activity_event_kind_timestamp_id', 'kind', 'timestamp', 'id'),
+        db.Index('ix_activity_event_user_timestamp_id', 'user', 'timestamp', 'id'),
+        db.Index('ux_activity_event_source', 'source', 'source_id', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    timestamp = db.Column(db.DateTime, default=now_utc, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # order, payment, transport, expense, worker, debt
+    action = db.Column(db.String(120))
+    details = db.Column(db.Text)
+    amount = db.Column(db.Float, default=0.0)
+    user = db.Column(db.String(50))
+    order_id = db.Column(db.Integer)
+    entity_type = db.Column(db.String(20))
+    entity_id = db.Column(db.Integer)
+    source = db.Column(db.String(20))  # الجدول الأصلي للحدث: order_history, worker_history, expense, transport
+    source_id = db.Column(db.Integer)
+
+def record_activity(user_name, entity_type, entity_id, action, details, amount=0.0, order_id=None, priority='normal'):
+    """تسجيل نشاط المستخدم ضمن معاملة المستدعي - يُثبّت مع commit العملية نفسها (انظر audit.py)"""
+    from audit import log_entity_activity
     try:
-        if entity_type == 'order':
-            history = OrderHistory(
-                order_id=entity_id,
-                change_type=action,
-                details=details,
-                user=user_name
-            )
-            db.session.add(history)
-        
-        elif entity_type == 'expense':
-            expense = Expense.query.get(entity_id)
-            if expense and expense.order_id:
-                history = OrderHistory(
-                    order_id=expense.order_id,
-                    change_type="مصروف",
-                    details=f"{details} - المبلغ: {amount} دج",
-                    user=user_name
-                )
-                db.session.add(history)
-        
-        elif entity_type == 'transport':
-            transport = Transport.query.get(entity_id)
-            if transport and transport.order_id:
-                history = OrderHistory(
-                    order_id=transport.order_id,
-                    change_type="نقل",
-                    details=f"{details} - المبلغ: {amount} دج",
-                    user=user_name
-                )
-                db.session.add(history)
-        
-        elif entity_type == 'worker':
-            history = WorkerHistory(
-                worker_id=entity_id,
-                change_type=action,
-                details=details,
-                amount=amount,
-                user=user_name
-            )
-            db.session.add(history)
-        
-        db.session.commit()
+        log_entity_activity(user_name, entity_type, entity_id, action, details, amount,
+                            order_id=order_id, priority=priority)
         return True
         
     except Exception as e:
-        db.session.rollback()
         print(f"❌ خطأ في تسجيل النشاط: {e}")
         return False
 
@@ -821,7 +778,9 @@ class ExpenseReceipt(db.Model):
     file_path = db.Column(db.String(500))
     file_size = db.Column(db.Integer)
     mime_type = db.Column(db.String(100))
-    image_data = db.Column(db.LargeBinary)
+    # قديم - المحتوى الآن في مخزن الملفات؛ لا يُحمَّل إلا عند طلبه صراحةً (undefer)
+    image_data = deferred(db.Column(db.LargeBinary), raiseload=True)
+    content_hash = db.Column(db.String(64), index=True)
     captured_at = db.Column(db.DateTime, default=now_utc)
     captured_by = db.Column(db.String(50), nullable=False)
     
@@ -839,12 +798,31 @@ class OrderAttachment(db.Model):
     original_filename = db.Column(db.String(255), nullable=False)
     file_size = db.Column(db.Integer)
     mime_type = db.Column(db.String(100))
-    file_data = db.Column(db.LargeBinary)
+    # قديم - المحتوى الآن في مخزن الملفات؛ لا يُحمَّل إلا عند طلبه صراحةً (undefer)
+    file_data = deferred(db.Column(db.LargeBinary), raiseload=True)
+    content_hash = db.Column(db.String(64), index=True)
     file_type = db.Column(db.String(20))
     description = db.Column(db.String(200))
     captured_at = db.Column(db.DateTime, default=now_utc)
     captured_by = db.Column(db.String(50), nullable=False)
 
+class AttachmentDerivative(db.Model):
+    """نسخ مصغرة مولدة مسبقاً للمرفقات والفواتير (thumb / preview)"""
+    __tablename__ = 'attachment_derivative'
+    __table_args__ = (
+        db.UniqueConstraint('owner_type', 'owner_id', 'rendition', name='uq_attachment_derivative_owner'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    owner_type = db.Column(db.String(30), nullable=False)  # attachment / expense_receipt / transport_receipt
+    owner_id = db.Column(db.Integer, nullable=False)
+    rendition = db.Column(db.String(20), nullable=False)  # thumb / preview
+    mime_type = db.Column(db.String(50), nullable=False)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    file_size = db.Column(db.Integer)
+    content_hash = db.Column(db.String(64), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=now_utc)
+
 # ========================
 # 📎 ATTACHMENT NOTES MODEL
 # ========================
@@ -904,6 +882,42 @@ class Notification(db.Model):
     related_entity_id = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=now_utc)
 
+# ========================
+# ⏳ قائمة المهام الخلفية
+# ========================
+
+class BackgroundJob(db.Model):
+    """مهمة في قائمة الانتظار الدائمة - تُنفذ خارج طلبات الويب"""
+    __tablename__ = 'background_job'
+    __table_args__ = (
+        db.Index('ix_background_job_status_run_after', 'status', 'run_after'),
+        # مهمة منتظرة واحدة فقط لكل مفتاح (المهام الدورية) حتى مع عدة عمليات تجدول في نفس الوقت
+        db.Index('uq_background_job_pending_dedupe', 'dedupe_key', unique=True,
+                 sqlite_where=db.text("status = 'pending'"),
+                 postgresql_where=db.text("status = 'pending'")),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    dedupe_key = db.Column(db.String(50))
+    payload = db.Column(db.JSON, default=dict)
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending / running / done / failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=5, nullable=False)
+    run_after = db.Column(db.DateTime, default=now_utc, nullable=False)
+    locked_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=now_utc)
+
+class JobWatermark(db.Model):
+    """آخر تشغيل لمهمة دورية - لتفحص فقط ما تغير بعده"""
+    __tablename__ = 'job_watermark'
+    name = db.Column(db.String(50), primary_key=True)
+    last_run_at = db.Column(db.DateTime)
+    last_full_run_at = db.Column(db.DateTime)
+    last_result = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=now_utc, onupdate=now_utc)
+
 # ========================
 # 📊 نظام الإحصائيات المتقدم
 # ========================
@@ -921,10 +935,25 @@ class FinancialSummary(db.Model):
     total_profits = db.Column(db.Float, default=0.0)
     created_at = db.Column(db.DateTime, default=now_utc)
 
+class OrderFinancials(db.Model):
+    """ملخص مالي مجمّع لكل طلبية - يتم تحديثه تلقائياً عند تغيير المصاريف أو النقل أو الديون"""
+    __tablename__ = 'order_financials'
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id', ondelete='CASCADE'), primary_key=True)
+    expenses_total = db.Column(db.Float, default=0.0)
+    transports_total = db.Column(db.Float, default=0.0)
+    expense_debt_remaining = db.Column(db.Float, default=0.0)
+    transport_debt_remaining = db.Column(db.Float, default=0.0)
+    profit = db.Column(db.Float, default=0.0)
+    updated_at = db.Column(db.DateTime, default=now_utc, onupdate=now_utc)
+
+    @property
+    def debt_remaining(self):
+        return round((self.expense_debt_remaining or 0) + (self.transport_debt_remaining or 0), 2)
+
 # ========================
 # 🎯 دوال مساعدة للنظام
 # ========================
-# إضافة دالة لتهيئة النظام
+# إضافة دالة لتهيئة النظام (تُنفذ مرة واحدة عبر flask seed وليس عند كل بدء تشغيل)
 def initialize_system():
     """تهيئة النظام بالبيانات الأساسية"""
     try:
@@ -939,13 +968,33 @@ def initialize_system():
             settings = SystemSettings()
             db.session.add(settings)
             db.session.commit()
+        
+        # إنشاء المستخدم الافتراضي
+        create_default_admin()
             
         print("✅ تم تهيئة النظام بنجاح")
         return True
         
     except Exception as e:
+        db.session.rollback()
         print(f"❌ خطأ في تهيئة النظام: {e}")
         return False
+
+def create_default_admin():
+    """إنشاء المستخدم الافتراضي admin إذا لم يوجد"""
+    if User.query.filter_by(username="admin").first():
+        return False
+    default_user = User(
+        username="admin",
+        email="admin@localhost.com",
+        full_name="مدير النظام",
+        role="admin"
+    )
+    default_user.password = "admin123"
+    db.session.add(default_user)
+    db.session.commit()
+    print("✅ تم إنشاء المستخدم الافتراضي: admin / admin123")
+    return True
     
 def create_default_categories():
     """إنشاء التصنيفات الافتراضية"""
@@ -960,8 +1009,9 @@ def create_default_categories():
         ('إيجار', '#F97316', '🏢')
     ]
     
+    existing = {name for (name,) in db.session.query(ExpenseCategory.name)}
     for name, color, icon in default_categories:
-        if not ExpenseCategory.query.filter_by(name=name).first():
+        if name not in existing:
             category = ExpenseCategory(name=name, color=color, icon=icon)
             db.session.add(category)
     
@@ -1163,15 +1213,16 @@ def create_system_statuses():
         ('ملغاة', '#EF4444', True)
     ]
     
+    existing = {name for (name,) in db.session.query(Status.name)}
     for name, color, is_system in system_statuses:
-        if not Status.query.filter_by(name=name).first():
+        if name not in existing:
             status = Status(name=name, color=color, is_system=is_system)
             db.session.add(status)
     
     db.session.commit()
 
-def update_order_status(order_id, new_status_name, user_name):
-    """تحديث حالة الطلبية مع التسجيل في السجل"""
+def update_order_status(order_id, new_status_name, user_name, commit=True):
+    """تحديث حالة الطلبية مع التسجيل في السجل (commit=False ضمن عملية أكبر يثبتها المستدعي)"""
     status = Status.query.filter_by(name=new_status_name).first()
     if status:
         order = Order.query.get(order_id)
@@ -1187,7 +1238,8 @@ def update_order_status(order_id, new_status_name, user_name):
                 user=user_name
             )
             db.session.add(history)
-            db.session.commit()
+            if commit:
+                db.session.commit()
             return True
     return False
 
@@ -1217,7 +1269,7 @@ def assign_worker_to_order(order_id, worker_id, assignment_type, user_name, note
     # تحديث حالة الطلبية إذا كانت بدون تعيين
     order = Order.query.get(order_id)
     if order and (not order.status or order.status.name == 'في الانتظار'):
-        update_order_status(order_id, 'معينة للعامل', user_name)
+        update_order_status(order_id, 'معينة للعامل', user_name, commit=False)
     
     # تسجيل في السجل
     worker = Worker.query.get(worker_id)
@@ -1341,43 +1393,40 @@ def create_order_task_for_worker(order_id, worker_id, user_name):
 def create_tasks_for_existing_assignments(user_name="النظام"):
     """إنشاء مهام للطلبيات القديمة المعينة"""
     try:
-        tasks_created = 0
+        existing_keys = prefetch_open_task_keys(['order'])
         
-        # جلب جميع التعيينات النشطة التي ليس لها مهام مرتبطة
-        active_assignments = OrderAssignment.query.filter_by(is_active=True).all()
+        # جلب جميع التعيينات النشطة مع بيانات الطلبية والعامل في استعلام واحد
+        active_assignments = db.session.query(
+                OrderAssignment.worker_id, Worker.name,
+                Order.id, Order.name, Order.product, Order.wilaya, Order.total
+            )\
+            .join(Order, Order.id == OrderAssignment.order_id)\
+            .join(Worker, Worker.id == OrderAssignment.worker_id)\
+            .filter(OrderAssignment.is_active == True)\
+            .all()
         
-        for assignment in active_assignments:
-            # التحقق من عدم وجود مهمة نشطة مسبقاً
-            existing_task = Task.query.filter(
-                Task.worker_id == assignment.worker_id,
-                Task.related_entity_type == 'order',
-                Task.related_entity_id == assignment.order_id,
-                Task.status.in_(['pending', 'in_progress'])
-            ).first()
-            
-            if not existing_task:
-                order = assignment.order
-                worker = assignment.worker
-                
-                # إنشاء مهمة جديدة
-                task = Task(
-                    title=f"إنجاز طلبية - {order.name}",
-                    description=f"المنتج: {order.product}\nالعميل: {order.name}\nالولاية: {order.wilaya}\nالقيمة: {order.total} دج",
-                    priority='medium',
-                    status='pending',
-                    task_type='order_completion',
-                    assigned_to=worker.name,
-                    worker_id=worker.id,
-                    related_entity_type='order',
-                    related_entity_id=order.id,
-                    due_date=datetime.now(timezone.utc).date() + timedelta(days=7),
-                    created_by=user_name,
-                    task_scope='worker'
-                )
-                db.session.add(task)
-                tasks_created += 1
-                print(f"✅ تم إنشاء مهمة للطلبية القديمة #{order.id} للعامل {worker.name}")
+        new_tasks = []
+        for worker_id, worker_name, order_id, customer_name, product, wilaya, total in active_assignments:
+            key = ('order', order_id, worker_id)
+            if key in existing_keys:
+                continue
+            existing_keys.add(key)
+            new_tasks.append({
+                'title': f"إنجاز طلبية - {customer_name}",
+                'description': f"المنتج: {product}\nالعميل: {customer_name}\nالولاية: {wilaya}\nالقيمة: {total} دج",
+                'priority': 'medium',
+                'status': 'pending',
+                'task_type': 'order_completion',
+                'assigned_to': worker_name,
+                'worker_id': worker_id,
+                'related_entity_type': 'order',
+                'related_entity_id': order_id,
+                'due_date': datetime.now(timezone.utc).date() + timedelta(days=7),
+                'created_by': user_name,
+                'task_scope': 'worker'
+            })
         
+        tasks_created = bulk_insert_tasks(new_tasks)
         if tasks_created > 0:
             db.session.commit()
             print(f"🎉 تم إنشاء {tasks_created} مهمة للطلبيات القديمة")
@@ -1525,6 +1574,11 @@ def get_financial_overview(period='month'):
 # في قسم نظام المهام الذكي في models.py - تحديث نموذج Task
 class Task(db.Model):
     __tablename__ = 'task'
+    __table_args__ = (
+        db.Index('ix_task_status_priority_due', 'status', 'priority', 'due_date'),
+        db.Index('ix_task_related_entity', 'related_entity_type', 'related_entity_id'),
+        db.Index('ix_task_created_at_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
@@ -1612,6 +1666,27 @@ class Task(db.Model):
 # ========================
 # 🤖 دوال المهام الذكية
 # ========================
+OPEN_TASK_STATUSES = ('pending', 'in_progress')
+
+
+def prefetch_open_task_keys(entity_types=None, statuses=OPEN_TASK_STATUSES):
+    """مفاتيح المهام المفتوحة (related_entity_type, related_entity_id, worker_id) في استعلام واحد
+
+    تُستخدم دوال التوليد هذه المجموعة للتحقق من وجود مهمة بدل استعلام لكل كيان.
+    """
+    query = db.session.query(Task.related_entity_type, Task.related_entity_id, Task.worker_id)\
+        .filter(Task.status.in_(statuses), Task.related_entity_id.isnot(None))
+    if entity_types:
+        query = query.filter(Task.related_entity_type.in_(entity_types))
+    return {tuple(row) for row in query}
+
+
+def bulk_insert_tasks(rows):
+    """إدراج قائمة مهام (قواميس أعمدة) بعبارة INSERT واحدة، يعيد عددها"""
+    if rows:
+        db.session.execute(db.insert(Task), rows)
+    return len(rows)
+
 # 🆕 دوال نظام إدارة المهام بين الأدمن
 def create_admin_task(title, description, priority, assigned_admin, due_date, created_by, require_approval=True):
     """إنشاء مهمة بين الأدمن"""
@@ -1731,34 +1806,9 @@ class UserPermission(db.Model):
 
 # 🔥 دوال مساعدة للصلاحيات
 def check_permission(user_id, module, action):
-    """التحقق من صلاحية مستخدم"""
-    user = User.query.get(user_id)
-    if not user:
-        return False
-    
-    # المديرين لديهم جميع الصلاحيات
-    if user.role in ['admin', 'manager']:
-        return True
-    
-    # العمال - صلاحيات محدودة
-    permission = UserPermission.query.filter_by(
-        user_id=user_id, 
-        module=module
-    ).first()
-    
-    if not permission:
-        return False
-    
-    if action == 'view':
-        return permission.can_view
-    elif action == 'edit':
-        return permission.can_edit
-    elif action == 'delete':
-        return permission.can_delete
-    elif action == 'export':
-        return permission.can_export
-    
-    return False
+    """التحقق من صلاحية مستخدم (المستخدم وصلاحياته من ذاكرة identity)"""
+    from identity import get_identity_by_id, has_permission
+    return has_permission(get_identity_by_id(user_id), module, action)
 
 def set_default_permissions(user_id, role):
     """تعيين الصلاحيات الافتراضية حسب الدور"""
@@ -1809,105 +1859,123 @@ def get_user_accessible_tasks(user_id):
         (Task.visibility_scope.in_(['all', 'workers_only']))
     ).all()
 
-def generate_auto_tasks():
-    """توليد مهام تلقائية بناءً على بيانات النظام"""
-    tasks_created = 0
-    
+def generate_auto_tasks(since=None, raise_errors=False):
+    """توليد مهام تلقائية بناءً على بيانات النظام
+
+    إذا مُرر since يتم فحص الكيانات التي تغيرت أو تجاوزت حد التأخير بعده فقط.
+    raise_errors يسمح للمجدول بمعرفة الفشل حتى لا يحرك العلامة المائية.
+    """
     try:
-        # 1. فحص الديون المتأخرة
-        overdue_debts = Debt.query.filter(
-            Debt.status == 'unpaid',
-            Debt.start_date < (datetime.now(timezone.utc).date() - timedelta(days=30))
-        ).all()
-        
-        for debt in overdue_debts:
-            existing_task = Task.query.filter(
-                Task.related_entity_type == 'debt',
-                Task.related_entity_id == debt.id,
-                Task.status.in_(['pending', 'in_progress'])
-            ).first()
-            
-            if not existing_task:
-                task = Task(
-                    title=f"متابعة دين متأخر - {debt.name}",
-                    description=f"دين بقيمة {debt.debt_amount} دج متأخر منذ أكثر من 30 يوم. المتبقي: {debt.remaining_amount} دج",
-                    priority='high' if debt.remaining_amount > 10000 else 'medium',
-                    task_type='debt',
-                    related_entity_type='debt',
-                    related_entity_id=debt.id,
-                    due_date=datetime.now(timezone.utc).date() + timedelta(days=3),
-                    auto_generated=True,
-                    created_by='system'
-                )
-                db.session.add(task)
-                tasks_created += 1
-        
-        # 2. فحص الطلبيات المتوقفة
-        stalled_orders = Order.query.filter(
-            Order.status_id.isnot(None),
-            Order.actual_delivery_date.is_(None),
-            Order.created_at < (datetime.now(timezone.utc) - timedelta(days=14))
-        ).all()
-        
-        for order in stalled_orders:
-            existing_task = Task.query.filter(
-                Task.related_entity_type == 'order',
-                Task.related_entity_id == order.id,
-                Task.status.in_(['pending', 'in_progress'])
-            ).first()
-            
-            if not existing_task:
-                task = Task(
-                    title=f"متابعة طلبية متوقفة - {order.name}",
-                    description=f"الطلبية #{order.id} متوقفة منذ أكثر من أسبوعين. القيمة: {order.total} دج",
-                    priority='medium',
-                    task_type='order', 
-                    related_entity_type='order',
-                    related_entity_id=order.id,
-                    due_date=datetime.now(timezone.utc).date() + timedelta(days=7),
-                    auto_generated=True,
-                    created_by='system'
-                )
-                db.session.add(task)
-                tasks_created += 1
-        
-        # 3. فحص العمال بدون نشاط
-        inactive_workers = Worker.query.filter(
-            Worker.is_active == True,
-            ~Worker.worker_assignments.any(OrderAssignment.is_active == True)
-        ).all()
-        
-        for worker in inactive_workers:
-            existing_task = Task.query.filter(
-                Task.related_entity_type == 'worker',
-                Task.related_entity_id == worker.id,
-                Task.status.in_(['pending', 'in_progress'])
-            ).first()
-            
-            if not existing_task and worker.monthly_salary > 0:
-                task = Task(
-                    title=f"مراجعة عامل بدون مهام - {worker.name}",
-                    description=f"العامل {worker.name} بدون مهام نشطة مع راتب {worker.monthly_salary} دج",
-                    priority='low',
-                    task_type='worker',
-                    related_entity_type='worker', 
-                    related_entity_id=worker.id,
-                    due_date=datetime.now(timezone.utc).date() + timedelta(days=14),
-                    auto_generated=True,
-                    created_by='system'
-                )
-                db.session.add(task)
-                tasks_created += 1
-        
-        if tasks_created > 0:
-            db.session.commit()
-        
-        return tasks_created
-        
+        return _generate_auto_tasks(since)
     except Exception as e:
         db.session.rollback()
+        if raise_errors:
+            raise
         print(f"❌ خطأ في توليد المهام التلقائية: {e}")
         return 0
+
+
+def _generate_auto_tasks(since=None):
+    # المهام المفتوحة تُجلب مرة واحدة، والفحص يتم على مستوى الكيان بغض النظر عن العامل
+    open_entities = {
+        (entity_type, entity_id)
+        for entity_type, entity_id, _ in prefetch_open_task_keys(['debt', 'order', 'worker'])
+    }
+    new_tasks = []
+    today = datetime.now(timezone.utc).date()
+    
+    # 1. فحص الديون المتأخرة
+    overdue_debts = Debt.query.filter(
+        Debt.status == 'unpaid',
+        Debt.start_date < (datetime.now(timezone.utc).date() - timedelta(days=30))
+    )
+    if since is not None:
+        # ديون أُضيفت بعد آخر تشغيل، أو تجاوزت حد الثلاثين يوماً منذ ذلك الحين
+        overdue_debts = overdue_debts.filter(db.or_(
+            Debt.created_at >= since,
+            Debt.start_date >= since.date() - timedelta(days=30)
+        ))
+    overdue_debts = overdue_debts.all()
+    
+    for debt in overdue_debts:
+        if ('debt', debt.id) in open_entities:
+            continue
+        open_entities.add(('debt', debt.id))
+        new_tasks.append({
+            'title': f"متابعة دين متأخر - {debt.name}",
+            'description': f"دين بقيمة {debt.debt_amount} دج متأخر منذ أكثر من 30 يوم. المتبقي: {debt.remaining_amount} دج",
+            'priority': 'high' if debt.remaining_amount > 10000 else 'medium',
+            'task_type': 'debt',
+            'related_entity_type': 'debt',
+            'related_entity_id': debt.id,
+            'due_date': today + timedelta(days=3),
+            'auto_generated': True,
+            'created_by': 'system'
+        })
+    
+    # 2. فحص الطلبيات المتوقفة
+    stalled_orders = Order.query.filter(
+        Order.status_id.isnot(None),
+        Order.actual_delivery_date.is_(None),
+        Order.created_at < (datetime.now(timezone.utc) - timedelta(days=14))
+    )
+    if since is not None:
+        stalled_orders = stalled_orders.filter(Order.created_at >= since - timedelta(days=14))
+    stalled_orders = stalled_orders.all()
+    
+    for order in stalled_orders:
+        if ('order', order.id) in open_entities:
+            continue
+        open_entities.add(('order', order.id))
+        new_tasks.append({
+            'title': f"متابعة طلبية متوقفة - {order.name}",
+            'description': f"الطلبية #{order.id} متوقفة منذ أكثر من أسبوعين. القيمة: {order.total} دج",
+            'priority': 'medium',
+            'task_type': 'order',
+            'related_entity_type': 'order',
+            'related_entity_id': order.id,
+            'due_date': today + timedelta(days=7),
+            'auto_generated': True,
+            'created_by': 'system'
+        })
+    
+    # 3. فحص العمال بدون نشاط
+    inactive_workers = Worker.query.filter(
+        Worker.is_active == True,
+        ~Worker.worker_assignments.any(OrderAssignment.is_active == True)
+    )
+    if since is not None:
+        # عمال جدد أو تغيرت تعييناتهم منذ آخر تشغيل
+        inactive_workers = inactive_workers.filter(db.or_(
+            Worker.created_at >= since,
+            Worker.worker_assignments.any(db.or_(
+                OrderAssignment.assigned_date >= since,
+                OrderAssignment.completed_date >= since
+            ))
+        ))
+    inactive_workers = inactive_workers.all()
+    
+    for worker in inactive_workers:
+        if ('worker', worker.id) in open_entities or not worker.monthly_salary > 0:
+            continue
+        open_entities.add(('worker', worker.id))
+        new_tasks.append({
+            'title': f"مراجعة عامل بدون مهام - {worker.name}",
+            'description': f"العامل {worker.name} بدون مهام نشطة مع راتب {worker.monthly_salary} دج",
+            'priority': 'low',
+            'task_type': 'worker',
+            'related_entity_type': 'worker',
+            'related_entity_id': worker.id,
+            'due_date': today + timedelta(days=14),
+            'auto_generated': True,
+            'created_by': 'system'
+        })
+    
+    tasks_created = bulk_insert_tasks(new_tasks)
+    if tasks_created > 0:
+        db.session.commit()
+    
+    return tasks_created
     
 
 # 🆕 تحديث دالة توليد المهام الذكية
@@ -1974,35 +2042,41 @@ def generate_accountability_tasks():
 
 def generate_worker_tasks():
     """إنشاء مهام مخصصة للعمال"""
-    tasks_created = 0
-    active_workers = Worker.query.filter_by(is_active=True).all()
-    
-    for worker in active_workers:
-        # مهام المتابعة الأسبوعية
-        existing_task = Task.query.filter(
-            Task.worker_id == worker.id,
+    week_ago = datetime.now(timezone.utc) - timedelta(days=7)
+    # العمال الذين لديهم مهمة متابعة حديثة، والعمال الذين لديهم تعيينات نشطة - استعلامان فقط
+    recently_followed = {
+        worker_id for (worker_id,) in db.session.query(Task.worker_id).filter(
+            Task.worker_id.isnot(None),
             Task.task_scope == 'worker',
-            Task.created_at >= (datetime.now(timezone.utc) - timedelta(days=7))
-        ).first()
-        
-        if not existing_task and worker.assigned_orders:
-            task = Task(
-                title=f"متابعة أعمال العامل {worker.name}",
-                description=f"متابعة تقدم العامل في الطلبيات الموكلة له والتحقق من الجودة",
-                task_scope="worker",
-                priority="medium",
-                task_type="worker",
-                worker_id=worker.id,
-                assigned_to=worker.name,
-                due_date=datetime.now(timezone.utc).date() + timedelta(days=2),
-                auto_generated=True,
-                created_by="system",
-                visibility_scope="managers_only"
-            )
-            db.session.add(task)
-            tasks_created += 1
+            Task.created_at >= week_ago
+        ).distinct()
+    }
+    assigned_workers = {
+        worker_id for (worker_id,) in db.session.query(OrderAssignment.worker_id)
+            .filter(OrderAssignment.is_active == True).distinct()
+    }
+    active_workers = db.session.query(Worker.id, Worker.name).filter(Worker.is_active == True).all()
     
-    return tasks_created
+    new_tasks = []
+    for worker_id, worker_name in active_workers:
+        # مهام المتابعة الأسبوعية
+        if worker_id in recently_followed or worker_id not in assigned_workers:
+            continue
+        new_tasks.append({
+            'title': f"متابعة أعمال العامل {worker_name}",
+            'description': "متابعة تقدم العامل في الطلبيات الموكلة له والتحقق من الجودة",
+            'task_scope': "worker",
+            'priority': "medium",
+            'task_type': "worker",
+            'worker_id': worker_id,
+            'assigned_to': worker_name,
+            'due_date': datetime.now(timezone.utc).date() + timedelta(days=2),
+            'auto_generated': True,
+            'created_by': "system",
+            'visibility_scope': "managers_only"
+        })
+    
+    return bulk_insert_tasks(new_tasks)
 
 def get_urgent_tasks(limit=10):
     """جلب المهام العاجلة"""
@@ -2045,16 +2119,9 @@ def create_manual_task(title, description, priority, task_type, assigned_to, due
 
 # 🔧 دوال مساعدة للنظام
 def is_admin_user(username=None):
-    """التحقق إذا كان المستخدم مسؤول"""
-    if username is None:
-        # إذا لم يتم تمرير اسم مستخدم، نحاول الحصول عليه من الجلسة
-        from flask import session
-        if 'user' not in session:
-            return False
-        username = session['user']
-    
-    user = User.query.filter_by(username=username).first()
-    return user and user.role in ['admin', 'manager']
+    """التحقق إذا كان المستخدم مسؤول (المستخدم الحالي من الجلسة إن لم يُمرر اسم)"""
+    from identity import is_admin
+    return is_admin(username)
 
 def total_debts():
     """حساب إجمالي الديون"""
@@ -2063,14 +2130,3 @@ def total_debts():
 def get_admin_users_list():
     """جلب قائمة الأدمن"""
     return User.query.filter(User.role.in_(['admin', 'manager'])).all()
-
-def get_orders_health_stats():
-    """جلب إحصائيات صحة الطلبيات"""
-    total_orders = Order.query.count()
-    orders_with_debts = 0  # يمكنك تحسين هذا المنطق
-    
-    return {
-        'total_orders': total_orders,
-        'orders_with_debts': orders_with_debts,
-        'healthy_orders': total_orders - orders_with_debts
-    }
\ No newline at end of file
@@ -0,0 +1,153 @@
+# ====== pagination.py ======
+# ترقيم صفحات القوائم بطريقة keyset (البحث بالمؤشر) على (created_at, id)
+# الصفحة التالية تبدأ بعد آخر صف معروض بشرط WHERE على الفهرس بدل OFFSET،
+# فزمن عرض أي صفحة لا يتعلق بحجم الجدول ولا بعمق الصفحة
+import base64
+import json
+from datetime import datetime
+from flask import request, url_for, jsonify
+from sqlalchemy import tuple_
+from models import SystemSettings
+
+DEFAULT_PER_PAGE = 25
+MAX_PER_PAGE = 200
+
+
+class Page:
+    """صفحة واحدة من نتائج keyset"""
+
+    def __init__(self, items, per_page, cursor=None, next_cursor=None, descending=True):
+        self.items = items
+        self.per_page = per_page
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+        self.descending = descending
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def is_first(self):
+        return not self.cursor
+
+    def _url(self, **changes):
+        args = request.args.to_dict()
+        args.pop('format', None)
+        args.update(changes)
+        args = {key: value for key, value in args.items() if value not in (None, '')}
+        return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+    def next_url(self):
+        return self._url(cursor=self.next_cursor) if self.has_next else None
+
+    def first_url(self):
+        return self._url(cursor=None)
+
+    def json_url(self):
+        """رابط الصفحة التالية بصيغة JSON (للتمرير اللانهائي)"""
+        return self._url(cursor=self.next_cursor, format='json') if self.has_next else None
+
+
+# ========================
+# المؤشر
+# ========================
+def encode_cursor(created_at, row_id):
+    """مؤشر نصي آمن للروابط يحمل (created_at, id) لآخر صف في الصفحة"""
+    raw = json.dumps([created_at.isoformat() if created_at else None, row_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """(created_at, id) من المؤشر، أو None لمؤشر فارغ أو تالف (يعني الصفحة الأولى)"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        return (datetime.fromisoformat(created_at) if created_at else None), int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+# ========================
+# المعاملات والاستعلام
+# ========================
+def get_per_page(default=None):
+    """عدد الصفوف: ?per_page ثم إعداد rows_per_page في system_settings"""
+    per_page = request.args.get('per_page', type=int)
+    if not per_page:
+        per_page = default
+    if not per_page:
+        try:
+            per_page = SystemSettings.query.with_entities(SystemSettings.rows_per_page).scalar()
+        except Exception as e:
+            print(f"❌ خطأ في قراءة عدد الصفوف في الصفحة: {e}")
+    return max(1, min(per_page or DEFAULT_PER_PAGE, MAX_PER_PAGE))
+
+
+def wants_json():
+    return request.args.get('format') == 'json'
+
+
+def keyset_paginate(query, model, cursor=None, per_page=None, descending=None, order_column=None):
+    """تطبيق الترتيب وشرط المؤشر و LIMIT على استعلام مفلتر
+
+    الترتيب (created_at, id) مع وضع الصفوف القديمة بدون created_at في النهاية،
+    أو (order_column, id) لجداول عمود وقتها باسم آخر (مثل activity_event.timestamp).
+    شرط المؤشر مقارنة صفوف (created_at, id) < (x, y) فيبدأ المسح من موضع المؤشر في الفهرس
+    (SEARCH) بدل المرور على كل ما قبله؛ والصفحة التي تنتهي عندها الصفوف المؤرخة تُكمل
+    من ذيل created_at IS NULL باستعلام ثانٍ. يُجلب صف إضافي لمعرفة وجود صفحة تالية دون COUNT.
+    """
+    if cursor is None:
+        cursor = request.args.get('cursor')
+    if per_page is None:
+        per_page = get_per_page()
+    if descending is None:
+        descending = request.args.get('sort', 'newest') != 'oldest'
+
+    created_at = order_column if order_column is not None else model.created_at
+    row_id = model.id
+    if descending:
+        ordering = (created_at.desc().nulls_last(), row_id.desc())
+        null_ordering = row_id.desc()
+    else:
+        ordering = (created_at.asc().nulls_last(), row_id.asc())
+        null_ordering = row_id.asc()
+    query = query.order_by(None)
+
+    position = decode_cursor(cursor)
+    if position is None:
+        rows = query.order_by(*ordering).limit(per_page + 1).all()
+    else:
+        last_created, last_id = position
+        after_id = row_id < last_id if descending else row_id > last_id
+        if last_created is None:
+            rows = query.filter(created_at.is_(None), after_id)\
+                .order_by(null_ordering).limit(per_page + 1).all()
+        else:
+            key, last_key = tuple_(created_at, row_id), tuple_(last_created, last_id)
+            after = key < last_key if descending else key > last_key
+            rows = query.filter(after).order_by(*ordering).limit(per_page + 1).all()
+            if len(rows) <= per_page:
+                # انتهت الصفوف المؤرخة (المقارنة مع NULL لا تطابق): الباقي من ذيل الصفوف بدون تاريخ
+                rows += query.filter(created_at.is_(None))\
+                    .order_by(null_ordering).limit(per_page + 1 - len(rows)).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(getattr(rows[-1], created_at.key), rows[-1].id)
+    return Page(rows, per_page, cursor=position and cursor, next_cursor=next_cursor, descending=descending)
+
+
+def page_json(page, serialize, **extra):
+    """استجابة JSON للتمرير اللانهائي: العناصر ومؤشر الصفحة التالية"""
+    return jsonify({
+        "success": True,
+        "items": [serialize(item) for item in page.items],
+        "next_cursor": page.next_cursor,
+        "next_url": page.json_url(),
+        "has_next": page.has_next,
+        **extra
+    })
@@ -0,0 +1,128 @@
+# ====== payroll.py ======
+# محرك الرواتب: الراتب المستحق والخصومات والصافي لكل العمال في استعلام واحد
+# نفس المعادلة مكتوبة مرتين - في بايثون لعامل محمّل (Worker.total_salary) وكتعبير SQL
+# للقوائم والتقارير - فالمجاميع تُحسب في قاعدة البيانات دون تحميل كل العمال
+from datetime import datetime
+from sqlalchemy import select, func, case, cast, literal, Date, Float, Integer, Numeric
+from models import db, Worker, now_utc
+
+DAYS_PER_MONTH = 30.0
+LATE_HOUR_PENALTY = 500  # خصم كل ساعة تأخر بالدينار
+
+# أعمدة التفصيل بالترتيب المعروض في التقارير
+BREAKDOWN_FIELDS = (
+    'days_worked', 'daily_rate', 'base_salary', 'bonuses', 'gross_salary',
+    'advances', 'absence_deduction', 'late_deduction', 'total_deductions', 'total_salary',
+)
+
+
+def _as_of(as_of):
+    if as_of is None:
+        return now_utc().date()
+    if isinstance(as_of, datetime):
+        return as_of.date()
+    return as_of
+
+
+# ========================
+# الحساب في بايثون (عامل واحد محمّل)
+# ========================
+def salary_breakdown(worker, as_of=None):
+    """تفصيل راتب عامل محمّل حتى تاريخ as_of (اليوم افتراضياً) دون أي استعلام"""
+    as_of = _as_of(as_of)
+    days_worked = max(0, (as_of - worker.start_date).days) if worker.start_date else 0
+    daily_rate = (worker.monthly_salary or 0) / DAYS_PER_MONTH
+    base_salary = days_worked * daily_rate
+    bonuses = (worker.outside_work_bonus or 0) + (worker.incentives or 0)
+    advances = worker.advances or 0
+    absence_deduction = (worker.absences or 0) * daily_rate
+    late_deduction = (worker.late_hours or 0) * LATE_HOUR_PENALTY
+    total_deductions = advances + absence_deduction + late_deduction
+    return {
+        'days_worked': days_worked,
+        'daily_rate': round(daily_rate, 2),
+        'base_salary': round(base_salary, 2),
+        'bonuses': round(bonuses, 2),
+        'gross_salary': round(base_salary + bonuses, 2),
+        'advances': round(advances, 2),
+        'absence_deduction': round(absence_deduction, 2),
+        'late_deduction': round(late_deduction, 2),
+        'total_deductions': round(total_deductions, 2),
+        'total_salary': max(0, round(base_salary + bonuses - total_deductions, 2)),
+    }
+
+
+# ========================
+# التعابير في SQL
+# ========================
+def _days_since_start(as_of):
+    """عدد الأيام من start_date حتى as_of حسب نوع قاعدة البيانات"""
+    as_of = literal(as_of, Date)
+    if db.engine.dialect.name == 'postgresql':
+        days = as_of - Worker.start_date
+    else:
+        days = cast(func.julianday(as_of) - func.julianday(Worker.start_date), Integer)
+    return case((days > 0, days), else_=0)
+
+
+def _round(expression):
+    # round(double precision, int) غير موجودة في PostgreSQL
+    if db.engine.dialect.name == 'postgresql':
+        expression = cast(expression, Numeric)
+    return func.round(expression, 2, type_=Float)
+
+
+def payroll_columns(as_of=None):
+    """أعمدة التفصيل كتعابير SQL على جدول worker: اسم الحقل -> تعبير (نفس معادلة salary_breakdown)"""
+    as_of = _as_of(as_of)
+    days_worked = _days_since_start(as_of)
+    daily_rate = func.coalesce(Worker.monthly_salary, 0) / DAYS_PER_MONTH
+    base_salary = days_worked * daily_rate
+    bonuses = func.coalesce(Worker.outside_work_bonus, 0) + func.coalesce(Worker.incentives, 0)
+    advances = func.coalesce(Worker.advances, 0)
+    absence_deduction = func.coalesce(Worker.absences, 0) * daily_rate
+    late_deduction = func.coalesce(Worker.late_hours, 0) * LATE_HOUR_PENALTY
+    total_deductions = advances + absence_deduction + late_deduction
+    net = base_salary + bonuses - total_deductions
+    return {
+        'days_worked': days_worked,
+        'daily_rate': _round(daily_rate),
+        'base_salary': _round(base_salary),
+        'bonuses': _round(bonuses),
+        'gross_salary': _round(base_salary + bonuses),
+        'advances': _round(advances),
+        'absence_deduction': _round(absence_deduction),
+        'late_deduction': _round(late_deduction),
+        'total_deductions': _round(total_deductions),
+        'total_salary': case((net > 0, _round(net)), else_=0.0),
+    }
+
+
+def total_salary_expression(as_of=None):
+    """الراتب المستحق كتعبير SQL (Worker.total_salary في الاستعلامات)"""
+    return payroll_columns(as_of)['total_salary']
+
+
+# ========================
+# كشوف الرواتب
+# ========================
+def payroll(as_of=None, filters=(), extra_columns=()):
+    """كشف الرواتب لكل العمال المطابقين لـ filters في استعلام واحد: قائمة قواميس مرتبة بالاسم"""
+    columns = payroll_columns(as_of)
+    statement = select(
+        Worker.id, Worker.name, Worker.is_active, Worker.start_date, *extra_columns,
+        *(expression.label(name) for name, expression in columns.items())
+    ).where(*filters).order_by(Worker.name, Worker.id)
+    return [dict(row._mapping) for row in db.session.execute(statement)]
+
+
+def payroll_totals(as_of=None, filters=()):
+    """مجاميع كشف الرواتب (تجميع واحد في SQL بدون تحميل العمال)"""
+    columns = payroll_columns(as_of)
+    sums = [
+        func.coalesce(func.sum(columns[name]), 0).label(name)
+        for name in BREAKDOWN_FIELDS if name not in ('days_worked', 'daily_rate')
+    ]
+    row = db.session.execute(select(func.count(Worker.id).label('workers_count'), *sums).where(*filters)).one()
+    return {name: round(float(value), 2) if name != 'workers_count' else value
+            for name, value in row._mapping.items()}
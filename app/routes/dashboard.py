@@ -1,7 +1,6 @@
 from flask import Blueprint, render_template, session, redirect, url_for, jsonify
-from models import Order, Worker, Debt, Expense, Purchase, OrderHistory, WorkerHistory, Transport
-from datetime import datetime, timezone, timedelta
-from sqlalchemy.orm import joinedload
+from datetime import datetime, timezone
+from dashboard_snapshot import get_snapshot, as_utc
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
@@ -25,99 +24,12 @@ def dashboard():
                          now=datetime.now(timezone.utc))
 
 def get_dashboard_data():
-    """جلب بيانات لوحة التحكم مع الأحداث الحديثة"""
+    """بيانات لوحة التحكم من اللقطة المحفوظة (العدادات وآخر الأحداث مرتبة بوقتها)"""
     try:
-        today = datetime.now(timezone.utc).date()
-        
-        # البيانات الأساسية
-        total_orders = Order.query.count()
-        total_workers = Worker.query.filter_by(is_active=True).count()
-        total_debts = Debt.query.filter_by(status="unpaid").count()
-        total_expenses = Expense.query.count()
-        total_purchases = Purchase.query.count()
-        
-        # جمع الأحداث الحديثة من جميع المصادر
-        recent_activities = []
-        
-        # 1. أحداث الطلبيات (آخر 10 أحداث)
-        order_histories = OrderHistory.query.order_by(OrderHistory.timestamp.desc()).limit(10).all()
-        for history in order_histories:
-            activity_type = 'order'
-            if 'دفعة' in history.change_type or 'دفع' in history.change_type:
-                activity_type = 'payment'
-            elif 'نقل' in history.change_type:
-                activity_type = 'transport'
-            elif 'مصروف' in history.change_type:
-                activity_type = 'expense'
-            elif 'عامل' in history.change_type or 'تعيين' in history.change_type:
-                activity_type = 'worker'
-                
-            recent_activities.append({
-                'type': activity_type,
-                'icon': get_activity_icon(activity_type),
-                'title': history.change_type,
-                'description': history.details,
-                'category': get_activity_category(activity_type),
-                'time': format_time_ago(history.timestamp),
-                'user': history.user or 'النظام',
-                'classes': get_activity_classes(activity_type)
-            })
-        
-        # 2. أحداث العمال (آخر 5 أحداث)
-        worker_histories = WorkerHistory.query.order_by(WorkerHistory.timestamp.desc()).limit(5).all()
-        for history in worker_histories:
-            recent_activities.append({
-                'type': 'worker',
-                'icon': get_activity_icon('worker'),
-                'title': history.change_type,
-                'description': history.details,
-                'category': get_activity_category('worker'),
-                'time': format_time_ago(history.timestamp),
-                'user': history.user or 'النظام',
-                'classes': get_activity_classes('worker')
-            })
-        
-        # 3. أحداث المصاريف الجديدة (آخر 5 أحداث)
-        recent_expenses = Expense.query.order_by(Expense.created_at.desc()).limit(5).all()
-        for expense in recent_expenses:
-            recent_activities.append({
-                'type': 'expense',
-                'icon': get_activity_icon('expense'),
-                'title': 'مصروف جديد',
-                'description': f"{expense.description} - {expense.total_amount} دج",
-                'category': get_activity_category('expense'),
-                'time': format_time_ago(expense.created_at),
-                'user': expense.recorded_by,
-                'classes': get_activity_classes('expense')
-            })
-        
-        # 4. أحداث النقل الجديدة (آخر 5 أحداث)
-        recent_transports = Transport.query.order_by(Transport.created_at.desc()).limit(5).all()
-        for transport in recent_transports:
-            recent_activities.append({
-                'type': 'transport',
-                'icon': get_activity_icon('transport'),
-                'title': 'نقل جديد',
-                'description': f"{transport.purpose} - {transport.transport_amount} دج",
-                'category': get_activity_category('transport'),
-                'time': format_time_ago(transport.created_at),
-                'user': transport.recorded_by,
-                'classes': get_activity_classes('transport')
-            })
-        
-        # ترتيب جميع الأحداث حسب الوقت (الأحدث أولاً) وأخذ آخر 15 حدث
-        recent_activities.sort(key=lambda x: x.get('timestamp', datetime.now(timezone.utc)), reverse=True)
-        recent_activities = recent_activities[:15]
-        
-        return {
-            'total_orders': total_orders,
-            'total_workers': total_workers,
-            'total_debts': total_debts,
-            'total_expenses': total_expenses,
-            'total_purchases': total_purchases,
-            'recent_activities': recent_activities
-        }
-        
+        snapshot = get_snapshot()
+        recent_activities = [present_activity(activity) for activity in snapshot['activities']]
+        return {**snapshot['counts'], 'recent_activities': recent_activities}
+
     except Exception as e:
         print(f"❌ خطأ في جلب بيانات لوحة التحكم: {e}")
         return {
@@ -129,6 +41,17 @@ def get_dashboard_data():
             'recent_activities': []
         }
 
+def present_activity(activity):
+    """إضافة الأيقونة والتصنيف والألوان والوقت المنقضي (يُحسب عند العرض وليس عند التخزين)"""
+    activity_type = activity['type']
+    return {
+        **activity,
+        'icon': get_activity_icon(activity_type),
+        'category': get_activity_category(activity_type),
+        'time': format_time_ago(activity['timestamp']),
+        'classes': get_activity_classes(activity_type)
+    }
+
 def get_activity_icon(activity_type):
     """الحصول على أيقونة النشاط"""
     icons = {
@@ -216,8 +139,10 @@ def get_activity_classes(activity_type):
 
 def format_time_ago(timestamp):
     """تنسيق الوقت المنقضي"""
+    if timestamp is None:
+        return ""
     now = datetime.now(timezone.utc)
-    diff = now - timestamp
+    diff = now - as_utc(timestamp)
     
     if diff.days > 0:
         return f"قبل {diff.days} يوم"
@@ -1,9 +1,47 @@
 from flask import Blueprint, render_template, request, session, redirect, url_for, jsonify
 from models import Debt, db
+from sqlalchemy import func, or_
+from pagination import keyset_paginate, wants_json, page_json
+from routes.helpers import is_admin_user, total_debts
 from datetime import datetime, timezone
 
 debts_bp = Blueprint('debts', __name__)
 
+# فلتر المبلغ: (أدنى، أعلى) شاملين، None بلا حد
+AMOUNT_RANGES = {
+    'small': (None, 999.99),
+    'medium': (1000, 5000),
+    'large': (5000.01, None),
+}
+
+def get_debt_stats():
+    """عدد الديون حسب الحالة وحسب المصدر في استعلام واحد"""
+    stats = {'total': 0, 'by_status': {}, 'by_source': {}}
+    rows = db.session.query(Debt.status, Debt.source_type, func.count(Debt.id))\
+        .group_by(Debt.status, Debt.source_type).all()
+    for status, source_type, count in rows:
+        source_type = source_type or 'manual'
+        stats['total'] += count
+        stats['by_status'][status] = stats['by_status'].get(status, 0) + count
+        stats['by_source'][source_type] = stats['by_source'].get(source_type, 0) + count
+    return stats
+
+def _debt_row(debt):
+    """صف دين لاستجابة JSON (التمرير اللانهائي)"""
+    return {
+        "id": debt.id,
+        "name": debt.name,
+        "phone": debt.phone,
+        "source_type": debt.source_type or 'manual',
+        "source_info": debt.source_info,
+        "debt_amount": debt.debt_amount,
+        "paid_amount": debt.paid_amount,
+        "remaining_amount": debt.remaining_amount,
+        "status": debt.status,
+        "start_date": debt.start_date.strftime('%Y-%m-%d') if debt.start_date else None,
+        "created_at": debt.created_at.isoformat() if debt.created_at else None
+    }
+
 @debts_bp.route("/debts")
 def debts():
     """صفحة إدارة الديون"""
@@ -11,22 +49,61 @@ def debts():
         return redirect(url_for("auth.login"))
     
     status_filter = request.args.get('status', 'all')
+    source_filter = request.args.get('source', 'all')
+    amount_filter = request.args.get('amount', 'all')
+    search = request.args.get('q', '').strip()
+    
+    # أعداد البطاقات والتبويبات ومبالغ الملخص: استعلام تجميع واحد على كل الديون
+    stats = get_debt_stats()
+    
+    query = Debt.query
+    if status_filter in ('paid', 'unpaid'):
+        query = query.filter(Debt.status == status_filter)
+    if source_filter == 'manual':
+        query = query.filter(or_(Debt.source_type.is_(None), Debt.source_type == 'manual'))
+    elif source_filter != 'all':
+        query = query.filter(Debt.source_type == source_filter)
+    if amount_filter in AMOUNT_RANGES:
+        low, high = AMOUNT_RANGES[amount_filter]
+        if low is not None:
+            query = query.filter(Debt.debt_amount >= low)
+        if high is not None:
+            query = query.filter(Debt.debt_amount <= high)
+    if search:
+        pattern = f"%{search}%"
+        query = query.filter(or_(Debt.name.ilike(pattern), Debt.phone.ilike(pattern),
+                                 Debt.address.ilike(pattern), Debt.description.ilike(pattern)))
     
-    if status_filter == 'paid':
-        debts_list = Debt.query.filter_by(status="paid").order_by(Debt.created_at.desc()).all()
-    elif status_filter == 'unpaid':
-        debts_list = Debt.query.filter_by(status="unpaid").order_by(Debt.created_at.desc()).all()
-    else:
-        debts_list = Debt.query.order_by(Debt.created_at.desc()).all()
+    total_count, total_all_debts, total_paid = query.with_entities(
+        func.count(Debt.id),
+        func.coalesce(func.sum(Debt.debt_amount), 0),
+        func.coalesce(func.sum(Debt.paid_amount), 0)
+    ).one()
     
-    total_debt = sum(debt.remaining_amount for debt in debts_list if debt.status == 'unpaid')
-    total_paid = sum(debt.paid_amount for debt in debts_list)
+    page = keyset_paginate(query, Debt)
+    if wants_json():
+        return page_json(page, _debt_row, total_count=total_count)
     
     return render_template("debts.html", 
-                         debts=debts_list,
+                         debts=page.items,
+                         page=page,
+                         total_count=total_count,
                          status_filter=status_filter,
-                         total_debt=total_debt,
-                         total_paid=total_paid)
+                         debt_status=status_filter,
+                         source_type=source_filter,
+                         amount_filter=amount_filter,
+                         sort=request.args.get('sort', 'newest'),
+                         search_query=search,
+                         stats=stats,
+                         manual_debts_count=stats['by_source'].get('manual', 0),
+                         expense_debts_count=stats['by_source'].get('expense', 0),
+                         purchase_debts_count=stats['by_source'].get('purchase', 0),
+                         transport_debts_count=stats['by_source'].get('transport', 0),
+                         total_all_debts=total_all_debts,
+                         total_paid=total_paid,
+                         total_debts=round(total_all_debts - total_paid, 2),
+                         total_debt=round(total_all_debts - total_paid, 2),
+                         now=datetime.now(timezone.utc))
 
 @debts_bp.route("/debts/add", methods=["POST"])
 def add_debt():
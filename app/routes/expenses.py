@@ -1,14 +1,80 @@
 from flask import Blueprint, render_template, request, session, redirect, url_for, jsonify, flash
 from models import Expense, ExpenseCategory, Supplier, Order, ProductPriceHistory, Debt, ExpenseReceipt, db
-from sqlalchemy.orm import joinedload
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload, selectinload, undefer
+from pagination import keyset_paginate, wants_json, page_json
+from summaries import expense_summary
+from lookups import get_lookup
+from blob_store import store_upload
+from delivery import send_content
+from derivatives import enqueue_derivatives, send_thumbnail
+from compression import compress_upload
+from audit import log_activity
 from datetime import datetime, timezone
 import base64
-from io import BytesIO
-from PIL import Image
 import os
 
 expenses_bp = Blueprint('expenses', __name__)
 
+def expense_filters(args):
+    """شروط فلتر صفحة المصاريف - مشتركة بين جلب الصفوف والملخص"""
+    expense_type = args.get('type', 'all')
+    category_id = args.get('category', '')
+    date_from = args.get('date_from', '')
+    date_to = args.get('date_to', '')
+    payment = args.get('payment', 'all')
+    product = args.get('product', '').strip()
+    supplier_id = args.get('supplier', '')
+    search = args.get('q', '').strip()
+    
+    filters = []
+    if expense_type in ('paid', 'unpaid'):
+        filters.append(Expense.payment_status == expense_type)
+    elif expense_type in ('owner', 'partner', 'worker'):
+        filters.append(Expense.purchased_by == expense_type)
+    
+    if payment in ('paid', 'unpaid', 'partial'):
+        filters.append(Expense.payment_status == payment)
+    
+    if category_id and category_id != 'all':
+        filters.append(Expense.category_id == int(category_id))
+    
+    if supplier_id and supplier_id != 'all':
+        filters.append(Expense.supplier_id == int(supplier_id))
+    
+    if product and product != 'all':
+        filters.append(Expense.description.ilike(f"%{product}%"))
+    
+    if search:
+        pattern = f"%{search}%"
+        filters.append(or_(Expense.description.ilike(pattern), Expense.notes.ilike(pattern)))
+    
+    if date_from:
+        filters.append(Expense.purchase_date >= datetime.strptime(date_from, "%Y-%m-%d").date())
+    if date_to:
+        filters.append(Expense.purchase_date <= datetime.strptime(date_to, "%Y-%m-%d").date())
+    return filters
+
+def _expense_row(expense):
+    """صف مصروف لاستجابة JSON (التمرير اللانهائي)"""
+    return {
+        "id": expense.id,
+        "description": expense.description,
+        "category": expense.category.name if expense.category else None,
+        "supplier": expense.supplier.name if expense.supplier else None,
+        "order_id": expense.order_id,
+        "quantity": expense.quantity,
+        "unit_price": expense.unit_price,
+        "total_amount": expense.total_amount,
+        "paid_amount": expense.paid_amount,
+        "remaining_amount": expense.remaining_amount,
+        "purchased_by": expense.purchased_by,
+        "payment_status": expense.payment_status,
+        "purchase_date": expense.purchase_date.strftime('%Y-%m-%d') if expense.purchase_date else None,
+        "created_at": expense.created_at.isoformat() if expense.created_at else None,
+        "receipts_count": len(expense.receipts)
+    }
+
 @expenses_bp.route("/expenses")
 def expenses():
     """صفحة إدارة المصاريف والمشتريات"""
@@ -20,49 +86,61 @@ def expenses():
     date_from = request.args.get('date_from', '')
     date_to = request.args.get('date_to', '')
     
-    query = Expense.query
-    
-    if expense_type == 'paid':
-        query = query.filter(Expense.payment_status == 'paid')
-    elif expense_type == 'unpaid':
-        query = query.filter(Expense.payment_status == 'unpaid')
-    elif expense_type == 'owner':
-        query = query.filter(Expense.purchased_by == 'owner')
-    elif expense_type == 'partner':
-        query = query.filter(Expense.purchased_by == 'partner')
-    elif expense_type == 'worker':
-        query = query.filter(Expense.purchased_by == 'worker')
+    filters = expense_filters(request.args)
+    query = Expense.query.filter(*filters)
     
-    if category_id and category_id != 'all':
-        query = query.filter(Expense.category_id == int(category_id))
-    
-    if date_from:
-        query = query.filter(Expense.purchase_date >= datetime.strptime(date_from, "%Y-%m-%d"))
-    if date_to:
-        query = query.filter(Expense.purchase_date <= datetime.strptime(date_to, "%Y-%m-%d"))
+    # بطاقات الملخص من استعلام تجميع واحد بنفس الفلتر، منفصل عن جلب صفوف الصفحة
+    summary = expense_summary(filters)
+    total_count = summary['count']
     
-    expenses_list = query.order_by(Expense.created_at.desc()).all()
-    categories = ExpenseCategory.query.all()
-    suppliers = Supplier.query.all()
+    page = keyset_paginate(query.options(
+        joinedload(Expense.category),
+        joinedload(Expense.supplier),
+        selectinload(Expense.receipts)
+    ), Expense)
+    if wants_json():
+        return page_json(page, _expense_row, total_count=total_count)
     
-    orders = Order.query.options(joinedload(Order.phones)).order_by(Order.created_at.desc()).all()
-
-    total_amount = sum(expense.total_amount for expense in expenses_list)
-    paid_amount = sum(expense.total_amount for expense in expenses_list if expense.payment_status == 'paid')
-    unpaid_amount = sum(expense.total_amount for expense in expenses_list if expense.payment_status == 'unpaid')
+    # القوائم المنسدلة من الذاكرة المشتركة، ومنتقي الطلبية يبحث عبر /api/lookup/orders
+    categories = get_lookup('expense_categories')
+    suppliers = get_lookup('suppliers')
+    recent_orders = get_lookup('recent_orders')
     
     return render_template("expenses.html", 
-                         expenses=expenses_list,
+                         expenses=page.items,
+                         page=page,
+                         total_count=total_count,
                          categories=categories,
                          suppliers=suppliers,
-                         orders=orders,
+                         recent_orders=recent_orders,
                          expense_type=expense_type,
                          category_id=category_id,
                          date_from=date_from,
                          date_to=date_to,
-                         total_amount=total_amount,
-                         paid_amount=paid_amount,
-                         unpaid_amount=unpaid_amount)
+                         payment_filter=request.args.get('payment', 'all'),
+                         product_filter=request.args.get('product', 'all'),
+                         supplier_filter=request.args.get('supplier', 'all'),
+                         search_query=request.args.get('q', ''),
+                         summary=summary,
+                         total_amount=summary['total_amount'],
+                         paid_amount=summary['paid_amount'],
+                         unpaid_amount=summary['unpaid_amount'])
+
+@expenses_bp.route("/api/expenses/summary")
+def api_expenses_summary():
+    """ملخص المصاريف بنفس فلاتر الصفحة مع التوزيع حسب الفئة والشهر"""
+    if "user" not in session:
+        return jsonify({"success": False, "error": "غير مصرح"})
+    
+    try:
+        summary = expense_summary(expense_filters(request.args))
+        names = {category.id: category.name for category in get_lookup('expense_categories')}
+        for bucket in summary['by_category']:
+            bucket['category'] = names.get(bucket['category_id'], 'عام')
+        return jsonify({"success": True, "summary": summary})
+    except Exception as e:
+        print(f"❌ خطأ في ملخص المصاريف: {e}")
+        return jsonify({"success": False, "error": str(e)})
 
 @expenses_bp.route("/expenses/add", methods=["POST"])
 def add_expense():
@@ -120,6 +198,9 @@ def add_expense():
         
         print(f"✅ تم إنشاء المصروف #{expense.id} مرتبط بالطلبية #{order_id}")
         
+        # سجل الطلبية المرتبطة - يُثبّت مع نفس الـ commit
+        log_activity(session["user"], expense, "إضافة مصروف", expense.description, total_amount)
+        
         # حفظ في سجل الأسعار إذا طلب المستخدم ذلك
         if request.form.get("save_to_price_history") == "yes":
             price_history = ProductPriceHistory(
@@ -159,7 +240,8 @@ def add_expense():
                 # حفظ الفاتورة
                 file_data = file.read()
                 if file_data:
-                    compressed_data = compress_image(file_data)
+                    compressed = compress_upload(file_data, file.mimetype, file.filename, mode='receipt')
+                    compressed_data = compressed['data']
                     
                     timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
                     file_extension = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else 'jpg'
@@ -170,11 +252,13 @@ def add_expense():
                         filename=filename,
                         original_filename=file.filename,
                         file_size=len(compressed_data),
-                        mime_type=file.mimetype,
-                        image_data=compressed_data,
+                        mime_type=compressed['mime_type'],
+                        content_hash=store_upload(compressed_data),
                         captured_by=session["user"]
                     )
                     db.session.add(receipt)
+                    db.session.flush()
+                    enqueue_derivatives('expense_receipt', receipt.id)
         
         db.session.commit()
         print(f"✅ تم إضافة المصروف #{expense.id} بنجاح")
@@ -201,18 +285,33 @@ def delete_expense(id):
         db.session.rollback()
         return redirect(url_for('expenses.expenses'))
 
-def compress_image(image_data, max_size=(1200, 1200), quality=85):
-    """ضغط الصورة للحفاظ على المساحة"""
+@expenses_bp.route("/receipts/<int:receipt_id>")
+def view_expense_receipt(receipt_id):
+    """عرض صورة فاتورة المصروف"""
+    if "user" not in session:
+        return jsonify({"error": "غير مصرح"})
+    
     try:
-        image = Image.open(BytesIO(image_data))
-        
-        # تغيير الحجم إذا كان كبيراً
-        image.thumbnail(max_size, Image.Resampling.LANCZOS)
-        
-        # حفظ بصيغة مضغوطة
-        output = BytesIO()
-        image.save(output, format='JPEG', quality=quality, optimize=True)
-        return output.getvalue()
+        receipt = ExpenseReceipt.query.options(undefer(ExpenseReceipt.image_data)).get_or_404(receipt_id)
+        return send_content(
+            receipt.content_hash,
+            legacy_data=None if receipt.content_hash else receipt.image_data,
+            mimetype=receipt.mime_type or 'image/jpeg',
+            filename=receipt.filename,
+            last_modified=receipt.captured_at
+        )
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+@expenses_bp.route("/receipts/<int:receipt_id>/thumbnail")
+def view_expense_receipt_thumbnail(receipt_id):
+    """الصورة المصغرة لفاتورة المصروف (?size=preview لنسخة المعاينة)"""
+    if "user" not in session:
+        return jsonify({"error": "غير مصرح"})
+    
+    try:
+        receipt = ExpenseReceipt.query.get_or_404(receipt_id)
+        rendition = 'preview' if request.args.get('size') == 'preview' else 'thumb'
+        return send_thumbnail('expense_receipt', receipt.id, rendition, 'image')
     except Exception as e:
-        print(f"خطأ في ضغط الصورة: {e}")
-        return image_data
\ No newline at end of file
+        return jsonify({"success": False, "error": str(e)})
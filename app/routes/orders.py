@@ -1,14 +1,23 @@
 # routes/orders.py
 from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify, Response, flash
-from models import db, Order, PhoneNumber, Status, OrderHistory, Worker, OrderAssignment, OrderAttachment, Task
+from models import db, Order, PhoneNumber, Status, OrderHistory, Worker, OrderAssignment, OrderAttachment, Task, OrderFinancials
 from models import User, Expense, Transport, Debt, AttachmentNotes  # ✅ إضافة AttachmentNotes هنا
+from financials import prefetch_order_financials, get_orders_health_stats
+from pagination import keyset_paginate, wants_json, page_json
+from lookups import get_lookup, search_orders, order_search_condition
+from identity import is_admin, get_admin_users
+from blob_store import store_upload
+from delivery import send_content
+from derivatives import enqueue_derivatives, delete_derivatives, send_thumbnail
+from compression import compress_uploads
+from audit import log_entity_activity, PRIORITY_LOW
 from datetime import datetime, timezone, timedelta
 import os
-from sqlalchemy.orm import joinedload
+import json
+from sqlalchemy import func, case, and_, or_
+from sqlalchemy.orm import joinedload, selectinload, undefer
 from werkzeug.utils import secure_filename
 import base64
-from io import BytesIO
-from PIL import Image
 
 # إنشاء Blueprint للطلبيات
 orders_bp = Blueprint('orders', __name__)
@@ -76,34 +85,12 @@ class StorageManager:
 # تعريف الدوال المساعدة محليًا
 def is_admin_user():
     """التحقق من أن المستخدم الحالي هو أدمن"""
-    if "user" not in session:
-        return False
-    
-    username = session["user"]
-    
-    # البحث في جدول المديرين
-    admin_user = User.query.filter_by(username=username).first()
-    if admin_user and admin_user.role in ['admin', 'manager']:
-        return True
-    
-    return False
+    return is_admin()
 
 def get_admin_users_list():
     """جلب قائمة الأدمن للفلتر"""
     try:
-        admin_users = User.query.filter(
-            User.role.in_(['admin', 'manager']),
-            User.is_active == True
-        ).all()
-        
-        admins_list = []
-        for user in admin_users:
-            admins_list.append({
-                "username": user.username,
-                "full_name": user.full_name or user.username
-            })
-        
-        return admins_list
+        return get_admin_users()
     except Exception as e:
         print(f"❌ خطأ في جلب قائمة الأدمن: {e}")
         return []
@@ -134,95 +121,51 @@ def allowed_file(filename):
             'mp4', 'mov', 'avi', 'mkv', 'webm'  # إضافة صيغ الفيديو
         }
 
-def compress_image_advanced(image_data, max_size=(1200, 1200), quality=85):
-    """ضغط متقدم للصور مع الحفاظ على الجودة"""
-    try:
-        image = Image.open(BytesIO(image_data))
-        
-        # التحقق من حجم الصورة الأصلية
-        original_size = len(image_data)
-        if original_size < 500 * 1024:  # أقل من 500KB لا نحتاج ضغط
-            return image_data
-        
-        # تغيير الحجم إذا كان كبيراً
-        image.thumbnail(max_size, Image.Resampling.LANCZOS)
-        
-        # حفظ بصيغة مضغوطة مع التحسين
-        output = BytesIO()
-        
-        if image.format == 'PNG':
-            image.save(output, format='PNG', optimize=True)
-        else:
-            image.save(output, format='JPEG', quality=quality, optimize=True)
-        
-        compressed_data = output.getvalue()
-        compression_ratio = len(compressed_data) / original_size
-        
-        print(f"✅ تم ضغط الصورة: {original_size/1024:.1f}KB → {len(compressed_data)/1024:.1f}KB ({compression_ratio*100:.1f}%)")
-        
-        return compressed_data
-    except Exception as e:
-        print(f"❌ خطأ في ضغط الصورة: {e}")
-        return image_data
-
-def should_compress_file(file_data, filename, mime_type):
-    """تحديد إذا كان الملف يحتاج ضغط"""
-    # الملفات الصغيرة لا تحتاج ضغط
-    if len(file_data) < 300 * 1024:  # أقل من 300KB
-        return False
-    
-    # فقط الصور يتم ضغطها
-    if mime_type.startswith('image/'):
-        return True
-    
-    # يمكن إضافة أنواع أخرى لاحقاً
-    return False
-
-def compress_image_advanced(image_data, max_size=(1200, 1200), quality=85):
-    """ضغط متقدم للصور مع الحفاظ على الجودة"""
-    try:
-        from PIL import Image
-        from io import BytesIO
-        
-        image = Image.open(BytesIO(image_data))
-        
-        # التحقق من حجم الصورة الأصلية
-        original_size = len(image_data)
-        
-        # تغيير الحجم إذا كان كبيراً
-        if image.size[0] > max_size[0] or image.size[1] > max_size[1]:
-            image.thumbnail(max_size, Image.Resampling.LANCZOS)
-        
-        # حفظ بصيغة مضغوطة مع التحسين
-        output = BytesIO()
-        
-        if image.format == 'PNG':
-            # للصور PNG نستخدم optimize فقط
-            image.save(output, format='PNG', optimize=True)
-        else:
-            # للصور JPEG نستخدم الضغط مع الجودة
-            image.save(output, format='JPEG', quality=quality, optimize=True)
-        
-        compressed_data = output.getvalue()
-        
-        # إذا كان الملف المضغوط أكبر من الأصلي، نعود للأصلي
-        if len(compressed_data) >= original_size:
-            return image_data
-        
-        compression_ratio = (original_size - len(compressed_data)) / original_size * 100
-        
-        print(f"✅ تم ضغط الصورة: {original_size/1024:.1f}KB → {len(compressed_data)/1024:.1f}KB (وفرنا {compression_ratio:.1f}%)")
-        
-        return compressed_data
-        
-    except Exception as e:
-        print(f"❌ خطأ في ضغط الصورة: {e}")
-        return image_data
-
 # ========================
 # ⚡ مسارات الطلبيات
 # ========================
 
+def get_order_list_stats(query):
+    """عدد ومجاميع الطلبيات المطابقة للفلتر في استعلام تجميع واحد"""
+    costs = func.coalesce(OrderFinancials.expenses_total, 0) + func.coalesce(OrderFinancials.transports_total, 0)
+    row = query.outerjoin(OrderFinancials, OrderFinancials.order_id == Order.id).with_entities(
+        func.count(Order.id),
+        func.coalesce(func.sum(case((Order.is_paid == True, 1), else_=0)), 0),
+        func.coalesce(func.sum(Order.total), 0),
+        func.coalesce(func.sum(Order.paid), 0),
+        func.coalesce(func.sum(costs), 0)
+    ).one()
+    count, completed, total, paid, total_costs = row
+    return {
+        'count': count,
+        'active': count - completed,
+        'completed': completed,
+        'total': total,
+        'paid': paid,
+        'remaining': round(total - paid, 2),
+        'total_costs': total_costs,
+        'profit': total - total_costs,
+    }
+
+def _order_row(order):
+    """صف طلبية لاستجابة JSON (التمرير اللانهائي)"""
+    return {
+        "id": order.id,
+        "name": order.name,
+        "wilaya": order.wilaya,
+        "product": order.product,
+        "phones": [phone.number for phone in order.phones],
+        "status": order.status.name if order.status else None,
+        "total": order.total,
+        "paid": order.paid,
+        "remaining": order.remaining,
+        "total_costs": order.total_costs,
+        "profit": order.profit,
+        "is_paid": order.is_paid,
+        "workers": [worker.name for worker in order.assigned_workers],
+        "created_at": order.created_at.isoformat() if order.created_at else None
+    }
+
 @orders_bp.route("/orders")
 def orders():
     """صفحة إدارة الطلبيات"""
@@ -230,24 +173,83 @@ def orders():
         return redirect(url_for("auth.login"))
     
     show_paid = request.args.get('show_paid', 'false').lower() == 'true'
+    filters = {
+        'q': request.args.get('q', '').strip(),
+        'status': request.args.get('status', type=int),
+        'worker': request.args.get('worker', type=int),
+        'health': request.args.get('health', ''),
+    }
+    if filters['health'] == 'completed_with_debt':
+        # المكتملة مع ديون مدفوعة بالتعريف: فلتر "غير المدفوعة فقط" الافتراضي يفرغ القائمة
+        show_paid = True
     
-    if show_paid:
-        orders = Order.query.options(joinedload(Order.phones)).order_by(Order.created_at.desc()).all()
-    else:
-        orders = Order.query.options(joinedload(Order.phones)).filter(Order.is_paid == False).order_by(Order.created_at.desc()).all()
+    # البحث والفلاتر في SQL حتى يشملا كل الطلبيات وليس الصفحة المعروضة فقط
+    query = Order.query
+    if not show_paid:
+        query = query.filter(Order.is_paid == False)
+    if filters['status']:
+        query = query.filter(Order.status_id == filters['status'])
+    search = order_search_condition(filters['q'])
+    if search is not None:
+        query = query.filter(search)
+    if filters['worker']:
+        query = query.filter(Order.id.in_(db.session.query(OrderAssignment.order_id).filter(
+            OrderAssignment.worker_id == filters['worker'], OrderAssignment.is_active == True)))
+    if filters['health'] in ('healthy', 'debt', 'completed_with_debt'):
+        debt = OrderFinancials.expense_debt_remaining + OrderFinancials.transport_debt_remaining
+        with_debts = Order.id.in_(db.session.query(OrderFinancials.order_id).filter(debt > 0))
+        if filters['health'] == 'healthy':
+            query = query.filter(~with_debts)
+        elif filters['health'] == 'debt':
+            query = query.filter(with_debts)
+        else:
+            query = query.filter(with_debts, Order.is_paid == True)
+    
+    # بطاقات الإحصائيات على كل الطلبيات المطابقة (من جدول الملخص order_financials)
+    order_stats = get_order_list_stats(query)
+    
+    page = keyset_paginate(query.options(
+        joinedload(Order.status),
+        selectinload(Order.phones),
+        selectinload(Order.order_assignments).joinedload(OrderAssignment.worker)
+    ), Order)
+    orders = page.items
     
-    statuses = Status.query.all()
-    workers = Worker.query.filter_by(is_active=True).all()
-    users = User.query.all()
+    # تحميل الملخصات المالية لطلبيات الصفحة دفعة واحدة قبل عرض القالب
+    prefetch_order_financials(orders)
+    if wants_json():
+        return page_json(page, _order_row, total_count=order_stats['count'])
+    
+    # القوائم المنسدلة من الذاكرة المشتركة (تُبطل عند تعديل الحالات أو العمال أو المستخدمين)
+    statuses = get_lookup('statuses')
+    workers = get_lookup('active_workers')
+    users = get_lookup('users')
     
     # ✅ تحديث: استخدام النظام الجديد بدلاً من orders.html
     return render_template("orders/orders_main.html", 
                         orders=orders, 
+                        page=page,
+                        order_stats=order_stats,
                         statuses=statuses,
                         workers=workers,
                         users=users,
+                        filters=filters,
+                        filter_args={key: value for key, value in filters.items() if value},
                         show_paid=show_paid)
 
+@orders_bp.route("/api/lookup/orders")
+def api_lookup_orders():
+    """بحث الطلبيات لمنتقي الطلبية في نماذج المصاريف والنقل (?q=)"""
+    if "user" not in session:
+        return jsonify({"success": False, "error": "غير مصرح"})
+    
+    try:
+        limit = min(request.args.get('limit', 20, type=int), 50)
+        return jsonify({"success": True, "orders": search_orders(request.args.get('q', ''), limit=limit)})
+    except Exception as e:
+        print(f"❌ خطأ في البحث عن الطلبيات: {e}")
+        return jsonify({"success": False, "error": str(e)})
+
 @orders_bp.route("/orders/add", methods=["POST"])
 def add_order():
     """إضافة طلبية جديدة"""
@@ -712,66 +714,70 @@ def upload_attachments_real():
         uploaded_files = []
         total_space_saved = 0
         
-        for i, file in enumerate(files):
-            if file and file.filename and allowed_file(file.filename):
-                try:
-                    # قراءة بيانات الملف
-                    file_data = file.read()
-                    original_size = len(file_data)
-                    
-                    # ========================
-                    # 🗜️ ضغط الملف تلقائياً إذا لزم
-                    # ========================
-                    if should_compress_file(file_data, file.filename, file.content_type):
-                        print(f"🔄 جاري ضغط {file.filename}...")
-                        compressed_data = compress_image_advanced(file_data)
-                        if len(compressed_data) < original_size:
-                            file_data = compressed_data
-                            space_saved = original_size - len(file_data)
-                            total_space_saved += space_saved
-                            print(f"✅ تم توفير {space_saved/1024:.1f}KB من المساحة لـ {file.filename}")
-                    
-                    # تحديد نوع الملف
-                    file_type = get_file_type(file.filename, file.content_type)
-                    
-                    # إنشاء اسم فريد
-                    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S_%f")
-                    file_extension = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else 'bin'
-                    filename = f"order_{order_id}_{timestamp}.{file_extension}"
-                    
-                    # استخدام التسمية المخصصة إذا كانت موجودة
-                    display_label = label if label else file.filename.rsplit('.', 1)[0]
-                    
-                    # حفظ في قاعدة البيانات
-                    attachment = OrderAttachment(
-                        order_id=order_id,
-                        filename=filename,
-                        original_filename=file.filename,
-                        file_size=len(file_data),
-                        mime_type=file.content_type,
-                        file_data=file_data,
-                        file_type=file_type,
-                        description=display_label,
-                        captured_by=session["user"]
-                    )
-                    db.session.add(attachment)
-                    db.session.flush()
-                    
-                    uploaded_files.append({
-                        'id': attachment.id,
-                        'filename': filename,
-                        'original_name': file.filename,
-                        'label': display_label,
-                        'size': len(file_data),
-                        'original_size': original_size,
-                        'uploaded_by': session["user"],
-                        'compressed': len(file_data) < original_size,
-                        'space_saved': original_size - len(file_data)
-                    })
-                    
-                except Exception as file_error:
-                    print(f"❌ خطأ في معالجة الملف {file.filename}: {file_error}")
-                    continue
+        # قراءة الملفات المسموحة أولاً ثم ضغطها دفعة واحدة (بالتوازي عند تعدد الملفات)
+        valid_files = [file for file in files if file and file.filename and allowed_file(file.filename)]
+        compression_results = compress_uploads([{
+            'data': file.read(),
+            'mime_type': file.content_type,
+            'filename': file.filename,
+            'mode': 'attachment'
+        } for file in valid_files])
+        
+        for file, result in zip(valid_files, compression_results):
+            try:
+                file_data = result['data']
+                original_size = result['original_size']
+                if result['compressed']:
+                    space_saved = original_size - len(file_data)
+                    total_space_saved += space_saved
+                    print(f"✅ تم توفير {space_saved/1024:.1f}KB من المساحة لـ {file.filename} ({result['timings'].get('total_ms')}ms)")
+                
+                # تحديد نوع الملف
+                file_type = get_file_type(file.filename, file.content_type)
+                
+                # إنشاء اسم فريد
+                timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S_%f")
+                file_extension = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else 'bin'
+                filename = f"order_{order_id}_{timestamp}.{file_extension}"
+                
+                # استخدام التسمية المخصصة إذا كانت موجودة
+                display_label = label if label else file.filename.rsplit('.', 1)[0]
+                
+                # حفظ في قاعدة البيانات
+                attachment = OrderAttachment(
+                    order_id=order_id,
+                    filename=filename,
+                    original_filename=file.filename,
+                    file_size=len(file_data),
+                    mime_type=result['mime_type'],
+                    content_hash=store_upload(file_data),
+                    file_type=file_type,
+                    description=display_label,
+                    captured_by=session["user"]
+                )
+                db.session.add(attachment)
+                db.session.flush()
+                
+                # توليد النسخ المصغرة في الخلفية بعد تثبيت الرفع
+                if file_type in ('image', 'video'):
+                    enqueue_derivatives('attachment', attachment.id)
+                
+                uploaded_files.append({
+                    'id': attachment.id,
+                    'filename': filename,
+                    'original_name': file.filename,
+                    'label': display_label,
+                    'size': len(file_data),
+                    'original_size': original_size,
+                    'uploaded_by': session["user"],
+                    'compressed': result['compressed'],
+                    'space_saved': original_size - len(file_data),
+                    'compression_timings': result['timings']
+                })
+                
+            except Exception as file_error:
+                print(f"❌ خطأ في معالجة الملف {file.filename}: {file_error}")
+                continue
         
         if not uploaded_files:
             return jsonify({"success": False, "error": "❌ فشل في رفع أي ملف"})
@@ -846,139 +852,21 @@ def upload_attachments_real():
 
 @orders_bp.route("/api/attachments/<int:attachment_id>/thumbnail")
 def get_attachment_thumbnail(attachment_id):
-    """الحصول على الصورة المصغرة للمرفق"""
+    """الحصول على الصورة المصغرة للمرفق (?size=preview لنسخة المعاينة)
+
+    النسخ تُولد في الخلفية عند الرفع، وهذا المسار يرسلها فقط دون أي معالجة.
+    """
     if "user" not in session:
         return jsonify({"error": "غير مصرح"})
     
     try:
         attachment = OrderAttachment.query.get_or_404(attachment_id)
-        
-        # إذا كان هناك صورة مصغرة مخزنة
-        if attachment.thumbnail_data:
-            return Response(
-                attachment.thumbnail_data,
-                mimetype='image/jpeg',
-                headers={"Content-Disposition": f"inline; filename=thumbnail_{attachment.id}.jpg"}
-            )
-        
-        # إذا كان صورة عادية، استخدم البيانات الأصلية
-        elif attachment.file_type == 'image':
-            return Response(
-                attachment.file_data,
-                mimetype=attachment.mime_type,
-                headers={"Content-Disposition": f"inline; filename=thumbnail_{attachment.id}.jpg"}
-            )
-        
-        # إذا كان فيديو بدون ثامبنيليز، إنشاء واحدة فوراً
-        elif attachment.file_type == 'video':
-            thumbnail = generate_video_thumbnail_simple(attachment.file_data)
-            if thumbnail:
-                # حفظ الثامبنيليز للمستقبل
-                attachment.thumbnail_data = thumbnail
-                db.session.commit()
-                
-                return Response(
-                    thumbnail,
-                    mimetype='image/jpeg',
-                    headers={"Content-Disposition": f"inline; filename=thumbnail_{attachment.id}.jpg"}
-                )
-        
-        # إذا لم يكن هناك ثامبنيليز، أرجع أيقونة افتراضية
-        default_thumbnail = generate_default_thumbnail(attachment.file_type)
-        return Response(
-            default_thumbnail,
-            mimetype='image/jpeg',
-            headers={"Content-Disposition": f"inline; filename=thumbnail_{attachment.id}.jpg"}
-        )
+        rendition = 'preview' if request.args.get('size') == 'preview' else 'thumb'
+        return send_thumbnail('attachment', attachment.id, rendition, attachment.file_type)
         
     except Exception as e:
         print(f"❌ خطأ في عرض الصورة المصغرة: {e}")
         return jsonify({"success": False, "error": str(e)})
-
-def generate_default_thumbnail(file_type, size=(200, 150)):
-    """إنشاء صورة مصغرة افتراضية حسب نوع الملف"""
-    from PIL import Image, ImageDraw, ImageFont
-    import io
-    
-    try:
-        # ألوان حسب نوع الملف
-        colors = {
-            'video': (41, 128, 185),     # أزرق
-            'image': (39, 174, 96),      # أخضر
-            'pdf': (231, 76, 60),        # أحمر
-            'document': (52, 152, 219),  # أزرق فاتح
-            'other': (149, 165, 166)     # رمادي
-        }
-        
-        color = colors.get(file_type, (149, 165, 166))
-        
-        # إنشاء الصورة
-        img = Image.new('RGB', size, color)
-        draw = ImageDraw.Draw(img)
-        
-        # إضافة أيقونة
-        icons = {
-            'video': '▶',
-            'image': '🖼️',
-            'pdf': '📄',
-            'document': '📝',
-            'other': '📎'
-        }
-        
-        icon = icons.get(file_type, '📎')
-        
-        try:
-            # محاولة استخدام خط كبير للأيقونة
-            font = ImageFont.truetype("arial.ttf", 40)
-        except:
-            font = ImageFont.load_default()
-        
-        # رسم الأيقونة
-        bbox = draw.textbbox((0, 0), icon, font=font)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
-        
-        x = (size[0] - text_width) // 2
-        y = (size[1] - text_height) // 2 - 10
-        
-        draw.text((x, y), icon, fill=(255, 255, 255), font=font)
-        
-        # إضافة نص نوع الملف
-        type_names = {
-            'video': 'فيديو',
-            'image': 'صورة',
-            'pdf': 'PDF',
-            'document': 'مستند',
-            'other': 'ملف'
-        }
-        
-        type_name = type_names.get(file_type, 'ملف')
-        
-        try:
-            small_font = ImageFont.truetype("arial.ttf", 16)
-        except:
-            small_font = ImageFont.load_default()
-        
-        bbox_small = draw.textbbox((0, 0), type_name, font=small_font)
-        text_width_small = bbox_small[2] - bbox_small[0]
-        
-        x_small = (size[0] - text_width_small) // 2
-        y_small = y + text_height + 5
-        
-        draw.text((x_small, y_small), type_name, fill=(255, 255, 255), font=small_font)
-        
-        # حفظ الصورة
-        output = io.BytesIO()
-        img.save(output, format='JPEG', quality=85)
-        return output.getvalue()
-        
-    except Exception as e:
-        print(f"❌ خطأ في إنشاء الصورة الافتراضية: {e}")
-        # صورة بديلة بسيطة
-        img = Image.new('RGB', size, (200, 200, 200))
-        output = io.BytesIO()
-        img.save(output, format='JPEG')
-        return output.getvalue()
     
 @orders_bp.route("/api/orders/save-attachment-notes", methods=["POST"])
 def save_attachment_notes():
@@ -1163,74 +1051,155 @@ def get_orders_related_debts():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
+# ========================
+# الطلبيات المتأثرة بالديون (تجميع واحد + ترقيم بالمؤشر)
+# ========================
+DEBT_BUCKETS = {
+    'low': "ديون قليلة",
+    'medium': "ديون متوسطة",
+    'high': "ديون عالية",
+}
+DEBTS_PAGE_DEFAULT = 50
+DEBTS_PAGE_MAX = 500
+
+
+def _encode_debts_cursor(sort_value, order_id):
+    """ترميز مؤشر الصفحة التالية (قيمة الترتيب + رقم الطلبية)"""
+    raw = json.dumps([sort_value, order_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def _decode_debts_cursor(cursor):
+    """فك ترميز المؤشر، يعيد None إذا كان غير صالح"""
+    try:
+        sort_value, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return float(sort_value), int(order_id)
+    except Exception:
+        return None
+
+
+def _order_debts_subquery():
+    """تجميع الديون غير المسددة لكل طلبية في استعلام GROUP BY واحد"""
+    order_id = func.coalesce(Expense.order_id, Transport.order_id)
+    remaining = func.sum(Debt.debt_amount - Debt.paid_amount)
+    return db.session.query(
+            order_id.label('order_id'),
+            remaining.label('debt_amount')
+        )\
+        .select_from(Debt)\
+        .outerjoin(Expense, and_(Debt.source_type == 'expense', Debt.source_id == Expense.id))\
+        .outerjoin(Transport, and_(Debt.source_type == 'transport', Debt.source_id == Transport.id))\
+        .filter(Debt.status == 'unpaid', order_id.isnot(None))\
+        .group_by(order_id)\
+        .having(remaining > 0)\
+        .subquery()
+
+
 @orders_bp.route("/api/orders/with_debts")
 def get_orders_with_debts():
-    """جلب الطلبيات المتأثرة بالديون"""
+    """جلب الطلبيات المتأثرة بالديون
+
+    المعاملات الاختيارية:
+    - sort: debt_amount (افتراضي) أو debt_percentage
+    - direction: desc (افتراضي) أو asc
+    - limit: عدد الطلبيات في الصفحة (افتراضي 50، أقصى 500)
+    - cursor: مؤشر الصفحة التالية كما أعاده الرد السابق
+    - bucket: low / medium / high لتصفية حسب شدة الديون
+    """
     try:
-        orders_with_debts = []
-        
-        # جلب جميع الطلبيات
-        all_orders = Order.query.all()
-        total_orders = len(all_orders)
-        
-        for order in all_orders:
-            # حساب ديون الطلبية
-            order_debt = 0
-            
-            # ديون المصاريف
-            expense_debts = db.session.query(Debt, Expense)\
-                .join(Expense, Debt.source_id == Expense.id)\
-                .filter(
-                    Expense.order_id == order.id,
-                    Debt.status == 'unpaid'
-                ).all()
-            
-            for debt, expense in expense_debts:
-                order_debt += debt.remaining_amount
-            
-            # ديون النقل
-            transport_debts = db.session.query(Debt, Transport)\
-                .join(Transport, Debt.source_id == Transport.id)\
-                .filter(
-                    Transport.order_id == order.id,
-                    Debt.status == 'unpaid'
-                ).all()
-            
-            for debt, transport in transport_debts:
-                order_debt += debt.remaining_amount
-            
-            if order_debt > 0:
-                debt_percentage = (order_debt / order.total * 100) if order.total > 0 else 0
-                
-                # تحديد حالة الدين
-                if debt_percentage <= 30:
-                    status = "ديون قليلة"
-                elif debt_percentage <= 60:
-                    status = "ديون متوسطة"
-                else:
-                    status = "ديون عالية"
-                
-                orders_with_debts.append({
-                    'order_id': order.id,
-                    'customer_name': order.name,
-                    'total_amount': order.total,
-                    'debt_amount': order_debt,
-                    'debt_percentage': debt_percentage,
-                    'status': status
-                })
+        sort = request.args.get('sort', 'debt_amount')
+        if sort not in ('debt_amount', 'debt_percentage'):
+            sort = 'debt_amount'
+        descending = request.args.get('direction', 'desc') != 'asc'
+        limit = request.args.get('limit', DEBTS_PAGE_DEFAULT, type=int) or DEBTS_PAGE_DEFAULT
+        limit = max(1, min(limit, DEBTS_PAGE_MAX))
+        bucket = request.args.get('bucket')
+        
+        debts = _order_debts_subquery()
+        # التقريب يتم في Python: round(double, int) غير موجودة في PostgreSQL
+        debt_amount = debts.c.debt_amount
+        debt_percentage = case(
+            (Order.total > 0, debts.c.debt_amount * 100.0 / Order.total),
+            else_=0.0
+        )
+        # تصنيف شدة الديون داخل قاعدة البيانات
+        status = case(
+            (debt_percentage <= 30, DEBT_BUCKETS['low']),
+            (debt_percentage <= 60, DEBT_BUCKETS['medium']),
+            else_=DEBT_BUCKETS['high']
+        )
+        sort_column = debt_amount if sort == 'debt_amount' else debt_percentage
+        
+        query = db.session.query(
+                Order.id, Order.name, Order.total,
+                debt_amount.label('debt_amount'),
+                debt_percentage.label('debt_percentage'),
+                status.label('status'),
+                sort_column.label('sort_value')
+            )\
+            .join(debts, debts.c.order_id == Order.id)
+        
+        if bucket in DEBT_BUCKETS:
+            query = query.filter(status == DEBT_BUCKETS[bucket])
+        
+        cursor = request.args.get('cursor')
+        if cursor:
+            position = _decode_debts_cursor(cursor)
+            if position is None:
+                return jsonify({'success': False, 'error': 'مؤشر الصفحة غير صالح'}), 400
+            last_value, last_id = position
+            if descending:
+                query = query.filter(or_(sort_column < last_value,
+                                         and_(sort_column == last_value, Order.id < last_id)))
+            else:
+                query = query.filter(or_(sort_column > last_value,
+                                         and_(sort_column == last_value, Order.id > last_id)))
         
-        # إحصائيات
-        total_debts = sum(order['debt_amount'] for order in orders_with_debts)
-        debt_free_orders = total_orders - len(orders_with_debts)
+        if descending:
+            query = query.order_by(sort_column.desc(), Order.id.desc())
+        else:
+            query = query.order_by(sort_column.asc(), Order.id.asc())
+        
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        orders_with_debts = [{
+            'order_id': row.id,
+            'customer_name': row.name,
+            'total_amount': row.total,
+            'debt_amount': round(row.debt_amount, 2),
+            'debt_percentage': row.debt_percentage,
+            'status': row.status
+        } for row in rows]
+        
+        next_cursor = None
+        if has_more and rows:
+            next_cursor = _encode_debts_cursor(rows[-1].sort_value, rows[-1].id)
+        
+        # إحصائيات على كامل المجموعة وليس الصفحة الحالية فقط
+        affected_orders, total_debts = db.session.query(
+            func.count(debts.c.order_id),
+            func.coalesce(func.sum(debts.c.debt_amount), 0.0)
+        ).one()
+        total_orders = db.session.query(func.count(Order.id)).scalar() or 0
+        total_debts = round(total_debts, 2)
         
         return jsonify({
             'success': True,
             'orders': orders_with_debts,
             'statistics': {
                 'total_debts': total_debts,
-                'affected_orders': len(orders_with_debts),
-                'debt_free_orders': debt_free_orders,
-                'average_debt': total_debts / len(orders_with_debts) if orders_with_debts else 0
+                'affected_orders': affected_orders,
+                'debt_free_orders': total_orders - affected_orders,
+                'average_debt': total_debts / affected_orders if affected_orders else 0
+            },
+            'pagination': {
+                'sort': sort,
+                'direction': 'desc' if descending else 'asc',
+                'limit': limit,
+                'has_more': has_more,
+                'next_cursor': next_cursor
             }
         })
         
@@ -1334,11 +1303,14 @@ def download_attachment(attachment_id):
         return jsonify({"error": "غير مصرح"})
     
     try:
-        attachment = OrderAttachment.query.get_or_404(attachment_id)
-        return Response(
-            attachment.file_data,
+        attachment = OrderAttachment.query.options(undefer(OrderAttachment.file_data)).get_or_404(attachment_id)
+        return send_content(
+            attachment.content_hash,
+            legacy_data=None if attachment.content_hash else attachment.file_data,
             mimetype=attachment.mime_type,
-            headers={"Content-Disposition": f"attachment; filename={attachment.original_filename}"}
+            filename=attachment.original_filename,
+            as_attachment=True,
+            last_modified=attachment.captured_at
         )
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
@@ -1351,13 +1323,15 @@ def view_attachment(attachment_id):
         return jsonify({"error": "غير مصرح"})
     
     try:
-        attachment = OrderAttachment.query.get_or_404(attachment_id)
+        attachment = OrderAttachment.query.options(undefer(OrderAttachment.file_data)).get_or_404(attachment_id)
         
-        # إرجاع الملف كاستجابة
-        return Response(
-            attachment.file_data,
+        # إرجاع الملف كاستجابة (يدعم Range و ETag)
+        return send_content(
+            attachment.content_hash,
+            legacy_data=None if attachment.content_hash else attachment.file_data,
             mimetype=attachment.mime_type,
-            headers={"Content-Disposition": f"inline; filename={attachment.original_filename}"}
+            filename=attachment.original_filename,
+            last_modified=attachment.captured_at
         )
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
@@ -1369,22 +1343,19 @@ def view_video_attachment(attachment_id):
         return jsonify({"error": "غير مصرح"})
     
     try:
-        attachment = OrderAttachment.query.get_or_404(attachment_id)
+        attachment = OrderAttachment.query.options(undefer(OrderAttachment.file_data)).get_or_404(attachment_id)
         
         # التحقق من أن الملف فيديو
         if attachment.file_type != 'video':
             return jsonify({"success": False, "error": "هذا الملف ليس فيديو"})
         
-        # إرجاع الفيديو كاستجابة
-        return Response(
-            attachment.file_data,
+        # إرجاع الفيديو مع دعم Range حتى لا يُعاد تحميل الملف كاملاً عند التقديم
+        return send_content(
+            attachment.content_hash,
+            legacy_data=None if attachment.content_hash else attachment.file_data,
             mimetype=attachment.mime_type,
-            headers={
-                "Content-Disposition": f"inline; filename={attachment.original_filename}",
-                "Content-Length": str(attachment.file_size),
-                "Accept-Ranges": "bytes",  # لدعم التشغيل الجزئي
-                "Content-Type": attachment.mime_type
-            }
+            filename=attachment.original_filename,
+            last_modified=attachment.captured_at
         )
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
@@ -1402,6 +1373,7 @@ def delete_attachment(attachment_id):
         attachment_name = attachment.description or attachment.original_filename
         
         db.session.delete(attachment)
+        delete_derivatives('attachment', attachment_id)
         
         # تسجيل في السجل
         history = OrderHistory(
@@ -1545,6 +1517,13 @@ def clear_attachment_notes():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
+ATTACHMENT_ACTIONS = {
+    'preview': "معاينة مرفق",
+    'view_details': "عرض تفاصيل مرفق",
+    'edit_request': "طلب تعديل مرفق",
+    'delete': "حذف مرفق",
+}
+
 @orders_bp.route("/api/orders/log-attachment-activity", methods=["POST"])
 def log_attachment_activity():
     """تسجيل نشاط المرفقات"""
@@ -1552,20 +1531,21 @@ def log_attachment_activity():
         return jsonify({"success": False, "error": "غير مصرح"})
     
     try:
-        data = request.get_json()
+        data = request.get_json() or {}
+        order_id = data.get('order_id')
+        if not order_id:
+            return jsonify({"success": False, "error": "رقم الطلبية مطلوب"})
         
-        # تسجيل النشاط في سجل الطلبية
-        activity_data = {
-            'order_id': data.get('order_id'),
-            'action': data.get('action'),
-            'attachment_id': data.get('attachment_id'),
-            'details': data.get('details', ''),
-            'user': session.get('user', 'النظام'),
-            'timestamp': datetime.now(timezone.utc)
-        }
+        action = data.get('action')
+        label = data.get('attachment_label') or f"#{data.get('attachment_id')}"
+        details = data.get('details') or f"المرفق {label}"
         
-        # هنا يمكنك حفظ النشاط في قاعدة البيانات
-        print(f"📝 نشاط المرفقات: {activity_data}")
+        # أحداث قراءة لا تكتب شيئاً: تُؤجل وتُدرج دفعة واحدة في الخلفية
+        log_entity_activity(
+            session["user"], 'order', int(order_id),
+            ATTACHMENT_ACTIONS.get(action, "نشاط مرفق"), details,
+            priority=PRIORITY_LOW
+        )
         
         return jsonify({
             "success": True,
@@ -1846,26 +1826,9 @@ def get_total_costs():
 def get_health_stats():
     """جلب إحصائيات صحة الطلبيات"""
     try:
-        all_orders = Order.query.all()
-        total_orders = len(all_orders)
-        
-        healthy_orders = [order for order in all_orders if order.total_related_debts == 0]
-        healthy_count = len(healthy_orders)
-        
-        debt_orders = [order for order in all_orders if order.total_related_debts > 0]
-        debt_count = len(debt_orders)
-        total_debts_amount = sum(order.total_related_debts for order in debt_orders)
-        
         return jsonify({
             "success": True,
-            "stats": {
-                'total_orders': total_orders,
-                'healthy_orders': healthy_count,
-                'debt_orders': debt_count,
-                'total_debts_amount': total_debts_amount,
-                'healthy_percentage': (healthy_count / total_orders * 100) if total_orders > 0 else 0,
-                'debt_percentage': (debt_count / total_orders * 100) if total_orders > 0 else 0
-            }
+            "stats": get_orders_health_stats()
         })
         
     except Exception as e:
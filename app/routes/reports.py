@@ -2,7 +2,8 @@
 from flask import Blueprint, render_template, jsonify, request, session, redirect, url_for
 from datetime import datetime, timezone, timedelta
 from sqlalchemy import func, extract
-from models import Order, Expense, Transport, Worker, Debt, Purchase, OrderHistory, WorkerHistory, db
+from models import Order, Expense, Transport, Worker, Debt, Purchase, OrderHistory, WorkerHistory, OrderFinancials, OrderAssignment, db
+from payroll import payroll, payroll_totals
 
 # ✅ تعريف الـ Blueprint هنا بدلاً من الاستيراد
 reports_bp = Blueprint('reports', __name__)
@@ -62,10 +63,8 @@ def financial_report():
             Transport.transport_date.between(start_date, end_date)
         ).first()
         
-        # رواتب العمال
-        workers_salaries = db.session.query(
-            func.sum(Worker.total_salary).label('total_salaries')
-        ).scalar() or 0
+        # رواتب العمال المستحقة حتى نهاية الفترة (تجميع SQL واحد)
+        workers_salaries = payroll_totals(as_of=end_date)['total_salary']
         
         # الديون
         debts_total = db.session.query(
@@ -116,35 +115,36 @@ def workers_report():
         return jsonify({"error": "غير مصرح"})
     
     try:
-        workers = Worker.query.filter_by(is_active=True).all()
-        
+        as_of = datetime.strptime(request.args['as_of'], "%Y-%m-%d").date() if request.args.get('as_of') else None
+        active = (Worker.is_active == True,)
+
+        # عدد الطلبيات المكتملة لكل عامل في استعلام تجميع واحد
+        completed = dict(db.session.query(OrderAssignment.worker_id, func.count(OrderAssignment.id))
+                         .filter(OrderAssignment.is_active == False)
+                         .group_by(OrderAssignment.worker_id).all())
+
+        # كشف الرواتب (المستحق والخصومات والصافي) لكل العمال في استعلام واحد
+        extra = (Worker.absences, Worker.late_hours)
         workers_data = []
-        for worker in workers:
-            # عدد الطلبيات المكتملة
-            completed_orders = len([assignment for assignment in worker.order_assignments if not assignment.is_active])
-            
-            # إجمالي الراتب والمستحقات
-            total_earnings = worker.total_salary
-            total_deductions = worker.advances + (worker.absences * (worker.monthly_salary / 30))
-            net_salary = total_earnings - total_deductions
-            
+        for row in payroll(as_of=as_of, filters=active, extra_columns=extra):
             workers_data.append({
-                "id": worker.id,
-                "name": worker.name,
-                "completed_orders": completed_orders,
-                "total_earnings": total_earnings,
-                "total_deductions": total_deductions,
-                "net_salary": net_salary,
-                "absences": worker.absences,
-                "advances": worker.advances,
-                "start_date": worker.start_date.strftime("%Y-%m-%d") if worker.start_date else "غير محدد"
+                **row,
+                "completed_orders": completed.get(row['id'], 0),
+                "total_earnings": row['gross_salary'],
+                "net_salary": row['total_salary'],
+                "absences": row['absences'] or 0,
+                "advances": row['advances'],
+                "start_date": row['start_date'].strftime("%Y-%m-%d") if row['start_date'] else "غير محدد"
             })
-        
+
+        totals = payroll_totals(as_of=as_of, filters=active)
         return jsonify({
             "success": True,
+            "as_of": (as_of or datetime.now(timezone.utc).date()).strftime("%Y-%m-%d"),
             "workers": workers_data,
-            "total_workers": len(workers),
-            "total_salaries": sum(worker.total_salary for worker in workers)
+            "total_workers": totals['workers_count'],
+            "total_salaries": totals['total_salary'],
+            "totals": totals
         })
         
     except Exception as e:
@@ -161,7 +161,9 @@ def orders_report():
         date_to = request.args.get('date_to')
         status_filter = request.args.get('status', 'all')
         
-        query = Order.query
+        # قراءة التكاليف من جدول الملخص المجمّع بدل حسابها لكل طلبية
+        query = db.session.query(Order, OrderFinancials)\
+            .outerjoin(OrderFinancials, OrderFinancials.order_id == Order.id)
         
         if date_from and date_to:
             start_date = datetime.strptime(date_from, "%Y-%m-%d")
@@ -174,12 +176,15 @@ def orders_report():
             elif status_filter == 'unpaid':
                 query = query.filter(Order.is_paid == False)
         
-        orders = query.all()
+        rows = query.all()
         
         orders_data = []
-        for order in orders:
+        total_revenue = 0
+        total_profit = 0
+        paid_orders = 0
+        for order, financials in rows:
             # حساب التكاليف والربح
-            total_costs = order.total_costs
+            total_costs = ((financials.expenses_total or 0) + (financials.transports_total or 0)) if financials else 0
             net_profit = order.total - total_costs
             profit_margin = (net_profit / order.total * 100) if order.total > 0 else 0
             
@@ -197,12 +202,14 @@ def orders_report():
                 "created_date": order.created_at.strftime("%Y-%m-%d"),
                 "wilaya": order.wilaya
             })
+            
+            total_revenue += order.total
+            total_profit += net_profit
+            if order.is_paid:
+                paid_orders += 1
         
         # إحصائيات عامة
-        total_orders = len(orders)
-        total_revenue = sum(order.total for order in orders)
-        total_profit = sum(order.total - order.total_costs for order in orders)
-        paid_orders = len([order for order in orders if order.is_paid])
+        total_orders = len(rows)
         
         return jsonify({
             "success": True,
@@ -1,11 +1,23 @@
-from flask import Blueprint, render_template, request, session, redirect, url_for, jsonify, flash
+from flask import Blueprint, render_template, request, session, redirect, url_for, jsonify, flash, send_file
 from models import User, Supplier, ExpenseCategory, TransportCategory, TransportSubType, db
 from datetime import datetime, timezone
-import os
-import shutil
+from functools import wraps
+from routes.helpers import is_admin_user
+import backup
 
 settings_bp = Blueprint('settings', __name__)
 
+def admin_required(view):
+    """مسارات النسخ الاحتياطية للمديرين فقط (حسابات العمال تحمل session["user"] أيضاً)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if "user" not in session:
+            return jsonify({"success": False, "error": "غير مصرح"}), 401
+        if not is_admin_user():
+            return jsonify({"success": False, "error": "هذه العملية للمدير فقط"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
 @settings_bp.route("/settings")
 def settings():
     """صفحة الإعدادات"""
@@ -169,61 +181,107 @@ def delete_supplier(id):
     return redirect(url_for("settings.settings"))
 
 @settings_bp.route("/api/backup/create", methods=['POST'])
+@admin_required
 def create_backup():
-    """إنشاء نسخة احتياطية"""
-    if "user" not in session:
-        return jsonify({"success": False, "error": "غير مصرح"})
-    
+    """إضافة مهمة نسخ احتياطي إلى قائمة المهام الخلفية (تزايدية افتراضياً)
+
+    النسخ يستغرق وقتاً مع قاعدة كبيرة، فلا يُنفذ داخل الطلب: الرد فوري برقم المهمة،
+    والصفحة تتابع حالتها عبر /api/backup/jobs/<job_id>.
+    """
     try:
-        # اسم ملف النسخة الاحتياطية
-        timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-        backup_filename = f"backup_{timestamp}.db"
-        backup_path = f"backups/{backup_filename}"
-        
-        # إنشاء مجلد النسخ الاحتياطية إذا لم يكن موجوداً
-        os.makedirs("backups", exist_ok=True)
-        
-        # نسخ قاعدة البيانات
-        shutil.copy2("data.db", backup_path)
+        mode = (request.get_json(silent=True) or {}).get('mode')
+        if mode is not None and mode not in backup.BACKUP_MODES:
+            return jsonify({"success": False, "error": f"نوع نسخ غير معروف: {mode}"}), 400
+        # خطأ الإعداد (قاعدة ليست SQLite) يظهر فوراً بدل مهمة تنتهي بلا نسخة
+        backup.get_database_path()
         
+        from jobs import enqueue
+        job = enqueue('database_backup', payload={'mode': mode} if mode else None, max_attempts=1)
+        db.session.commit()
         return jsonify({
             "success": True,
-            "message": "تم إنشاء النسخة الاحتياطية بنجاح",
-            "filename": backup_filename
-        })
+            "message": "تمت إضافة النسخ الاحتياطي إلى قائمة المهام",
+            "job_id": job.id
+        }), 202
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({"success": False, "error": str(e)})
 
+@settings_bp.route("/api/backup/jobs/<int:job_id>")
+@admin_required
+def get_backup_job(job_id):
+    """حالة مهمة نسخ احتياطي: pending / running / done / failed"""
+    from models import BackgroundJob
+    job = db.session.get(BackgroundJob, job_id)
+    if job is None or job.kind != 'database_backup':
+        return jsonify({"success": False, "error": "المهمة غير موجودة"}), 404
+    
+    return jsonify({
+        "success": True,
+        "job_id": job.id,
+        "status": job.status,
+        "error": ((job.last_error or '').strip().splitlines() or [''])[-1] if job.status == 'failed' else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    })
+
+def _backup_row(entry):
+    created = datetime.fromisoformat(entry['created_at']).astimezone()
+    return {
+        **entry,
+        "size": f"{round(entry['size_bytes'] / (1024 * 1024), 2)} MB",
+        "created_at": created.strftime("%Y-%m-%d %H:%M")
+    }
+
 @settings_bp.route("/api/backup/history")
+@admin_required
 def get_backup_history():
-    """جلب سجل النسخ الاحتياطية"""
-    if "user" not in session:
-        return jsonify({"success": False, "error": "غير مصرح"})
-    
+    """سجل النسخ الاحتياطية من الفهرس (بدون المرور على المجلد)"""
     try:
-        backups = []
-        if os.path.exists("backups"):
-            for filename in os.listdir("backups"):
-                if filename.startswith("backup_") and filename.endswith(".db"):
-                    filepath = os.path.join("backups", filename)
-                    stat = os.stat(filepath)
-                    size = round(stat.st_size / (1024 * 1024), 2)  # حجم بالميجابايت
-                    created = datetime.fromtimestamp(stat.st_ctime).strftime("%Y-%m-%d %H:%M")
-                    
-                    backups.append({
-                        "filename": filename,
-                        "size": f"{size} MB",
-                        "created_at": created
-                    })
-        
-        # ترتيب من الأحدث إلى الأقدم
-        backups.sort(key=lambda x: x["created_at"], reverse=True)
-        
         return jsonify({
             "success": True,
-            "backups": backups
+            "backups": [_backup_row(entry) for entry in backup.list_backups()]
         })
         
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)})
\ No newline at end of file
+        return jsonify({"success": False, "error": str(e)})
+
+@settings_bp.route("/api/backup/download/<filename>")
+@admin_required
+def download_backup(filename):
+    """تحميل نسخة مسجلة في الفهرس"""
+    entry = backup.get_backup(filename)
+    if entry is None:
+        return jsonify({"success": False, "error": "النسخة غير موجودة"}), 404
+    return send_file(backup.get_backup_path(entry), as_attachment=True, download_name=entry['filename'])
+
+@settings_bp.route("/api/backup/delete/<filename>", methods=['DELETE'])
+@admin_required
+def delete_backup(filename):
+    """حذف نسخة من الفهرس والقرص"""
+    try:
+        if not backup.delete_backup(filename):
+            return jsonify({"success": False, "error": "النسخة غير موجودة"})
+        return jsonify({"success": True, "message": "تم حذف النسخة الاحتياطية"})
+        
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+@settings_bp.route("/api/jobs/stats")
+def get_jobs_stats():
+    """إحصائيات قائمة المهام الخلفية (عمق القائمة، الفشل، حالة المنفذ)"""
+    if "user" not in session:
+        return jsonify({"success": False, "error": "غير مصرح"})
+    
+    from jobs import get_job_stats
+    return jsonify({"success": True, "stats": get_job_stats()})
+
+@settings_bp.route("/api/health/db")
+def database_health():
+    """فحص صحة قاعدة البيانات مع الـ pragmas الفعالة وحالة مجمع الاتصالات"""
+    from database import get_database_health
+    try:
+        return jsonify({"success": True, "database": get_database_health(db)})
+    except Exception as e:
+        print(f"❌ فشل فحص صحة قاعدة البيانات: {e}")
+        return jsonify({"success": False, "error": str(e)}), 503
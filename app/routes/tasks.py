@@ -1,19 +1,37 @@
 from flask import Blueprint, render_template, request, session, redirect, url_for, jsonify
 from models import Task, Worker, OrderAssignment, db
-from models import generate_auto_tasks, get_urgent_tasks, complete_task, create_manual_task
+from models import get_urgent_tasks, complete_task, create_manual_task
+from routes.helpers import is_admin_user, get_admin_users_list
 from datetime import datetime, timezone, timedelta
+from sqlalchemy import func, case
 from sqlalchemy.orm import joinedload
+from pagination import keyset_paginate, wants_json, page_json
 
 tasks_bp = Blueprint('tasks', __name__)
 
+def _task_row(task):
+    """صف مهمة لاستجابة JSON (التمرير اللانهائي)"""
+    return {
+        "id": task.id,
+        "title": task.title,
+        "description": task.description,
+        "priority": task.priority,
+        "status": task.status,
+        "task_type": task.task_type,
+        "assigned_to": task.assigned_to,
+        "due_date": task.due_date.strftime('%Y-%m-%d') if task.due_date else None,
+        "related_entity_type": task.related_entity_type,
+        "related_entity_id": task.related_entity_id,
+        "created_at": task.created_at.isoformat() if task.created_at else None
+    }
+
 @tasks_bp.route("/tasks")
 def tasks():
     """صفحة إدارة المهام الكاملة"""
     if "user" not in session:
         return redirect(url_for("auth.login"))
     
-    # توليد المهام التلقائية أولاً
-    generate_auto_tasks()
+    # المهام التلقائية تُولد في الخلفية (auto_tasks) - هذه الصفحة للقراءة فقط
     
     # معاملات الفلترة
     status_filter = request.args.get('status', 'all')
@@ -48,24 +66,25 @@ def tasks():
     elif date_filter == 'upcoming':
         query = query.filter(Task.due_date > today + timedelta(days=7))
     
-    # الترتيب
-    tasks_list = query.order_by(
-        Task.priority.desc(),
-        Task.due_date.asc(),
-        Task.created_at.desc()
-    ).all()
+    # الترتيب: الأحدث أولاً بترقيم keyset (?sort=oldest للأقدم)
+    page = keyset_paginate(query, Task)
+    if wants_json():
+        return page_json(page, _task_row)
     
-    # الإحصائيات
-    stats = {
-        'total': Task.query.count(),
-        'pending': Task.query.filter_by(status='pending').count(),
-        'in_progress': Task.query.filter_by(status='in_progress').count(),
-        'completed': Task.query.filter_by(status='completed').count(),
-        'urgent': Task.query.filter(Task.priority.in_(['high', 'critical']), Task.status.in_(['pending', 'in_progress'])).count()
-    }
+    # الإحصائيات في استعلام تجميع واحد
+    stats = {'total': 0, 'pending': 0, 'in_progress': 0, 'completed': 0, 'waiting_approval': 0, 'urgent': 0}
+    urgent = case((Task.priority.in_(['high', 'critical']), 1), else_=0)
+    for status, count, urgent_count in db.session.query(
+        Task.status, func.count(Task.id), func.coalesce(func.sum(urgent), 0)
+    ).group_by(Task.status).all():
+        stats['total'] += count
+        stats[status] = stats.get(status, 0) + count
+        if status in ('pending', 'in_progress'):
+            stats['urgent'] += urgent_count
     
     return render_template("tasks.html", 
-                         tasks=tasks_list,
+                         tasks=page.items,
+                         page=page,
                          status_filter=status_filter,
                          priority_filter=priority_filter,
                          task_type_filter=task_type_filter,
@@ -121,9 +140,6 @@ def api_urgent_tasks():
         return jsonify({"error": "غير مصرح"})
     
     try:
-        # توليد المهام التلقائية أولاً
-        generate_auto_tasks()
-        
         urgent_tasks = get_urgent_tasks(5)
         
         tasks_data = []
@@ -1,12 +1,63 @@
 from flask import Blueprint, render_template, request, session, redirect, url_for, jsonify
 from models import Transport, TransportCategory, TransportSubType, TransportReceipt, Order, Debt, db
-from sqlalchemy.orm import joinedload
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload, selectinload, undefer
+from pagination import keyset_paginate, wants_json, page_json
+from summaries import transport_summary
+from lookups import get_lookup
+from blob_store import store_upload
+from delivery import send_content
+from derivatives import enqueue_derivatives, send_thumbnail
+from compression import compress_upload
+from audit import log_activity
 from datetime import datetime, timezone
-from io import BytesIO
-from PIL import Image
 
 transport_bp = Blueprint('transport', __name__)
 
+def transport_filters(args):
+    """شروط فلتر صفحة النقل - مشتركة بين جلب الصفوف والملخص"""
+    transport_type = args.get('type', 'inside')
+    category_id = args.get('category', '')
+    date_from = args.get('date_from', '')
+    date_to = args.get('date_to', '')
+    search = args.get('q', '').strip()
+    
+    filters = []
+    if transport_type in ('inside', 'outside'):
+        filters.append(Transport.type == transport_type)
+    
+    if category_id and category_id != 'all':
+        filters.append(Transport.category_id == int(category_id))
+    
+    if search:
+        pattern = f"%{search}%"
+        filters.append(or_(Transport.name.ilike(pattern), Transport.destination.ilike(pattern),
+                           Transport.purpose.ilike(pattern), Transport.notes.ilike(pattern)))
+    
+    if date_from:
+        filters.append(Transport.transport_date >= datetime.strptime(date_from, "%Y-%m-%d").date())
+    if date_to:
+        filters.append(Transport.transport_date <= datetime.strptime(date_to, "%Y-%m-%d").date())
+    return filters
+
+def _transport_row(transport):
+    """صف نقل لاستجابة JSON (التمرير اللانهائي)"""
+    return {
+        "id": transport.id,
+        "name": transport.name,
+        "type": transport.type,
+        "category": transport.category.name if transport.category else None,
+        "sub_type": transport.sub_type.name if transport.sub_type else None,
+        "destination": transport.destination,
+        "order_id": transport.order_id,
+        "transport_amount": transport.transport_amount,
+        "paid_amount": transport.paid_amount,
+        "remaining_amount": transport.remaining_amount,
+        "transport_date": transport.transport_date.strftime('%Y-%m-%d') if transport.transport_date else None,
+        "created_at": transport.created_at.isoformat() if transport.created_at else None,
+        "receipts_count": len(transport.receipts)
+    }
+
 @transport_bp.route("/transport")
 def transport():
     """صفحة النقل المحسّنة"""
@@ -18,49 +69,60 @@ def transport():
     date_from = request.args.get('date_from', '')
     date_to = request.args.get('date_to', '')
     
-    query = Transport.query.options(
-        joinedload(Transport.category),
-        joinedload(Transport.sub_type),
-        joinedload(Transport.receipts)
-    )
-    
-    if transport_type == 'inside':
-        query = query.filter(Transport.type == 'inside')
-    elif transport_type == 'outside':
-        query = query.filter(Transport.type == 'outside')
+    filters = transport_filters(request.args)
+    query = Transport.query.filter(*filters)
     
-    if category_id and category_id != 'all':
-        query = query.filter(Transport.category_id == int(category_id))
-    
-    if date_from:
-        query = query.filter(Transport.transport_date >= datetime.strptime(date_from, "%Y-%m-%d"))
-    if date_to:
-        query = query.filter(Transport.transport_date <= datetime.strptime(date_to, "%Y-%m-%d"))
+    # بطاقات الملخص من استعلام تجميع واحد بنفس الفلتر، منفصل عن جلب صفوف الصفحة
+    summary = transport_summary(filters)
+    total_count = summary['count']
     
-    transports = query.order_by(Transport.created_at.desc()).all()
-    categories = TransportCategory.query.all()
-    sub_types = TransportSubType.query.all()
+    page = keyset_paginate(query.options(
+        joinedload(Transport.category),
+        joinedload(Transport.sub_type),
+        selectinload(Transport.receipts)
+    ), Transport)
+    if wants_json():
+        return page_json(page, _transport_row, total_count=total_count)
     
-    orders = Order.query.options(joinedload(Order.phones)).order_by(Order.created_at.desc()).all()
-
-    total_amount = sum(transport.transport_amount for transport in transports)
-    paid_amount = sum(transport.paid_amount for transport in transports)
-    remaining_amount = sum(transport.remaining_amount for transport in transports)
+    # القوائم المنسدلة من الذاكرة المشتركة، ومنتقي الطلبية يبحث عبر /api/lookup/orders
+    categories = get_lookup('transport_categories')
+    sub_types = get_lookup('transport_sub_types')
+    recent_orders = get_lookup('recent_orders')
     
     return render_template("transport.html", 
-                         transports=transports, 
+                         transports=page.items, 
+                         page=page,
+                         total_count=total_count,
                          transport_type=transport_type,
                          categories=categories,
                          sub_types=sub_types,
-                         orders=orders,
+                         recent_orders=recent_orders,
                          category_id=category_id,
                          date_from=date_from,
                          date_to=date_to,
-                         total_amount=total_amount,
-                         paid_amount=paid_amount,
-                         remaining_amount=remaining_amount,
+                         search_query=request.args.get('q', ''),
+                         summary=summary,
+                         total_amount=summary['total_amount'],
+                         paid_amount=summary['paid_amount'],
+                         remaining_amount=summary['remaining_amount'],
                          now=datetime.now(timezone.utc))
 
+@transport_bp.route("/api/transport/summary")
+def api_transport_summary():
+    """ملخص النقل بنفس فلاتر الصفحة مع التوزيع حسب الفئة والشهر"""
+    if "user" not in session:
+        return jsonify({"success": False, "error": "غير مصرح"})
+    
+    try:
+        summary = transport_summary(transport_filters(request.args))
+        names = {category.id: category.name for category in get_lookup('transport_categories')}
+        for bucket in summary['by_category']:
+            bucket['category'] = names.get(bucket['category_id'], 'عام')
+        return jsonify({"success": True, "summary": summary})
+    except Exception as e:
+        print(f"❌ خطأ في ملخص النقل: {e}")
+        return jsonify({"success": False, "error": str(e)})
+
 @transport_bp.route("/transport/add", methods=["POST"])
 def add_transport():
     """إضافة نقل جديد"""
@@ -127,6 +189,9 @@ def add_transport():
         
         print(f"✅ تم إنشاء النقل #{transport.id} مرتبط بالطلبية #{order_id}")
         
+        # سجل الطلبية المرتبطة - يُثبّت مع نفس الـ commit
+        log_activity(session["user"], transport, "إضافة نقل", transport.purpose or transport.destination, transport_amount)
+        
         # إذا كان النقل غير مدفوع أو مدفوع جزئياً، إنشاء دين تلقائياً
         if payment_status in ['unpaid', 'partial']:
             remaining_amount = transport_amount - paid_amount
@@ -153,7 +218,8 @@ def add_transport():
             if file and file.filename != '':
                 file_data = file.read()
                 if file_data:
-                    compressed_data = compress_image(file_data)
+                    compressed = compress_upload(file_data, file.mimetype, file.filename, mode='receipt')
+                    compressed_data = compressed['data']
                     
                     timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
                     file_extension = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else 'jpg'
@@ -164,11 +230,13 @@ def add_transport():
                         filename=filename,
                         original_filename=file.filename,
                         file_size=len(compressed_data),
-                        mime_type=file.mimetype,
-                        image_data=compressed_data,
+                        mime_type=compressed['mime_type'],
+                        content_hash=store_upload(compressed_data),
                         captured_by=session["user"]
                     )
                     db.session.add(receipt)
+                    db.session.flush()
+                    enqueue_derivatives('transport_receipt', receipt.id)
         
         db.session.commit()
         print(f"✅ تم إضافة النقل #{transport.id} بحالة دفع: {payment_status}")
@@ -198,18 +266,33 @@ def delete_transport(id):
         db.session.rollback()
         return redirect(url_for("transport.transport"))
 
-def compress_image(image_data, max_size=(1200, 1200), quality=85):
-    """ضغط الصورة للحفاظ على المساحة"""
+@transport_bp.route("/transport/receipts/<int:receipt_id>")
+def view_transport_receipt(receipt_id):
+    """عرض صورة فاتورة النقل"""
+    if "user" not in session:
+        return jsonify({"error": "غير مصرح"})
+    
     try:
-        image = Image.open(BytesIO(image_data))
-        
-        # تغيير الحجم إذا كان كبيراً
-        image.thumbnail(max_size, Image.Resampling.LANCZOS)
-        
-        # حفظ بصيغة مضغوطة
-        output = BytesIO()
-        image.save(output, format='JPEG', quality=quality, optimize=True)
-        return output.getvalue()
+        receipt = TransportReceipt.query.options(undefer(TransportReceipt.image_data)).get_or_404(receipt_id)
+        return send_content(
+            receipt.content_hash,
+            legacy_data=None if receipt.content_hash else receipt.image_data,
+            mimetype=receipt.mime_type or 'image/jpeg',
+            filename=receipt.filename,
+            last_modified=receipt.captured_at
+        )
     except Exception as e:
-        print(f"خطأ في ضغط الصورة: {e}")
-        return image_data
\ No newline at end of file
+        return jsonify({"success": False, "error": str(e)})
+
+@transport_bp.route("/transport/receipts/<int:receipt_id>/thumbnail")
+def view_transport_receipt_thumbnail(receipt_id):
+    """الصورة المصغرة لفاتورة النقل (?size=preview لنسخة المعاينة)"""
+    if "user" not in session:
+        return jsonify({"error": "غير مصرح"})
+    
+    try:
+        receipt = TransportReceipt.query.get_or_404(receipt_id)
+        rendition = 'preview' if request.args.get('size') == 'preview' else 'thumb'
+        return send_thumbnail('transport_receipt', receipt.id, rendition, 'image')
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
@@ -1,33 +1,79 @@
 from flask import Blueprint, render_template, request, session, redirect, url_for, jsonify
 from models import Worker, WorkerHistory, WorkerMonthlyRecord, WorkerEvaluation, OrderAssignment, Task, db
 from models import create_monthly_record, evaluate_worker_performance, get_monthly_workers_cost, get_worker_monthly_history
+from routes.helpers import is_admin_user, total_debts
+from sqlalchemy import func, case
+from pagination import keyset_paginate, wants_json, page_json
+from payroll import payroll_totals
 from datetime import datetime, timezone
 import random
 import string
 
 workers_bp = Blueprint('workers', __name__)
 
+def _worker_row(worker):
+    """صف عامل لاستجابة JSON (التمرير اللانهائي)"""
+    return {
+        "id": worker.id,
+        "name": worker.name,
+        "phone": worker.phone,
+        "address": worker.address,
+        "monthly_salary": worker.monthly_salary,
+        "absences": worker.absences,
+        "outside_work_days": worker.outside_work_days,
+        "advances": worker.advances,
+        "total_salary": worker.total_salary,
+        "is_active": worker.is_active,
+        "start_date": worker.start_date.strftime('%Y-%m-%d') if worker.start_date else None,
+        "created_at": worker.created_at.isoformat() if worker.created_at else None
+    }
+
 @workers_bp.route("/workers")
 def workers():
     """صفحة إدارة العمال"""
     if "user" not in session:
         return redirect(url_for("auth.login"))
     
-    workers_list = Worker.query.order_by(Worker.created_at.desc()).all()
+    status_filter = request.args.get('status', 'all')
+    query = Worker.query
+    if status_filter == 'active':
+        query = query.filter(Worker.is_active == True)
+    elif status_filter == 'frozen':
+        query = query.filter(Worker.is_active == False)
+    
+    # بطاقات الإحصائيات على كل العمال في استعلام تجميع واحد
+    total_count, active_count, total_absences, total_outside_days, total_advances = db.session.query(
+        func.count(Worker.id),
+        func.coalesce(func.sum(case((Worker.is_active == True, 1), else_=0)), 0),
+        func.coalesce(func.sum(Worker.absences), 0),
+        func.coalesce(func.sum(Worker.outside_work_days), 0),
+        func.coalesce(func.sum(Worker.advances), 0)
+    ).one()
+    
+    # مجموع الرواتب المستحقة كتعبير SQL (تجميع واحد دون تحميل العمال)
+    total_salaries = payroll_totals()['total_salary']
     
-    total_salaries = sum(worker.total_salary for worker in workers_list)
-    total_advances = sum(worker.advances for worker in workers_list)
+    page = keyset_paginate(query, Worker)
+    if wants_json():
+        return page_json(page, _worker_row, total_count=total_count)
     
-    active_workers = [worker for worker in workers_list if worker.is_active]
-    frozen_workers = [worker for worker in workers_list if not worker.is_active]
+    # قائمة التقييم السريع تحتاج الاسم والمعرف فقط
+    active_workers = Worker.query.with_entities(Worker.id, Worker.name)\
+        .filter(Worker.is_active == True).order_by(Worker.name).all()
     
     return render_template(
         "workers.html", 
-        workers=workers_list, 
+        workers=page.items, 
+        page=page,
+        total_count=total_count,
+        active_count=active_count,
+        frozen_count=total_count - active_count,
+        total_absences=total_absences,
+        total_outside_days=total_outside_days,
+        status_filter=status_filter,
         total_salaries=total_salaries,
         total_advances=total_advances,
         active_workers=active_workers,
-        frozen_workers=frozen_workers,
         now=datetime.now(timezone.utc)
     )
 
@@ -0,0 +1,88 @@
+# ====== startup_profile.py ======
+# قياس زمن بدء التشغيل: تشغيل python -X importtime في عملية جديدة وتلخيص النتيجة
+# (نفس ما يدفعه كل عامل gunicorn عند الإقلاع)
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _local_modules():
+    """أسماء وحدات التطبيق نفسه (ملفات .py والحزم في مجلد app)"""
+    names = set()
+    for entry in os.listdir(APP_DIR):
+        path = os.path.join(APP_DIR, entry)
+        if entry.endswith('.py'):
+            names.add(entry[:-3])
+        elif os.path.isdir(path) and os.path.exists(os.path.join(path, '__init__.py')):
+            names.add(entry)
+    return names
+
+
+def _run_importtime(module):
+    env = dict(os.environ, PYTHONPATH=APP_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=APP_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'import failed')
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        entries.append({
+            'module': name.strip(),
+            'depth': (len(name) - len(name.lstrip()) - 1) // 2,
+            'self_ms': int(self_us) / 1000,
+            'cumulative_ms': int(cumulative_us) / 1000,
+        })
+    return entries
+
+
+def _subtree(entries, module):
+    """وحدات شجرة استيراد module فقط (دون وحدات إقلاع المفسر)
+
+    importtime يطبع كل وحدة بعد أبنائها، فالشجرة هي الأسطر بين السطر الجذري السابق وسطر الوحدة.
+    """
+    for index, entry in enumerate(entries):
+        if entry['module'] == module and entry['depth'] == 0:
+            start = index
+            while start > 0 and entries[start - 1]['depth'] > 0:
+                start -= 1
+            return entry['cumulative_ms'], entries[start:index + 1]
+    return 0, []
+
+
+def import_time_report(module='app', runs=3, limit=20):
+    """تقرير زمن الاستيراد: المكتبات الخارجية حسب الحزمة، ووحدات التطبيق حسب زمنها الذاتي
+
+    تُؤخذ أسرع محاولة من runs لتقليل أثر الذاكرة المؤقتة للقرص وملفات pyc.
+    """
+    best = None
+    for _ in range(max(1, runs)):
+        total, entries = _subtree(_run_importtime(module), module)
+        if best is None or total < best[0]:
+            best = (total, entries)
+    total, entries = best
+
+    local = _local_modules()
+    own = [entry for entry in entries if entry['module'].split('.')[0] in local]
+    # لكل حزمة خارجية: أول نقطة استيراد لها هي الأكبر تراكمياً
+    packages = {}
+    for entry in entries:
+        package = entry['module'].split('.')[0]
+        if package in local:
+            continue
+        if package not in packages or entry['cumulative_ms'] > packages[package]['cumulative_ms']:
+            packages[package] = dict(entry, module=package)
+    return {
+        'module': module,
+        'total_ms': total,
+        'own_ms': round(sum(entry['self_ms'] for entry in own), 1),
+        'own_modules': sorted(own, key=lambda entry: entry['self_ms'], reverse=True)[:limit],
+        'dependencies': sorted(packages.values(), key=lambda entry: entry['cumulative_ms'], reverse=True)[:limit],
+    }
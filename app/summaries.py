@@ -0,0 +1,107 @@
+# ====== summaries.py ======
+# ملخصات صفحات المصاريف والنقل: استعلام تجميع واحد يشارك شرط فلتر الصفحة
+# ويعيد الإجماليات مع التوزيع حسب الفئة وحسب الشهر من نفس النتيجة
+from sqlalchemy import select, func, case
+from models import db, Expense, Transport
+
+
+def month_key(column):
+    """مفتاح الشهر YYYY-MM لعمود تاريخ حسب نوع قاعدة البيانات"""
+    if db.engine.dialect.name == 'postgresql':
+        return func.to_char(column, 'YYYY-MM')
+    return func.strftime('%Y-%m', column)
+
+
+def _empty(measures):
+    return {'count': 0, **{name: 0.0 for name in measures}}
+
+
+def _add(target, count, values, measures):
+    target['count'] += count
+    for name, value in zip(measures, values):
+        target[name] += value or 0
+
+
+def _rounded(row):
+    return {name: round(value, 2) if isinstance(value, float) else value for name, value in row.items()}
+
+
+def summarize(model, filters, measures, category_column=None, date_column=None, breakdown=True):
+    """إجماليات measures (اسم -> تعبير SQL يُجمع) للصفوف المطابقة لـ filters
+
+    مع breakdown يُجمع الاستعلام حسب (الفئة، الشهر) - عدد صفوف النتيجة بعدد الفئات × الأشهر
+    وليس بعدد السجلات - ثم تُشتق منه الإجماليات وتوزيع الفئات والأشهر.
+    """
+    groups = []
+    if breakdown and category_column is not None:
+        groups.append(category_column.label('category_id'))
+    if breakdown and date_column is not None:
+        groups.append(month_key(date_column).label('month'))
+
+    statement = select(
+        *groups,
+        func.count(model.id),
+        *(func.coalesce(func.sum(expression), 0) for expression in measures.values())
+    ).where(*filters)
+    if groups:
+        statement = statement.group_by(*groups)
+
+    summary = _empty(measures)
+    by_category = {}
+    by_month = {}
+    for row in db.session.execute(statement):
+        mapping = row._mapping
+        values = list(row)[len(groups):]
+        count, values = values[0], values[1:]
+        _add(summary, count, values, measures)
+        if 'category_id' in mapping:
+            bucket = by_category.setdefault(mapping['category_id'], {'category_id': mapping['category_id'], **_empty(measures)})
+            _add(bucket, count, values, measures)
+        if 'month' in mapping:
+            bucket = by_month.setdefault(mapping['month'], {'month': mapping['month'], **_empty(measures)})
+            _add(bucket, count, values, measures)
+
+    summary = _rounded(summary)
+    if breakdown:
+        summary['by_category'] = sorted(
+            (_rounded(bucket) for bucket in by_category.values()),
+            key=lambda bucket: bucket[next(iter(measures))], reverse=True
+        )
+        summary['by_month'] = sorted(
+            (_rounded(bucket) for bucket in by_month.values() if bucket['month']),
+            key=lambda bucket: bucket['month']
+        )
+    return summary
+
+
+# ========================
+# ملخص المصاريف
+# ========================
+EXPENSE_MEASURES = {
+    'total_amount': Expense.total_amount,
+    'paid_amount': case((Expense.payment_status == 'paid', Expense.total_amount), else_=0),
+    'unpaid_amount': case((Expense.payment_status == 'unpaid', Expense.total_amount), else_=0),
+    'remaining_amount': func.coalesce(Expense.total_amount, 0) - func.coalesce(Expense.paid_amount, 0),
+}
+
+
+def expense_summary(filters, breakdown=True):
+    return summarize(Expense, filters, EXPENSE_MEASURES,
+                     category_column=Expense.category_id, date_column=Expense.purchase_date,
+                     breakdown=breakdown)
+
+
+# ========================
+# ملخص النقل
+# ========================
+TRANSPORT_MEASURES = {
+    'total_amount': Transport.transport_amount,
+    'paid_amount': Transport.paid_amount,
+    'remaining_amount': func.coalesce(Transport.transport_amount, 0) - func.coalesce(Transport.paid_amount, 0),
+}
+
+
+def transport_summary(filters, breakdown=True):
+    return summarize(Transport, filters, TRANSPORT_MEASURES,
+                     category_column=Transport.category_id, date_column=Transport.transport_date,
+                     breakdown=breakdown)
@@ -1,11 +1,15 @@
-# أنشئ ملفاً اسمه update_db.py وأضف:
+# update_db.py - ترقية مخطط قاعدة البيانات إلى آخر إصدار
+# (مكافئ لـ flask db-upgrade)
 from app import app
-from models import db, OrderAttachment
+from models import db
+from migrations import upgrade
 
 with app.app_context():
     try:
-        # هذا سيحاول تحديث الجدول
-        db.create_all()
-        print("✅ تم تحديث قاعدة البيانات بنجاح")
+        applied = upgrade(db.engine)
+        if applied:
+            print(f"✅ تم تطبيق الترحيلات: {applied}")
+        else:
+            print("✅ قاعدة البيانات محدثة")
     except Exception as e:
-        print(f"❌ خطأ في تحديث قاعدة البيانات: {e}")
\ No newline at end of file
+        print(f"❌ خطأ في تحديث قاعدة البيانات: {e}")